@@ -0,0 +1,157 @@
+"""
+Simulation backends for TrafficSimulator
+
+A backend is any object with the subset of the traci module API that
+TrafficSimulator uses:
+
+    start(cmd, label=...), close(), simulationStep()
+    lane.getLastStepVehicleNumber(laneID), lane.getWaitingTime(laneID)
+    trafficlight.getPhase(tlsID), trafficlight.getNextSwitch(tlsID),
+    trafficlight.setPhaseDuration(tlsID, phaseDuration)
+    simulation.getTime(), simulation.getMinExpectedNumber()
+
+plus constants, lane.subscribe, trafficlight.subscribe, simulation.subscribe
+and the matching subscription result getters for SubscriptionCollector
+
+"libsumo" has the same API as traci but runs SUMO inside the Python
+process, so every call is a function call instead of a socket round trip.
+It runs one simulation per process and has no GUI
+"""
+import os
+import sys
+import hashlib
+import subprocess
+
+# Backends selectable by name
+BACKENDS = ["traci", "libsumo", "mock"]
+
+# Simulator versions already looked up, by backend
+_versions = {}
+
+
+def add_sumo_tools():
+    """
+    Adds the SUMO tools directory to the import path so traci and sumolib can be imported
+
+    Returns
+    -------
+    bool
+        True if SUMO_HOME is declared
+    """
+    if 'SUMO_HOME' not in os.environ:
+        return False
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    if tools not in sys.path:
+        sys.path.append(tools)
+    return True
+
+
+def load_backend(name):
+    """
+    Loads a simulation backend
+
+    Parameters
+    ----------
+    name
+        "traci" for SUMO, "libsumo" for SUMO inside this process or "mock"
+        for the queue model stand-in
+
+    Returns
+    -------
+    module or object
+        The backend
+    """
+    if name == "mock":
+        from mock_traci import QueueModelTraci
+        return QueueModelTraci()
+
+    if not add_sumo_tools():
+        sys.exit("Please declare environment variable 'SUMO_HOME'")
+
+    if name == "libsumo":
+        import libsumo
+        return libsumo
+
+    import traci
+    return traci
+
+
+def resolve_backend(name, gui):
+    """
+    Picks the backend to run a simulation on
+
+    libsumo has no GUI, so runs with the GUI fall back to traci
+
+    Parameters
+    ----------
+    name
+        The requested backend name
+    gui
+        Set to run with gui or no, see TrafficSimulator, the GUI shows when it is not set
+
+    Returns
+    -------
+    str
+        The backend name to load
+    """
+    if name == "libsumo" and not gui:
+        sys.stderr.write("libsumo has no GUI, running on traci\n")
+        return "traci"
+    return name
+
+
+def sumo_binary(name, gui):
+    """
+    Finds the SUMO binary to start for a backend
+
+    Parameters
+    ----------
+    name
+        The backend name
+    gui
+        Set to run with gui or no, see TrafficSimulator
+
+    Returns
+    -------
+    str
+        The binary
+    """
+    if name == "mock":
+        return "sumo"
+
+    from sumolib import checkBinary
+    if gui:
+        return checkBinary('sumo')
+    else:
+        return checkBinary('sumo-gui')
+
+
+def sumo_version(name):
+    """
+    Gets the version of the simulator a backend runs
+
+    Parameters
+    ----------
+    name
+        The backend name
+
+    Returns
+    -------
+    str
+        The first line of sumo --version, the libsumo version, or a hash of
+        the queue model source for the mock
+    """
+    if name in _versions:
+        return _versions[name]
+
+    if name == "mock":
+        import mock_traci
+        with open(mock_traci.__file__, 'rb') as sourceFile:
+            _versions[name] = "mock " + hashlib.sha256(sourceFile.read()).hexdigest()
+    elif name == "libsumo":
+        _versions[name] = "libsumo " + load_backend(name).__version__
+    else:
+        load_backend(name)
+        result = subprocess.run([sumo_binary(name, True), "--version"], capture_output=True, text=True, check=True)
+        _versions[name] = result.stdout.splitlines()[0]
+    return _versions[name]
@@ -0,0 +1,211 @@
+import os
+import sys
+import time
+import optparse
+import subprocess
+
+from main import init, TrafficSimulator, output_dir, N, STEPS
+
+# Creating Options
+optParser = optparse.OptionParser()
+optParser.add_option("--cars", type="int", default=N, help="number of cars to simulate")
+optParser.add_option("--steps", type="int", default=STEPS, help="virtual time to simulate")
+optParser.add_option("--controller", default="Fuzzy", help="traffic light type, Fixed or Fuzzy")
+optParser.add_option("--compare", default="collectors",
+                     help="what to measure, collectors, backends or imports")
+optParser.add_option("--backends", default="traci,libsumo",
+                     help="comma separated backends to compare the steps per second of")
+optParser.add_option("--budget", type="float", default=None,
+                     help="milliseconds importing main may take with --compare imports, default IMPORT_BUDGET")
+
+# Milliseconds importing main may take in a fresh interpreter
+IMPORT_BUDGET = 300
+# Packages importing main must not load, only plotting, the skfuzzy controller and SUMO need them
+LAZY_PACKAGES = ["matplotlib", "skfuzzy", "scipy", "networkx", "traci", "sumolib", "libsumo", "pyarrow"]
+# Route file of the benchmark runs, kept apart from the tracked traffic.rou.xml
+ROUTE_FILE = os.path.join(output_dir, "benchmark.rou.xml")
+
+
+class TraciCallCounter:
+    """
+    Counts the TraCI round trips to SUMO
+
+    Every command, including subscriptions and simulation steps, is sent
+    through Connection._sendExact, so wrapping it counts the socket round trips
+    """
+    def __init__(self):
+        from traci.connection import Connection
+        self.calls = 0
+        self._connection = Connection
+        self._sendExact = Connection._sendExact
+
+    def __enter__(self):
+        Connection = self._connection
+        counter = self
+        original = self._sendExact
+
+        def counting_send_exact(connection, *args, **kwargs):
+            counter.calls += 1
+            return original(connection, *args, **kwargs)
+
+        Connection._sendExact = counting_send_exact
+        return self
+
+    def __exit__(self, *exc):
+        self._connection._sendExact = self._sendExact
+
+
+def benchmark_collector(collector, numberOfCars, steps, trafficLightType):
+    """
+    Runs one simulation and measures the TraCI calls and wall time
+
+    Parameters
+    ----------
+    collector
+        The collector to use, "polling" or "subscription"
+    numberOfCars
+        Number of cars to simulate
+    steps
+        The amount of virtual time to simulate
+    trafficLightType
+        The type of traffic light, "Fixed" or "Fuzzy"
+
+    Returns
+    -------
+    dict
+        TraCI calls per step and wall time per simulated hour
+    """
+    traffic = TrafficSimulator(numberOfCars, steps, True, compiledFuzzy=True, collector=collector,
+                               routeFile=ROUTE_FILE)
+    traffic.generate_routefile(ROUTE_FILE)
+
+    with TraciCallCounter() as counter:
+        start = time.perf_counter()
+        if trafficLightType == "Fixed":
+            traffic.run_fixed()
+        else:
+            traffic.run_fuzzy()
+        wallTime = time.perf_counter() - start
+    traffic.close()
+
+    return {
+        "collector": collector,
+        "steps": traffic.lastRunSteps,
+        "calls per step": counter.calls / traffic.lastRunSteps,
+        "wall time per simulated hour": wallTime * 3600 / traffic.lastRunSteps,
+    }
+
+
+def benchmark_backend(backend, numberOfCars, steps, trafficLightType):
+    """
+    Runs one simulation on a backend and measures the steps per second
+
+    Parameters
+    ----------
+    backend
+        The simulation backend, "traci", "libsumo" or "mock"
+    numberOfCars
+        Number of cars to simulate
+    steps
+        The amount of virtual time to simulate
+    trafficLightType
+        The type of traffic light, "Fixed" or "Fuzzy"
+
+    Returns
+    -------
+    dict
+        Startup time, simulation time and steps per second, startup left out
+    """
+    traffic = TrafficSimulator(numberOfCars, steps, True, compiledFuzzy=True, backend=backend, routeFile=ROUTE_FILE)
+    traffic.generate_routefile(ROUTE_FILE)
+
+    if trafficLightType == "Fixed":
+        traffic.run_fixed()
+    else:
+        traffic.run_fuzzy()
+    traffic.close()
+
+    return {
+        "backend": backend,
+        "steps": traffic.lastRunSteps,
+        "startup time": traffic.session.lastStartupTime,
+        "simulation time": traffic.session.lastSimulationTime,
+        "steps per second": traffic.lastRunSteps / traffic.session.lastSimulationTime,
+    }
+
+
+def import_time(module = "main", repeats = 5):
+    """
+    Measures importing a module in a fresh interpreter with python -X importtime
+
+    Parameters
+    ----------
+    module
+        The module to import
+        Default is "main"
+    repeats
+        Number of interpreters to import it in, the fastest is kept
+        Default is 5
+
+    Returns
+    -------
+    dict
+        Milliseconds to import it, the slowest modules it imported as
+        (module, milliseconds) and the LAZY_PACKAGES it loaded
+    """
+    best = None
+    for _ in range(repeats):
+        # Importing from this directory, so it measures these modules wherever it is run from
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+
+        # Lines are "import time: self [us] | cumulative [us] | module", nested modules are indented
+        cumulative = {}
+        for line in result.stderr.splitlines():
+            fields = line[len("import time:"):].split("|")
+            if line.startswith("import time:") and len(fields) == 3 and fields[1].strip().isdigit():
+                cumulative[fields[2].strip()] = int(fields[1]) / 1000
+        if best is None or cumulative[module] < best[module]:
+            best = cumulative
+
+    return {
+        "time": best[module],
+        "slowest": sorted([(name, time) for name, time in best.items() if name != module],
+                          key=lambda item: item[1], reverse=True)[:10],
+        "lazy": sorted({name.split(".")[0] for name in best} & set(LAZY_PACKAGES)),
+    }
+
+
+if __name__ == "__main__":
+    options, args = optParser.parse_args()
+
+    if options.compare == "imports":
+        budget = options.budget if options.budget is not None else IMPORT_BUDGET
+        result = import_time()
+
+        print(f"import main {result['time']:.1f} ms, budget {budget:.0f} ms")
+        for name, moduleTime in result["slowest"]:
+            print(f"{name:<40}{moduleTime:>10.1f} ms")
+        if result["lazy"]:
+            sys.exit(f"import main loaded {', '.join(result['lazy'])}, they should be imported where they are used")
+        if result["time"] > budget:
+            sys.exit(f"import main took {result['time']:.1f} ms, over the budget of {budget:.0f} ms")
+    elif options.compare == "backends":
+        init()
+        results = [benchmark_backend(backend, options.cars, options.steps, options.controller)
+                   for backend in options.backends.split(",")]
+
+        print(f"{'backend':<10}{'steps':>8}{'startup s':>12}{'simulation s':>14}{'steps/s':>10}")
+        for result in results:
+            print(f"{result['backend']:<10}{result['steps']:>8}{result['startup time']:>12.3f}"
+                  f"{result['simulation time']:>14.3f}{result['steps per second']:>10.0f}")
+    else:
+        init()
+        results = [benchmark_collector(collector, options.cars, options.steps, options.controller)
+                   for collector in ["polling", "subscription"]]
+
+        print(f"{'collector':<14}{'steps':>8}{'calls/step':>14}{'s/sim hour':>14}")
+        for result in results:
+            print(f"{result['collector']:<14}{result['steps']:>8}"
+                  f"{result['calls per step']:>14.2f}{result['wall time per simulated hour']:>14.3f}")
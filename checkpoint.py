@@ -0,0 +1,191 @@
+import os
+import re
+import glob
+import gzip
+import pickle
+
+# Checkpoints kept per traffic light type, older ones are removed
+KEEP = 2
+
+# Empty state attribute of a tlLogic element in a SUMO state file
+EMPTY_SIGNAL_STATE = re.compile(rb'(<tlLogic\b[^>]*?) state=""')
+
+
+def _drop_empty_signal_states(stateFile):
+    # SUMO writes an empty state for traffic lights running their network
+    # program and then refuses to load it, the attribute is optional
+    with gzip.open(stateFile, 'rb') as xmlFile:
+        content = xmlFile.read()
+    if not content.startswith(b"<?xml"):
+        return
+    content, count = EMPTY_SIGNAL_STATE.subn(rb"\1", content)
+    if count == 0:
+        return
+    with gzip.open(stateFile + ".tmp", 'wb') as xmlFile:
+        xmlFile.write(content)
+    os.replace(stateFile + ".tmp", stateFile)
+
+
+class Checkpointer:
+    """
+    Saves and restores the progress of simulation runs
+
+    A checkpoint is the SUMO state written with traci.simulation.saveState
+    next to a pickle of the step, the wait time series and the controller
+    state of the run. Both are written to temporary names and renamed, so a
+    crash while saving leaves the previous checkpoint intact
+
+    Parameters
+    ----------
+    directory
+        Directory to write the checkpoints to
+    interval
+        Steps between checkpoints
+        Default is None, only the final checkpoint of a run is written
+    keep
+        Checkpoints kept per traffic light type
+        Default is KEEP
+    """
+    def __init__(self, directory, interval = None, keep = KEEP):
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+
+    def due(self, step):
+        """
+        Checks if a checkpoint is due after a step
+
+        Parameters
+        ----------
+        step
+            Number of steps simulated
+
+        Returns
+        -------
+        bool
+            True if a checkpoint should be saved
+        """
+        return self.interval is not None and step % self.interval == 0
+
+    def _files(self, trafficLightType, step):
+        name = os.path.join(self.directory, f"{trafficLightType}-{step:08d}")
+        return name + ".pkl", name + ".state.xml.gz"
+
+    def save(self, traci, trafficLightType, step, state, finished = False):
+        """
+        Saves a checkpoint of a running simulation
+
+        Parameters
+        ----------
+        traci
+            The backend of the running simulation
+        trafficLightType
+            The type of traffic light of the run
+        step
+            Number of steps simulated
+        state
+            The state of the run to pickle, such as its series and scheduler
+        finished
+            Set if the run is done, resuming it then only restores its state
+            Default is False
+
+        Returns
+        -------
+        str
+            The checkpoint file
+        """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        checkpointFile, stateFile = self._files(trafficLightType, step)
+
+        # Writing the SUMO state first, a checkpoint only exists once its pickle does
+        # SUMO picks the format from the extension, so the temporary name keeps it
+        temporaryStateFile = stateFile[:-len(".xml.gz")] + ".tmp.xml.gz"
+        traci.simulation.saveState(temporaryStateFile)
+        _drop_empty_signal_states(temporaryStateFile)
+        os.replace(temporaryStateFile, stateFile)
+        with open(checkpointFile + ".tmp", 'wb') as pickleFile:
+            pickle.dump({"step": step, "finished": finished, "stateFile": os.path.basename(stateFile),
+                         "state": state}, pickleFile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(checkpointFile + ".tmp", checkpointFile)
+
+        # Removing the oldest checkpoints
+        for oldFile in self.checkpoints(trafficLightType)[:-self.keep]:
+            os.remove(oldFile)
+            oldStateFile = oldFile[:-len(".pkl")] + ".state.xml.gz"
+            if os.path.exists(oldStateFile):
+                os.remove(oldStateFile)
+        return checkpointFile
+
+    def checkpoints(self, trafficLightType):
+        """
+        Finds the checkpoints of a traffic light type
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light
+
+        Returns
+        -------
+        list
+            The checkpoint files, oldest first
+        """
+        return sorted(glob.glob(os.path.join(self.directory, f"{trafficLightType}-*.pkl")))
+
+    def latest(self, trafficLightType):
+        """
+        Finds the newest checkpoint of a traffic light type
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light
+
+        Returns
+        -------
+        str
+            The checkpoint file, None if there is none
+        """
+        checkpoints = self.checkpoints(trafficLightType)
+        return checkpoints[-1] if checkpoints else None
+
+    def clear(self, trafficLightType):
+        """
+        Removes the checkpoints of a traffic light type, before a run starts over
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light
+
+        Returns
+        -------
+        None
+        """
+        for checkpointFile in self.checkpoints(trafficLightType):
+            os.remove(checkpointFile)
+            stateFile = checkpointFile[:-len(".pkl")] + ".state.xml.gz"
+            if os.path.exists(stateFile):
+                os.remove(stateFile)
+
+
+def load_checkpoint(checkpointFile):
+    """
+    Reads a checkpoint
+
+    Parameters
+    ----------
+    checkpointFile
+        The checkpoint file, from Checkpointer.save
+
+    Returns
+    -------
+    dict
+        The "step", "finished" and "state" of the run and the "stateFile"
+        to start SUMO from with --load-state
+    """
+    with open(checkpointFile, 'rb') as pickleFile:
+        checkpoint = pickle.load(pickleFile)
+    checkpoint["stateFile"] = os.path.join(os.path.dirname(checkpointFile), checkpoint["stateFile"])
+    return checkpoint
@@ -0,0 +1,199 @@
+import numpy as np
+
+
+class PollingCollector:
+    """
+    Reads simulation values with one TraCI call per value
+
+    Parameters
+    ----------
+    traci
+        The TraCI module or connection to read from
+    lanes
+        The lane ids to monitor
+    trafficLights
+        The traffic light ids to monitor
+    """
+    def __init__(self, traci, lanes, trafficLights):
+        self._traci = traci
+        self.lanes = list(lanes)
+        self.trafficLights = list(trafficLights)
+
+    def start(self):
+        """
+        Prepares the collector after SUMO has started
+
+        Returns
+        -------
+        None
+        """
+        pass
+
+    def update(self):
+        """
+        Refreshes the values after a simulation step
+
+        Returns
+        -------
+        None
+        """
+        pass
+
+    def vehicle_number(self, lane):
+        return self._traci.lane.getLastStepVehicleNumber(lane)
+
+    def waiting_time(self, lane):
+        return self._traci.lane.getWaitingTime(lane)
+
+    def phase(self, trafficLight):
+        return self._traci.trafficlight.getPhase(trafficLight)
+
+    def next_switch(self, trafficLight):
+        return self._traci.trafficlight.getNextSwitch(trafficLight)
+
+    def time(self):
+        return self._traci.simulation.getTime()
+
+    def min_expected_number(self):
+        return self._traci.simulation.getMinExpectedNumber()
+
+    def vehicle_numbers(self):
+        """
+        Gets the vehicle number of every monitored lane
+
+        Returns
+        -------
+        ndarray
+            One value per lane, in the order of self.lanes
+        """
+        return np.array([self.vehicle_number(lane) for lane in self.lanes], dtype=float)
+
+    def waiting_times(self, indices):
+        """
+        Gets the waiting time of some monitored lanes
+
+        Parameters
+        ----------
+        indices
+            Indices into self.lanes
+
+        Returns
+        -------
+        ndarray
+            One value per index
+        """
+        lanes = self.lanes
+        return np.array([self.waiting_time(lanes[i]) for i in indices], dtype=float)
+
+    def phases(self):
+        """
+        Gets the phase of every monitored traffic light
+
+        Returns
+        -------
+        ndarray
+            One value per traffic light, in the order of self.trafficLights
+        """
+        return np.array([self.phase(trafficLight) for trafficLight in self.trafficLights], dtype=int)
+
+    def next_switches(self, indices):
+        """
+        Gets the next switch time of some monitored traffic lights
+
+        Parameters
+        ----------
+        indices
+            Indices into self.trafficLights
+
+        Returns
+        -------
+        ndarray
+            One value per index
+        """
+        trafficLights = self.trafficLights
+        return np.array([self.next_switch(trafficLights[i]) for i in indices], dtype=float)
+
+
+class SubscriptionCollector(PollingCollector):
+    """
+    Reads simulation values from TraCI subscriptions
+
+    Every monitored value is subscribed to once in start(), after which
+    SUMO sends them all along with each simulation step, so update() and
+    the getters do not make any TraCI calls
+
+    Parameters
+    ----------
+    traci
+        The TraCI module or connection to read from
+    lanes
+        The lane ids to monitor
+    trafficLights
+        The traffic light ids to monitor
+    """
+    def __init__(self, traci, lanes, trafficLights):
+        super().__init__(traci, lanes, trafficLights)
+        tc = traci.constants
+
+        self._laneVariables = (tc.LAST_STEP_VEHICLE_NUMBER, tc.VAR_WAITING_TIME)
+        self._trafficLightVariables = (tc.TL_CURRENT_PHASE, tc.TL_NEXT_SWITCH)
+        self._simulationVariables = (tc.VAR_TIME, tc.VAR_MIN_EXPECTED_VEHICLES)
+
+        self._vehicleNumber, self._waitingTime = self._laneVariables
+        self._phase, self._nextSwitch = self._trafficLightVariables
+        self._time, self._minExpectedNumber = self._simulationVariables
+
+        self._laneResults = {}
+        self._trafficLightResults = {}
+        self._simulationResults = {}
+
+    def start(self):
+        # Subscribing once for the whole run
+        for lane in self.lanes:
+            self._traci.lane.subscribe(lane, self._laneVariables)
+        for trafficLight in self.trafficLights:
+            self._traci.trafficlight.subscribe(trafficLight, self._trafficLightVariables)
+        self._traci.simulation.subscribe(self._simulationVariables)
+        self.update()
+
+    def update(self):
+        self._laneResults = self._traci.lane.getAllSubscriptionResults()
+        self._trafficLightResults = self._traci.trafficlight.getAllSubscriptionResults()
+        self._simulationResults = self._traci.simulation.getSubscriptionResults()
+
+    def vehicle_number(self, lane):
+        return self._laneResults[lane][self._vehicleNumber]
+
+    def waiting_time(self, lane):
+        return self._laneResults[lane][self._waitingTime]
+
+    def phase(self, trafficLight):
+        return self._trafficLightResults[trafficLight][self._phase]
+
+    def next_switch(self, trafficLight):
+        return self._trafficLightResults[trafficLight][self._nextSwitch]
+
+    def time(self):
+        return self._simulationResults[self._time]
+
+    def min_expected_number(self):
+        return self._simulationResults[self._minExpectedNumber]
+
+    def vehicle_numbers(self):
+        results = self._laneResults
+        variable = self._vehicleNumber
+        return np.fromiter((results[lane][variable] for lane in self.lanes), dtype=float, count=len(self.lanes))
+
+    def phases(self):
+        results = self._trafficLightResults
+        variable = self._phase
+        return np.fromiter((results[trafficLight][variable] for trafficLight in self.trafficLights),
+                           dtype=int, count=len(self.trafficLights))
+
+
+
+# Collectors selectable by name
+COLLECTORS = {
+    "polling": PollingCollector,
+    "subscription": SubscriptionCollector,
+}
@@ -0,0 +1,255 @@
+import os
+import csv
+import optparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from main import init, statistics_path, SEED, STEPS, N
+from sweep import Scenario, run_sweep, write_results
+
+# Creating Options
+optParser = optparse.OptionParser()
+optParser.add_option("--controllers", default="Fixed,Fuzzy",
+                     help="comma separated traffic light types, the first two are compared")
+optParser.add_option("--cars", type="int", default=N, help="number of cars to simulate")
+optParser.add_option("--cycle-time", dest="cycleTime", type="int", default=42, help="fixed cycle time")
+optParser.add_option("--steps", type="int", default=STEPS, help="virtual time to simulate")
+optParser.add_option("--initial-seeds", dest="initialSeeds", type="int", default=4,
+                     help="seeds to run before checking the intervals")
+optParser.add_option("--batch-seeds", dest="batchSeeds", type="int", default=None,
+                     help="seeds added per round, default is the number of workers")
+optParser.add_option("--max-seeds", dest="maxSeeds", type="int", default=32, help="seeds to stop at")
+optParser.add_option("--tolerance", type="float", default=1.0,
+                     help="confidence interval half width in seconds to stop at")
+optParser.add_option("--confidence", type="float", default=0.95, help="confidence level of the intervals")
+optParser.add_option("--resamples", type="int", default=2000, help="bootstrap resamples")
+optParser.add_option("--backend", default="traci", help="simulation backend, traci, libsumo or mock")
+optParser.add_option("--workers", type="int", default=None,
+                     help="number of worker processes, default is the number of CPUs")
+optParser.add_option("--output", default=os.path.join(statistics_path, "evaluation"),
+                     help="file name prefix for the per seed and summary csv files")
+
+# Percentiles of the lane wait times that are aggregated over seeds
+PERCENTILES = ["50th percentile", "90th percentile", "99th percentile"]
+
+
+def metric_names(row):
+    """
+    Finds the per lane percentile columns of a result row
+
+    Parameters
+    ----------
+    row
+        A row from sweep.run_scenario
+
+    Returns
+    -------
+    list
+        The column names, such as "Lane 1 90th percentile"
+    """
+    return [name for name in row if any(name.endswith(f" {percentile}") for percentile in PERCENTILES)]
+
+
+def bootstrap_intervals(values, confidence = 0.95, resamples = 2000, seed = 0):
+    """
+    Bootstrap confidence intervals of the mean of every column at once
+
+    All resamples of all columns are drawn as one index array, so the cost is
+    a single fancy index and mean instead of a Python loop per resample
+
+    Parameters
+    ----------
+    values
+        (samples, columns) array, one row per seed
+    confidence
+        The confidence level
+        Default is 0.95
+    resamples
+        Number of bootstrap resamples
+        Default is 2000
+    seed
+        Seed of the resampling
+        Default is 0
+
+    Returns
+    -------
+    tuple
+        The mean, lower and upper bound of each column
+    """
+    values = np.asarray(values, dtype=float)
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, len(values), size=(resamples, len(values)))
+    means = values[indices].mean(axis=1)
+
+    alpha = (1 - confidence) / 2
+    low, high = np.percentile(means, [100 * alpha, 100 * (1 - alpha)], axis=0)
+    return values.mean(axis=0), low, high
+
+
+def summarise_seeds(rows, controllers, confidence = 0.95, resamples = 2000):
+    """
+    Aggregates the per seed results of each controller and their paired difference
+
+    Parameters
+    ----------
+    rows
+        Result rows from sweep.run_scenario
+    controllers
+        Traffic light types, the difference is the first minus the second
+    confidence
+        The confidence level
+    resamples
+        Number of bootstrap resamples
+
+    Returns
+    -------
+    list
+        Summary rows with the controller, metric, seeds, mean and interval bounds
+    """
+    names = metric_names(rows[0])
+    values = {}
+    for controller in controllers:
+        controllerRows = sorted([row for row in rows if row["controller"] == controller],
+                                key=lambda row: row["seed"])
+        values[controller] = np.array([[row[name] for name in names] for row in controllerRows])
+
+    # Paired by seed, both controllers see the same vehicles
+    groups = dict(values)
+    if len(controllers) >= 2:
+        groups[f"{controllers[0]} - {controllers[1]}"] = values[controllers[0]] - values[controllers[1]]
+
+    summary = []
+    for group, groupValues in groups.items():
+        mean, low, high = bootstrap_intervals(groupValues, confidence, resamples)
+        for i, name in enumerate(names):
+            summary.append({"controller": group, "metric": name, "seeds": len(groupValues),
+                            "mean": mean[i], "low": low[i], "high": high[i]})
+    return summary
+
+
+def converged(summary, tolerance):
+    """
+    Checks if every interval is tight enough
+
+    Metrics without samples have no finite interval, so they keep the seeds
+    running until maxSeeds
+
+    Parameters
+    ----------
+    summary
+        Summary rows from summarise_seeds
+    tolerance
+        Largest allowed interval half width in seconds
+
+    Returns
+    -------
+    bool
+        True if every interval half width is within the tolerance
+    """
+    halfWidths = np.array([(row["high"] - row["low"]) / 2 for row in summary])
+    return bool(np.all(np.isfinite(halfWidths)) and np.all(halfWidths <= tolerance))
+
+
+def evaluate(controllers, numberOfCars = N, fixedCycleTime = 42, steps = STEPS, initialSeeds = 4,
+             batchSeeds = None, maxSeeds = 32, tolerance = 1.0, confidence = 0.95, resamples = 2000,
+             backend = "traci", workers = None):
+    """
+    Runs seeds in parallel until the confidence intervals are tight enough
+
+    Seeds SEED, SEED + 1, ... are run for every controller in rounds. After
+    each round the per lane percentiles are bootstrapped, and seeds stop
+    being added once every interval half width is within the tolerance or
+    maxSeeds is reached
+
+    Parameters
+    ----------
+    controllers
+        Traffic light types to run, the first two are compared
+    numberOfCars
+        Number of cars to simulate
+    fixedCycleTime
+        The cycle time of the traffic light
+    steps
+        The amount of virtual time to simulate
+    initialSeeds
+        Seeds to run before the first check
+    batchSeeds
+        Seeds added per round
+        Default is the number of workers
+    maxSeeds
+        Seeds to stop at
+    tolerance
+        Largest interval half width in seconds
+    confidence
+        The confidence level
+    resamples
+        Number of bootstrap resamples
+    backend
+        The simulation backend, "traci", "libsumo" or "mock"
+    workers
+        Number of worker processes
+        Default is the number of CPUs
+
+    Returns
+    -------
+    tuple
+        The per seed rows and the summary rows
+    """
+    if batchSeeds is None:
+        batchSeeds = workers or os.cpu_count()
+
+    rows = []
+    numSeeds = 0
+    batch = min(initialSeeds, maxSeeds)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            scenarios = [Scenario(SEED + seed, numberOfCars, fixedCycleTime, controller)
+                         for seed in range(numSeeds, numSeeds + batch)
+                         for controller in controllers]
+            rows += run_sweep(scenarios, steps, backend=backend, executor=executor)
+            numSeeds += batch
+
+            summary = summarise_seeds(rows, controllers, confidence, resamples)
+            if numSeeds >= maxSeeds or (numSeeds >= 2 and converged(summary, tolerance)):
+                return rows, summary
+            batch = min(batchSeeds, maxSeeds - numSeeds)
+
+
+def write_summary(summary, outputFile):
+    """
+    Writes the summary rows
+
+    Parameters
+    ----------
+    summary
+        Summary rows from summarise_seeds
+    outputFile
+        The csv file to write to
+
+    Returns
+    -------
+    None
+    """
+    with open(outputFile, 'w', encoding='utf-8', newline='') as csvFile:
+        csvFileWriter = csv.DictWriter(csvFile, fieldnames=list(summary[0].keys()))
+        csvFileWriter.writeheader()
+        csvFileWriter.writerows(summary)
+
+
+if __name__ == "__main__":
+    options, args = optParser.parse_args()
+    init(options.backend)
+    controllers = options.controllers.split(",")
+
+    rows, summary = evaluate(controllers, options.cars, options.cycleTime, options.steps,
+                             options.initialSeeds, options.batchSeeds, options.maxSeeds,
+                             options.tolerance, options.confidence, options.resamples,
+                             options.backend, options.workers)
+    write_results(rows, f"{options.output}-seeds.csv")
+    write_summary(summary, f"{options.output}-summary.csv")
+
+    print(f"{'controller':<16}{'metric':<28}{'seeds':>6}{'mean':>9}{'interval':>20}")
+    for row in summary:
+        print(f"{row['controller']:<16}{row['metric']:<28}{row['seeds']:>6}{row['mean']:>9.2f}"
+              f"{'[' + format(row['low'], '.2f') + ', ' + format(row['high'], '.2f') + ']':>20}")
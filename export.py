@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import numpy as np
+
+# One row of the exported table, lanes and traffic light types are stored as codes
+TABLE_DTYPE = np.dtype([
+    ("controller", np.uint8),
+    ("lane", np.uint16),
+    ("steps", np.int32),
+    ("waitTime", np.float32),
+    ("averageOvertime", np.float32),
+])
+
+# Formats export_metrics can write
+FORMATS = ["npz", "npy", "parquet"]
+
+
+def metrics_table(store):
+    """
+    Gathers every lane and traffic light type of a metrics store into one table
+
+    Parameters
+    ----------
+    store
+        The MetricsStore to export
+
+    Returns
+    -------
+    ndarray
+        Structured array with TABLE_DTYPE rows
+    """
+    views = [(c, l, store.view(lane, controller))
+             for c, controller in enumerate(store.controllers)
+             for l, lane in enumerate(store.lanes)]
+
+    table = np.empty(sum(len(view) for _, _, view in views), dtype=TABLE_DTYPE)
+    start = 0
+    for c, l, view in views:
+        rows = table[start:start + len(view)]
+        rows["controller"] = c
+        rows["lane"] = l
+        for field in view.dtype.names:
+            rows[field] = view[field]
+        start += len(view)
+    return table
+
+
+def export_npz(store, outputFile, table = None):
+    """
+    Writes the metrics as one column per array in an .npz file
+
+    Parameters
+    ----------
+    store
+        The MetricsStore to export
+    outputFile
+        The .npz file to write to
+    table
+        The table from metrics_table, built if not given
+
+    Returns
+    -------
+    None
+    """
+    if table is None:
+        table = metrics_table(store)
+    columns = {field: table[field] for field in table.dtype.names}
+    np.savez(outputFile, controllers=np.array(store.controllers), lanes=np.array(store.lanes), **columns)
+
+
+def export_npy(store, outputFile, table = None):
+    """
+    Writes the metrics as one memory-mappable .npy table with a .json index
+    of the lane and traffic light type names
+
+    Load it with load_npy, or np.load(outputFile, mmap_mode='r')
+
+    Parameters
+    ----------
+    store
+        The MetricsStore to export
+    outputFile
+        The .npy file to write to
+    table
+        The table from metrics_table, built if not given
+
+    Returns
+    -------
+    None
+    """
+    if table is None:
+        table = metrics_table(store)
+    np.save(outputFile, table)
+    with open(f"{outputFile}.json", 'w', encoding='utf-8') as indexFile:
+        json.dump({"controllers": store.controllers, "lanes": store.lanes}, indexFile)
+
+
+def export_parquet(store, outputFile, table = None):
+    """
+    Writes the metrics to a Parquet file, skipped if pyarrow is not installed
+
+    Parameters
+    ----------
+    store
+        The MetricsStore to export
+    outputFile
+        The .parquet file to write to
+    table
+        The table from metrics_table, built if not given
+
+    Returns
+    -------
+    bool
+        True if the file was written
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        sys.stderr.write("Parquet export needs pyarrow to be installed. Skipping\n")
+        return False
+
+    if table is None:
+        table = metrics_table(store)
+    columns = {
+        "controller": pa.DictionaryArray.from_arrays(table["controller"], store.controllers),
+        "lane": pa.DictionaryArray.from_arrays(table["lane"], store.lanes),
+    }
+    for field in ["steps", "waitTime", "averageOvertime"]:
+        columns[field] = table[field]
+    pq.write_table(pa.table(columns), outputFile)
+    return True
+
+
+def export_metrics(store, outputDir, name = "waitingtime", formats = ("npz",)):
+    """
+    Writes the metrics of every lane and traffic light type in bulk
+
+    Parameters
+    ----------
+    store
+        The MetricsStore to export
+    outputDir
+        Directory to write to
+    name
+        File name without the extension
+    formats
+        Any of "npz", "npy" and "parquet"
+
+    Returns
+    -------
+    None
+    """
+    table = metrics_table(store)
+    exporters = {"npz": export_npz, "npy": export_npy, "parquet": export_parquet}
+    for format in formats:
+        exporters[format](store, os.path.join(outputDir, f"{name}.{format}"), table)
+
+
+def load_npy(inputFile):
+    """
+    Memory-maps a table written by export_npy
+
+    Parameters
+    ----------
+    inputFile
+        The .npy file to read
+
+    Returns
+    -------
+    tuple
+        The table, the traffic light type names and the lane names
+    """
+    with open(f"{inputFile}.json", encoding='utf-8') as indexFile:
+        index = json.load(indexFile)
+    return np.load(inputFile, mmap_mode='r'), index["controllers"], index["lanes"]
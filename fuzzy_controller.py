@@ -1,42 +1,383 @@
+import os
+import json
+import hashlib
 import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
-import matplotlib.pyplot as plt
 
-def fuzzy_logic_controller():
-    # Input variables and output variable
-    arrivingVehicles = ctrl.Antecedent(np.arange(0, 101, 1), 'arrivingVehicles')
-    queuingVehicles = ctrl.Antecedent(np.arange(0, 101, 1), 'queuingVehicles')
-    cycleTime = ctrl.Consequent(np.arange(0, 51, 1), 'cycleTime')
+# ------- Fuzzy Definition -------
+# Universes of discourse as [start, stop) for np.arange with a step of 1
+UNIVERSES = {
+    "arrivingVehicles": [0, 101],
+    "queuingVehicles": [0, 101],
+    "cycleTime": [0, 51],
+}
 
-    # Fuzzy sets defined by triangular membership function
-    arrivingVehicles['low'] = fuzz.trimf(arrivingVehicles.universe, [0, 0, 10])
-    arrivingVehicles['medium'] = fuzz.trimf(arrivingVehicles.universe, [7, 10, 25])
-    arrivingVehicles['high'] = fuzz.trimf(arrivingVehicles.universe, [20, 101, 101])
+# Triangular membership functions for each variable
+MEMBERSHIP_FUNCTIONS = {
+    "arrivingVehicles": {
+        "low": [0, 0, 10],
+        "medium": [7, 10, 25],
+        "high": [20, 101, 101],
+    },
+    "queuingVehicles": {
+        "low": [0, 0, 10],
+        "medium": [7, 10, 25],
+        "high": [20, 101, 101],
+    },
+    "cycleTime": {
+        "short": [0, 0, 10],
+        "medium": [7, 20, 25],
+        "long": [20, 50, 50],
+    },
+}
+
+# Rule Base as (arrivingVehicles, queuingVehicles, cycleTime)
+RULES = [
+    ("high", "low", "long"),
+    ("high", "medium", "medium"),
+    ("high", "high", "short"),
+    ("medium", "low", "long"),
+    ("medium", "medium", "medium"),
+    ("medium", "high", "short"),
+    ("low", "low", "short"),
+    ("low", "medium", "medium"),
+    ("low", "high", "short"),
+]
+
+# Location of the precompiled lookup tables
+CACHE_DIR = os.path.join("outputs", "cache")
+
+# Controllers already built in this process, by kind and definition hash
+_controllers = {}
+
+
+def _build_fuzzy_logic_controller(membershipFunctions = None):
+    """
+    Builds a new skfuzzy controller
+
+    Parameters
+    ----------
+    membershipFunctions
+        The triangular membership functions to use
+        Default is MEMBERSHIP_FUNCTIONS
 
-    queuingVehicles['low'] = fuzz.trimf(queuingVehicles.universe, [0, 0, 10])
-    queuingVehicles['medium'] = fuzz.trimf(queuingVehicles.universe, [7, 10, 25])
-    queuingVehicles['high'] = fuzz.trimf(queuingVehicles.universe, [20, 101, 101])
+    Returns
+    -------
+    ControlSystemSimulation
+        The fuzzy logic controller
+    """
+    if membershipFunctions is None:
+        membershipFunctions = MEMBERSHIP_FUNCTIONS
 
-    cycleTime['short'] = fuzz.trimf(cycleTime.universe, [0, 0, 10])
-    cycleTime['medium'] = fuzz.trimf(cycleTime.universe, [7, 20, 25])
-    cycleTime['long'] = fuzz.trimf(cycleTime.universe, [20, 50, 50])
+    # Importing skfuzzy only here, it pulls in scipy and networkx
+    import skfuzzy as fuzz
+    from skfuzzy import control as ctrl
+
+    # Input variables and output variable
+    arrivingVehicles = ctrl.Antecedent(np.arange(*UNIVERSES["arrivingVehicles"], 1), 'arrivingVehicles')
+    queuingVehicles = ctrl.Antecedent(np.arange(*UNIVERSES["queuingVehicles"], 1), 'queuingVehicles')
+    cycleTime = ctrl.Consequent(np.arange(*UNIVERSES["cycleTime"], 1), 'cycleTime')
+
+    # Fuzzy sets defined by triangular membership function
+    for variable in [arrivingVehicles, queuingVehicles, cycleTime]:
+        for term, points in membershipFunctions[variable.label].items():
+            variable[term] = fuzz.trimf(variable.universe, points)
 
     # Rule Base
-    rule1 = ctrl.Rule(arrivingVehicles['high'] & queuingVehicles['low'], cycleTime['long'])
-    rule2 = ctrl.Rule(arrivingVehicles['high'] & queuingVehicles['medium'], cycleTime['medium'])
-    rule3 = ctrl.Rule(arrivingVehicles['high'] & queuingVehicles['high'], cycleTime['short'])
-    rule4 = ctrl.Rule(arrivingVehicles['medium'] & queuingVehicles['low'], cycleTime['long'])
-    rule5 = ctrl.Rule(arrivingVehicles['medium'] & queuingVehicles['medium'], cycleTime['medium'])
-    rule6 = ctrl.Rule(arrivingVehicles['medium'] & queuingVehicles['high'], cycleTime['short'])
-    rule7 = ctrl.Rule(arrivingVehicles['low'] & queuingVehicles['low'], cycleTime['short'])
-    rule8 = ctrl.Rule(arrivingVehicles['low'] & queuingVehicles['medium'], cycleTime['medium'])
-    rule9 = ctrl.Rule(arrivingVehicles['low'] & queuingVehicles['high'], cycleTime['short'])
+    rules = [ctrl.Rule(arrivingVehicles[arriving] & queuingVehicles[queuing], cycleTime[output])
+             for arriving, queuing, output in RULES]
 
     # Inference and Defuzzification
-    trafficController = ctrl.ControlSystem([rule1, rule2, rule3, rule4, rule5, rule6, rule7, rule8, rule9])
-    fuzzyLogic = ctrl.ControlSystemSimulation(trafficController) 
+    trafficController = ctrl.ControlSystem(rules)
+    fuzzyLogic = ctrl.ControlSystemSimulation(trafficController)
+
+    return fuzzyLogic
+
+
+def fuzzy_logic_controller(membershipFunctions = None):
+    """
+    Gets the skfuzzy controller, built once per process and definition
+
+    Every caller gets the same controller, so runs in threads at once
+    should use compiled_fuzzy_logic_controller instead
+
+    Parameters
+    ----------
+    membershipFunctions
+        The triangular membership functions to use
+        Default is MEMBERSHIP_FUNCTIONS
+
+    Returns
+    -------
+    ControlSystemSimulation
+        The fuzzy logic controller
+    """
+    key = ("skfuzzy", definition_hash(membershipFunctions))
+    if key not in _controllers:
+        _controllers[key] = _build_fuzzy_logic_controller(membershipFunctions)
+    return _controllers[key]
+
+
+def definition_hash(membershipFunctions = None):
+    """
+    Hashes the fuzzy definition used to build the controller
+
+    Parameters
+    ----------
+    membershipFunctions
+        The triangular membership functions to use
+        Default is MEMBERSHIP_FUNCTIONS
+
+    Returns
+    -------
+    str
+        Hex digest of the universes, membership functions and rules
+    """
+    if membershipFunctions is None:
+        membershipFunctions = MEMBERSHIP_FUNCTIONS
+
+    definition = {
+        "universes": UNIVERSES,
+        "membershipFunctions": membershipFunctions,
+        "rules": RULES,
+    }
+    encoded = json.dumps(definition, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class CompiledFuzzyController:
+    """
+    Fuzzy logic controller answered from a precomputed lookup table
+
+    Mirrors the input/compute/output interface of ControlSystemSimulation
+    so it can be used in place of fuzzy_logic_controller()
+
+    Parameters
+    ----------
+    table
+        cycleTime output for every (arrivingVehicles, queuingVehicles) pair
+        in the universes
+    """
+    def __init__(self, table):
+        self.table = table
+        self.input = {}
+        self.output = {}
+
+        self._maxArriving = table.shape[0] - 1
+        self._maxQueuing = table.shape[1] - 1
+
+    def lookup(self, arrivingVehicles, queuingVehicles):
+        """
+        Finds the cycle time with bilinear interpolation between grid points
+
+        Parameters
+        ----------
+        arrivingVehicles
+            Number of arriving vehicles, a scalar or array
+        queuingVehicles
+            Number of queuing vehicles, a scalar or array
+
+        Returns
+        -------
+        float or ndarray
+            The cycle time
+        """
+        # Clipping to the universe like skfuzzy does
+        a = np.clip(np.asarray(arrivingVehicles, dtype=float), 0, self._maxArriving)
+        q = np.clip(np.asarray(queuingVehicles, dtype=float), 0, self._maxQueuing)
+
+        # Surrounding grid points
+        a0 = np.minimum(np.floor(a).astype(int), self._maxArriving - 1)
+        q0 = np.minimum(np.floor(q).astype(int), self._maxQueuing - 1)
+        da = a - a0
+        dq = q - q0
+
+        # Bilinear interpolation
+        table = self.table
+        cycleTime = (table[a0, q0] * (1 - da) * (1 - dq)
+                     + table[a0 + 1, q0] * da * (1 - dq)
+                     + table[a0, q0 + 1] * (1 - da) * dq
+                     + table[a0 + 1, q0 + 1] * da * dq)
+
+        if cycleTime.ndim == 0:
+            return float(cycleTime)
+        return cycleTime
+
+    def compute(self):
+        self.output['cycleTime'] = self.lookup(self.input['arrivingVehicles'],
+                                               self.input['queuingVehicles'])
+
+
+def batch_compute(fuzzyLogic, arrivingVehicles, queuingVehicles):
+    """
+    Evaluates a fuzzy controller for many junctions at once
+
+    A CompiledFuzzyController answers every junction in one vectorized lookup,
+    the skfuzzy controller is computed once per junction
+
+    Parameters
+    ----------
+    fuzzyLogic
+        The CompiledFuzzyController or skfuzzy ControlSystemSimulation
+    arrivingVehicles
+        Number of arriving vehicles of each junction
+    queuingVehicles
+        Number of queuing vehicles of each junction
+
+    Returns
+    -------
+    ndarray
+        The cycle time of each junction
+    """
+    if isinstance(fuzzyLogic, CompiledFuzzyController):
+        return np.asarray(fuzzyLogic.lookup(arrivingVehicles, queuingVehicles), dtype=float)
+
+    cycleTimes = np.empty(len(arrivingVehicles))
+    for j, (arriving, queuing) in enumerate(zip(arrivingVehicles, queuingVehicles)):
+        fuzzyLogic.input['arrivingVehicles'] = arriving
+        fuzzyLogic.input['queuingVehicles'] = queuing
+        fuzzyLogic.compute()
+        cycleTimes[j] = fuzzyLogic.output['cycleTime']
+    return cycleTimes
+
+
+def compile_fuzzy_table(membershipFunctions = None):
+    """
+    Evaluates the skfuzzy controller over the whole input grid
+
+    The grid is given to skfuzzy as arrays in one compute call, which gives
+    the same table as computing each pair on its own in a fraction of the time
+
+    Parameters
+    ----------
+    membershipFunctions
+        The triangular membership functions to use
+        Default is MEMBERSHIP_FUNCTIONS
+
+    Returns
+    -------
+    ndarray
+        cycleTime indexed by [arrivingVehicles, queuingVehicles]
+    """
+    # A controller of its own, one given arrays no longer takes single inputs
+    fuzzyLogic = _build_fuzzy_logic_controller(membershipFunctions)
+    arrivingUniverse = np.arange(*UNIVERSES["arrivingVehicles"], 1)
+    queuingUniverse = np.arange(*UNIVERSES["queuingVehicles"], 1)
+    arrivingVehicles, queuingVehicles = np.meshgrid(arrivingUniverse, queuingUniverse, indexing="ij")
+
+    fuzzyLogic.input['arrivingVehicles'] = arrivingVehicles.astype(float)
+    fuzzyLogic.input['queuingVehicles'] = queuingVehicles.astype(float)
+    fuzzyLogic.compute()
+    return np.asarray(fuzzyLogic.output['cycleTime'], dtype=float)
+
+
+def compiled_fuzzy_logic_controller(membershipFunctions = None, cacheDir = CACHE_DIR):
+    """
+    Gets the lookup table controller, built once per process and definition
+
+    The table is loaded from disk if cached, otherwise compiled and saved
+
+    Parameters
+    ----------
+    membershipFunctions
+        The triangular membership functions to use
+        Default is MEMBERSHIP_FUNCTIONS
+    cacheDir
+        Directory to cache the table in
+        Set to None to disable the cache
+
+    Returns
+    -------
+    CompiledFuzzyController
+        The compiled fuzzy logic controller
+    """
+    key = ("compiled", definition_hash(membershipFunctions))
+    if key in _controllers:
+        return _controllers[key]
+
+    if cacheDir is None:
+        _controllers[key] = CompiledFuzzyController(compile_fuzzy_table(membershipFunctions))
+        return _controllers[key]
+
+    # Checking the cache
+    tablePath = os.path.join(cacheDir, f"fuzzy-{key[1]}.npy")
+    if os.path.exists(tablePath):
+        _controllers[key] = CompiledFuzzyController(np.load(tablePath))
+        return _controllers[key]
+
+    # Compiling and saving the table
+    # Written to a temporary file first so concurrent processes never read a partial table
+    table = compile_fuzzy_table(membershipFunctions)
+    if not os.path.exists(cacheDir):
+        os.makedirs(cacheDir, exist_ok=True)
+    temporaryPath = f"{tablePath}.{os.getpid()}.tmp.npy"
+    np.save(temporaryPath, table)
+    os.replace(temporaryPath, tablePath)
+    _controllers[key] = CompiledFuzzyController(table)
+    return _controllers[key]
+
+
+def verify_compiled_controller(compiledController, membershipFunctions = None,
+                               samples = 200, tolerance = 5.0, seed = 0):
+    """
+    Compares the compiled controller against skfuzzy
+
+    Random grid points must match exactly (to floating point error) and
+    random non-integer inputs, which are interpolated, must match within
+    the tolerance
+
+    Parameters
+    ----------
+    compiledController
+        The CompiledFuzzyController to check
+    membershipFunctions
+        The triangular membership functions the table was built from
+        Default is MEMBERSHIP_FUNCTIONS
+    samples
+        Number of grid points and of non-integer inputs to check
+    tolerance
+        Maximum allowed difference in cycle time for non-integer inputs
+        Default is 5 virtual seconds as the output is steep between some grid points
+    seed
+        Seed for the random inputs
+
+    Returns
+    -------
+    float
+        The largest difference found
+
+    Raises
+    ------
+    ValueError
+        If the compiled controller does not match skfuzzy
+    """
+    fuzzyLogic = fuzzy_logic_controller(membershipFunctions)
+    maxArriving = UNIVERSES["arrivingVehicles"][1] - 1
+    maxQueuing = UNIVERSES["queuingVehicles"][1] - 1
+
+    # Random grid points and non-integer inputs
+    rng = np.random.default_rng(seed)
+    gridArriving = rng.integers(0, maxArriving + 1, samples)
+    gridQueuing = rng.integers(0, maxQueuing + 1, samples)
+    arriving = rng.uniform(0, maxArriving, samples)
+    queuing = rng.uniform(0, maxQueuing, samples)
+
+    def largest_error(arrivingVehicles, queuingVehicles):
+        compiled = compiledController.lookup(arrivingVehicles, queuingVehicles)
+        error = 0
+        for a, q, c in zip(arrivingVehicles, queuingVehicles, compiled):
+            fuzzyLogic.input['arrivingVehicles'] = a
+            fuzzyLogic.input['queuingVehicles'] = q
+            fuzzyLogic.compute()
+            error = max(error, abs(fuzzyLogic.output['cycleTime'] - c))
+        return error
+
+    # Grid points should match exactly
+    gridError = largest_error(gridArriving, gridQueuing)
+    if gridError > 1e-9:
+        raise ValueError(f"Compiled table differs from skfuzzy by {gridError} at grid points")
 
-    plt.show()
-    
-    return fuzzyLogic
\ No newline at end of file
+    # Non-integer inputs are interpolated
+    maxError = max(gridError, largest_error(arriving, queuing))
+    if maxError > tolerance:
+        raise ValueError(f"Compiled controller differs from skfuzzy by {maxError} (tolerance {tolerance})")
+    return maxError
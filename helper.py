@@ -1,51 +1,87 @@
-import csv
-import matplotlib.pyplot as plt
 import numpy as np
 
 def array2csv(headerArray, dataArray, outputFile):
-    csvFile = open(outputFile, 'w', encoding='utf-8')
-    csvFileWriter = csv.writer(csvFile)
+    # Writing every field of the samples as a column
+    columns = np.column_stack([dataArray[field] for field in dataArray.dtype.names])
+    formats = ["%d" if np.issubdtype(dataArray.dtype[field], np.integer) else "%.9g"
+               for field in dataArray.dtype.names]
 
-    csvFileWriter.writerow(headerArray)
+    with open(outputFile, 'w', encoding='utf-8') as csvFile:
+        np.savetxt(csvFile, columns, fmt=formats, delimiter=",",
+                   header=",".join(headerArray), comments="")
 
-    N = len(dataArray["steps"])
-    for i in range(N):
-        csvLine = [dataArray["steps"][i], dataArray["waitTime"][i]]
-        csvFileWriter.writerow(csvLine)
+def decimate(x, y, maxPoints):
+    # Keeping the minimum and maximum of each bucket so peaks survive downsampling
+    N = len(x)
+    if maxPoints is None or N <= maxPoints:
+        return x, y
+    if maxPoints < 2:
+        raise ValueError("Decimating needs at least 2 points, the minimum and maximum of a bucket")
 
-def plot_graph(dataArray, title, average = False):
-    N = len(dataArray)
+    numBuckets = maxPoints // 2
+    bucketSize = N // numBuckets
+    usable = numBuckets * bucketSize
+    buckets = y[:usable].reshape(numBuckets, bucketSize)
+    offsets = np.arange(numBuckets) * bucketSize
+
+    indices = np.concatenate([offsets + np.argmin(buckets, axis=1),
+                              offsets + np.argmax(buckets, axis=1),
+                              np.arange(usable, N)])
+    indices = np.unique(indices)
+    return x[indices], y[indices]
+
+def finish_figure(outputFile):
+    import matplotlib.pyplot as plt
+    # Saving to file if given, otherwise displaying the graph
+    if outputFile is None:
+        plt.show()
+    else:
+        plt.savefig(outputFile)
+        plt.close()
+
+def plot_graph(dataArray, title, average = False, outputFile = None, maxPoints = None):
     x = dataArray["steps"]
     if average:
         y = dataArray["averageOvertime"]
     else:
         y = dataArray["waitTime"]
+    x, y = decimate(x, y, maxPoints)
 
+    # Importing pyplot only once plotting, it is slow to import
+    import matplotlib.pyplot as plt
+    plt.figure()
     plt.plot(x, y)
     plt.title(title)
     plt.xlabel("Time in Simulation / s")
     plt.ylabel("Average Waiting Time in Lane / s")
-    plt.show()
+    finish_figure(outputFile)
 
-def plot_graphs(dataArray, trafficLightType, average = False):
-    # Gathering Data from dataArray
-    x = [lane[trafficLightType]["steps"] for lane in dataArray.values()]
+def plot_graphs(views, average = False, outputFile = None, maxPoints = None):
+    # Gathering Data from the structured array of each lane
+    titles = list(views.keys())
+    lanes = views.values()
+    x = [lane["steps"] for lane in lanes]
     if average:
-        y = [lane[trafficLightType]["averageOvertime"] for lane in dataArray.values()]
+        y = [lane["averageOvertime"] for lane in lanes]
     else:
-        y = [lane[trafficLightType]["waitTime"] for lane in dataArray.values()]
+        y = [lane["waitTime"] for lane in lanes]
 
-    # Plotting Data
-    fig, axs = plt.subplots(2, 2)
-    for i in range(2):
-        for j in range(2):
-            axs[i][j].plot(x[j*2+i], y[j*2+i])
+    # Plotting Data, filling a square grid column by column
+    cols = int(np.ceil(np.sqrt(len(titles))))
+    rows = int(np.ceil(len(titles) / cols))
+    import matplotlib.pyplot as plt
+    fig, axs = plt.subplots(rows, cols, squeeze=False)
+    for i in range(rows):
+        for j in range(cols):
+            if j*rows + i < len(titles):
+                axs[i][j].plot(*decimate(x[j*rows+i], y[j*rows+i], maxPoints))
 
     # Setting labels and title
-    for i in range(2):
-        for j in range(2):
-            axs[i][j].set(title="Lane {}".format(j*2 + i + 1),
-                          xlabel="Time in Simulation / s",
-                          ylabel="Average Waiting Time in Lane / s")
+    for i in range(rows):
+        for j in range(cols):
+            if j*rows + i < len(titles):
+                axs[i][j].set(title=titles[j*rows + i],
+                              xlabel="Time in Simulation / s",
+                              ylabel="Average Waiting Time in Lane / s")
     # Displaying graphs
-    plt.show()
+    finish_figure(outputFile)
@@ -3,41 +3,125 @@ from __future__ import print_function
 
 import os
 import sys
+import json
 import optparse
 import numpy as np
 from helper import *
-from fuzzy_controller import fuzzy_logic_controller
-import matplotlib.pyplot as plt
+from metrics import MetricsStore
+from collector import COLLECTORS
+from network import discover_junctions, apply_cycle_time
+from scheduler import DecisionScheduler
+from profiling import StepProfiler, NullProfiler, SIMULATION, QUERY, CONTROL, METRICS
+from backends import add_sumo_tools, load_backend, resolve_backend, sumo_binary, sumo_version, BACKENDS
+from session import SumoSession
+from checkpoint import Checkpointer, load_checkpoint
+from traces import TraceRecorder
+from result_cache import ResultCache, result_key, file_hash, source_hash, MAX_BYTES
+from export import export_metrics, FORMATS
+from trips import write_trip_report, format_value
+from rendering import render_figures
+from routes import stream_routefile, write_flow_routefile, demand_rates, route_probabilities, load_demand, \
+    VTYPE, ROUTE_IDS, ROUTE_EDGES
+from fuzzy_controller import fuzzy_logic_controller, compiled_fuzzy_logic_controller, verify_compiled_controller, \
+    batch_compute, definition_hash
 
 import xml.etree.ElementTree as ET
 
-if 'SUMO_HOME' in os.environ:
-    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
-    sys.path.append(tools)
-else:
-    sys.exit("Please declare environment variable 'SUMO_HOME'")
-
-# Creating Nessary Directories
+# Nessary Directories, created by init
 output_dir = os.path.join("outputs")
 queue_path = os.path.join(output_dir, "queue")
 statistics_path = os.path.join(output_dir, "statistics")
 
-if not os.path.exists(queue_path):
-    os.makedirs(queue_path)
-if not os.path.exists(statistics_path):
-    os.makedirs(statistics_path)
-
-from sumolib import checkBinary
-import traci
-
 # Creating Options
 optParser = optparse.OptionParser()
 optParser.add_option("--nogui", action="store_true",
                     default=False, help="run the commandline version of sumo")
+optParser.add_option("--compiled", action="store_true",
+                    default=False, help="use the precompiled lookup table fuzzy controller")
+optParser.add_option("--polling", action="store_true",
+                    default=False, help="read values with one TraCI call each instead of subscriptions")
+optParser.add_option("--streaming", action="store_true",
+                    default=False, help="generate the route file with the streaming vectorized generator")
+optParser.add_option("--demand", default=None,
+                    help="json file with a demand profile and OD matrix for the route file, see routes.load_demand")
+optParser.add_option("--flows", action="store_true",
+                    default=False, help="write the route file as Poisson flows instead of one vehicle each")
+optParser.add_option("--export", default="npz",
+                    help="comma separated bulk formats for the statistics, any of " + ", ".join(FORMATS))
+optParser.add_option("--headless", action="store_true",
+                    default=False, help="render the graphs to files after the simulation instead of showing them")
+optParser.add_option("--figure-formats", dest="figureFormats", default="png",
+                    help="comma separated image formats for --headless, such as png,svg")
+optParser.add_option("--backend", default="traci",
+                    help="simulation backend, one of " + ", ".join(BACKENDS))
+optParser.add_option("--profile", action="store_true",
+                    default=False, help="time each phase of the simulation steps and write a summary")
+optParser.add_option("--cprofile", action="store_true",
+                    default=False, help="with --profile, also write cProfile stats of the simulation loops")
+optParser.add_option("--decision-threshold", dest="decisionThreshold", type="float", default=0,
+                    help="change in vehicles below which the fuzzy controller keeps its last decision")
+optParser.add_option("--decision-interval", dest="decisionInterval", type="int", default=None,
+                    help="steps after which the fuzzy controller decides again even without changes")
+optParser.add_option("--restart", action="store_true",
+                    default=False, help="start a new SUMO for every run instead of reloading the running one")
+optParser.add_option("--checkpoint-interval", dest="checkpointInterval", type="int", default=None,
+                    help="steps between checkpoints of the SUMO state and the collected wait times")
+optParser.add_option("--resume", action="store_true",
+                    default=False, help="continue each run from its latest checkpoint")
+optParser.add_option("--warm-start", dest="warmStart", default=None,
+                    help="checkpoint file to start both runs from instead of step 0, its wait times are left out")
+optParser.add_option("--parameters", default=None,
+                    help="json file with the fixedCycleTime and membershipFunctions to run with, see optimizer.py")
+optParser.add_option("--trace", action="store_true",
+                    default=False, help="record a trace of each run to outputs/traces to replay with traces.py")
+optParser.add_option("--no-cache", dest="noCache", action="store_true",
+                    default=False, help="always generate the route file and simulate instead of using cached results")
+optParser.add_option("--cache-size", dest="cacheSize", type="int", default=MAX_BYTES // 1024 ** 2,
+                    help="megabytes of cached results kept, the least recently used are removed past it")
+optParser.add_option("--verify", action="store_true",
+                    default=False, help="check the precompiled fuzzy controller against skfuzzy")
 # ------- Constants -------
 SEED = 42
 STEPS = 3600
 N = 3000
+# Names of the lanes of traffic.net.xml in the statistics
+LANE_NAMES = {"E0_0": "Lane 1", "E2_0": "Lane 2", "-E1_0": "Lane 3", "-E3_0": "Lane 4"}
+# Modules whose code shapes the results of a run, their sources are part of its cache key
+SIMULATION_MODULES = ["main", "session", "backends", "collector", "network", "scheduler", "metrics",
+                      "running_statistics", "fuzzy_controller", "trips"]
+# Modules whose code writes the route files
+ROUTE_MODULES = ["main", "routes"]
+
+
+def init(backend = "traci", outputDir = output_dir):
+    """
+    Prepares the process to run simulations
+
+    Importing this module only defines things, the command line entry points
+    call this first. Matplotlib and skfuzzy are imported once plotting or
+    building the skfuzzy controller, so worker processes that do neither
+    start quickly
+
+    Parameters
+    ----------
+    backend
+        The simulation backend, SUMO_HOME is checked unless it is "mock"
+        Default is "traci"
+    outputDir
+        Directory to create the queue and statistics directories in
+        Default is "outputs"
+
+    Returns
+    -------
+    None
+    """
+    # Creating Nessary Directories
+    for path in [os.path.join(outputDir, "queue"), os.path.join(outputDir, "statistics")]:
+        os.makedirs(path, exist_ok=True)
+
+    if backend != "mock" and not add_sumo_tools():
+        sys.exit("Please declare environment variable 'SUMO_HOME'")
+
 
 class TrafficSimulator:
     """
@@ -54,133 +138,550 @@ class TrafficSimulator:
     fixedCycleTime
         The amount of virtual time per cycle for fixed time traffic light simulation
         Default is 42 virtual seconds
+    compiledFuzzy
+        Set to answer the fuzzy controller from a precompiled lookup table
+        Default is False
+    collector
+        How lane and traffic light values are read from SUMO
+        It can be "subscription" or "polling"
+        Default is "subscription"
+    seed
+        Random seed for the route file
+        Default is SEED
+    netFile
+        The network file to simulate, every traffic light in it is controlled
+        It is read once and never rewritten, cycle times are set through TraCI
+        Default is "traffic.net.xml"
+    routeFile
+        The route file to simulate
+        Default is "traffic.rou.xml"
+    outputDir
+        Directory to write SUMO outputs to
+        Default is "outputs"
+    label
+        Label of the TraCI connection, must be unique among running simulations
+        Default is "default"
+    backend
+        The simulation backend, "traci" for SUMO, "libsumo" for SUMO inside this process
+        or "mock" for the queue model, libsumo falls back to traci with the gui
+        Default is "traci"
+    profile
+        Set to time each phase of the simulation steps, see StepProfiler
+        Default is False
+    cprofile
+        Set to also run cProfile over the simulation loops when profiling
+        Default is False
+    laneNames
+        Names of the lanes in the statistics, other lanes are named by their id
+        Default is LANE_NAMES
+    decisionThreshold
+        Change in arriving or queuing vehicles the fuzzy controller ignores, see DecisionScheduler
+        Default is 0
+    decisionInterval
+        Steps after which the fuzzy controller decides again even without changes
+        Default is None, never
+    keepAlive
+        Set to keep SUMO running between runs and reset it with traci.load
+        Call close() when done
+        Default is True
+    session
+        A SumoSession to run on, such as one shared by the runs of a worker
+        The backend, gui, label and keepAlive are then taken from it
+        Default is a new session
+    demandProfile
+        Shape of the arrival rate over time, scaled to numberOfCars, see routes.demand_rates
+        Default is None, a constant rate
+    odMatrix
+        Relative demand between the origins and destinations, see routes.route_probabilities
+        Default is None, the 75/25 straight/turn split
+    membershipFunctions
+        The triangular membership functions of the fuzzy controller
+        Default is MEMBERSHIP_FUNCTIONS
+    maxSamples
+        Number of most recent wait time samples kept per lane, see MetricSeries
+        The percentiles still cover every sample
+        Default is None, keep every sample
+    streamer
+        MetricStreamer to send the lane values of every step to, see streaming.py
+        Default is None, no streaming
+    checkpointInterval
+        Steps between checkpoints of a run, see Checkpointer
+        Default is None, no checkpoints
+    checkpointDir
+        Directory to write the checkpoints to
+        Default is "outputs/checkpoints"
+    resume
+        Set to continue each run from its latest checkpoint, finished runs are only restored
+        Default is False
+    traceDir
+        Directory to record a trace of each run to, see TraceRecorder
+        Default is None, no traces
+    resultCache
+        ResultCache to answer route files and runs from when nothing they depend on changed
+        Runs that profile, trace, stream, checkpoint or start from a checkpoint are always simulated
+        Default is None, no cache
     """
-    def __init__(self, numberOfCars, steps, gui, fixedCycleTime = 42):
+    def __init__(self, numberOfCars, steps, gui, fixedCycleTime = 42, compiledFuzzy = False,
+                 collector = "subscription", seed = SEED, netFile = "traffic.net.xml",
+                 routeFile = "traffic.rou.xml", outputDir = output_dir, label = "default",
+                 backend = "traci", profile = False, cprofile = False, laneNames = LANE_NAMES,
+                 decisionThreshold = 0, decisionInterval = None, keepAlive = True, session = None,
+                 demandProfile = None, odMatrix = None, membershipFunctions = None, maxSamples = None,
+                 streamer = None, checkpointInterval = None, checkpointDir = None, resume = False,
+                 traceDir = None, resultCache = None):
         # Saving Variables
         self.numberOfCars = numberOfCars
         self.steps = steps
         self.fixedCycleTime = fixedCycleTime
+        self.compiledFuzzy = compiledFuzzy
+        self.collector = collector
+        self.seed = seed
+        self.netFile = netFile
+        self.routeFile = routeFile
+        self.outputDir = outputDir
+        self.label = label
+        self.lastRunSteps = 0
+        self.profile = profile
+        self.cprofile = cprofile
+        self.profilers = {}
+        self.decisionThreshold = decisionThreshold
+        self.decisionInterval = decisionInterval
+        self.decisionReports = {}
+        self.demandProfile = demandProfile
+        self.odMatrix = odMatrix
+        self.membershipFunctions = membershipFunctions
+        self.streamer = streamer
+        self.resume = resume
+        self.traceDir = traceDir
+        self.maxSamples = maxSamples
+        self.resultCache = resultCache
+        self.resultKeys = {}
+        if checkpointDir is None:
+            checkpointDir = os.path.join(outputDir, "checkpoints")
+        self.checkpointer = Checkpointer(checkpointDir, checkpointInterval)
 
         # this script has been called from the command line. It will start sumo as a
         # server, then connect and run
-        if gui:
-            self.sumoBinary = checkBinary('sumo')
-        else:
-            self.sumoBinary = checkBinary('sumo-gui')
-
-        self.waitingTime = {
-            "Lane 1": {
-                "Fixed": {
-                    "steps": [],
-                    "waitTime": [],
-                    "averageOvertime": [],
-                    "90th percentile": -1,
-                },
-                "Fuzzy": {
-                    "steps": [],
-                    "waitTime": [],
-                    "averageOvertime": [],
-                    "90th percentile": -1,
-                }
-            },
-            "Lane 2": {
-                "Fixed": {
-                    "steps": [],
-                    "waitTime": [],
-                    "averageOvertime": [],
-                    "90th percentile": -1,
-                },
-                "Fuzzy": {
-                    "steps": [],
-                    "waitTime": [],
-                    "averageOvertime": [],
-                    "90th percentile": -1,
-                }
-            },
-            "Lane 3": {
-                "Fixed": {
-                    "steps": [],
-                    "waitTime": [],
-                    "averageOvertime": [],
-                    "90th percentile": -1,
-                },
-                "Fuzzy": {
-                    "steps": [],
-                    "waitTime": [],
-                    "averageOvertime": [],
-                    "90th percentile": -1,
-                }
-            },
-            "Lane 4": {
-                "Fixed": {
-                    "steps": [],
-                    "waitTime": [],
-                    "averageOvertime": [],
-                    "90th percentile": -1,
-                },
-                "Fuzzy": {
-                    "steps": [],
-                    "waitTime": [],
-                    "averageOvertime": [],
-                    "90th percentile": -1,
-                }
-            },
-            "All": {
-                "Fixed": {
-                    "steps": [],
-                    "waitTime": [0],
-                    "averageOvertime": [],
-                    "90th percentile": -1,
-                },
-                "Fuzzy": {
-                    "steps": [],
-                    "waitTime": [0],
-                    "averageOvertime": [],
-                    "90th percentile": -1,
-                }
-            },
+        self.backend = resolve_backend(backend, gui)
+        if session is None:
+            session = SumoSession(load_backend(self.backend), sumo_binary(self.backend, gui), label,
+                                  keepAlive)
+        self.session = session
+        self.traci = session.traci
+
+        # Traffic lights and the lanes they control
+        self.junctions = discover_junctions(netFile)
+        self.laneNames = [laneNames.get(lane, lane) for lane in self.junctions.lanes]
+
+        # Wait time samples of each lane
+        self.waitingTime = MetricsStore(sorted(self.laneNames), ["Fixed", "Fuzzy"], maxSamples=maxSamples)
+        self.percentile90 = {lane: {"Fixed": -1, "Fuzzy": -1} for lane in self.waitingTime.lanes + ["All"]}
+
+    def _output_file(self, kind, trafficLightType):
+        """
+        Gets the path of a SUMO output of a run
+
+        Parameters
+        ----------
+        kind
+            The output, "queue" or "tripinfo"
+        trafficLightType
+            The type of traffic light of the run
+
+        Returns
+        -------
+        str
+            The file, one per output and traffic light type
+        """
+        return os.path.join(self.outputDir, kind, f"{kind}-{trafficLightType}.xml")
+
+    def _start_sumo(self, trafficLightType, stateFile = None):
+        """
+        Starts SUMO, or reloads the running SUMO, on this simulator's network and route file
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light of the run, names its output files
+        stateFile
+            A saved SUMO state to continue from
+            It is loaded at startup, loading it later would insert the route file's vehicles again
+            Default is None, start at time 0
+
+        Returns
+        -------
+        None
+        """
+        queueFile = self._output_file("queue", trafficLightType)
+        tripinfoFile = self._output_file("tripinfo", trafficLightType)
+        for outputFile in [queueFile, tripinfoFile]:
+            if not os.path.exists(os.path.dirname(outputFile)):
+                os.makedirs(os.path.dirname(outputFile))
+            # Removing the outputs of an earlier run so they are never mistaken for this one's
+            if os.path.exists(outputFile):
+                os.remove(outputFile)
+
+        args = ["-c", "traffic.sumocfg",
+                "--net-file", self.netFile,
+                "--route-files", self.routeFile,
+                "--queue-output", queueFile,
+                "--tripinfo-output", tripinfoFile]
+        # Checkpoints carry the random number generators and exact positions, so a resumed run
+        # continues like it was never stopped
+        if self.checkpointer.interval is not None or stateFile is not None:
+            args += ["--save-state.rng", "--save-state.precision", "6"]
+        if stateFile is not None:
+            args += ["--load-state", stateFile]
+        self.session.open(args)
+
+    def _start_collector(self):
+        """
+        Creates and starts the collector for the lanes and traffic lights
+
+        Returns
+        -------
+        PollingCollector
+            The started collector
+        """
+        collector = COLLECTORS[self.collector](self.traci, self.junctions.lanes, self.junctions.trafficLights)
+        collector.start()
+        return collector
+
+    def _start_profiler(self, trafficLightType):
+        """
+        Creates and starts the step profiler of a simulation run
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light the run is for
+
+        Returns
+        -------
+        StepProfiler or NullProfiler
+            The started profiler, a NullProfiler if profiling is off
+        """
+        if not self.profile:
+            return NullProfiler()
+        profiler = StepProfiler(cprofile=self.cprofile)
+        self.profilers[trafficLightType] = profiler
+        profiler.start()
+        return profiler
+
+    def _start_trace(self, trafficLightType, cycleTime):
+        """
+        Creates the trace recorder of a simulation run
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light the run is for
+        cycleTime
+            The cycle time of the run
+
+        Returns
+        -------
+        TraceRecorder
+            The recorder, None if traces are off
+        """
+        if self.traceDir is None:
+            return None
+        metadata = {
+            "controller": trafficLightType,
+            "seed": self.seed,
+            "numberOfCars": self.numberOfCars,
+            "netFile": self.netFile,
+            "cycleTime": cycleTime,
+            "compiledFuzzy": self.compiledFuzzy,
+            "membershipFunctions": self.membershipFunctions,
+            "decisionThreshold": self.decisionThreshold,
+            "decisionInterval": self.decisionInterval,
         }
+        return TraceRecorder(os.path.join(self.traceDir, f"trace-{trafficLightType}.npy"), self.laneNames,
+                             self.junctions.trafficLights, metadata)
 
-        self._lane1 = "E0_0"
-        self._lane2 = "E2_0"
-        self._lane3 = "-E1_0"
-        self._lane4 = "-E3_0"
-    
-    def generate_routefile(self, file_name):
+    def _result_key(self, trafficLightType, cycleTime, warmStart):
         """
-        Generates the route files for sumo
+        Hashes everything the result of a run depends on
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light of the run
+        cycleTime
+            The cycle time of the run
+        warmStart
+            The checkpoint file the run starts from, None for step 0
+
+        Returns
+        -------
+        str
+            The key in the result cache, None if the run is always simulated
+        """
+        if self.resultCache is None or warmStart is not None or self.resume or self.profile:
+            return None
+        if self.traceDir is not None or self.streamer is not None or self.checkpointer.interval is not None:
+            return None
+        # Only runs into empty series, so the result holds this run alone
+        if any(len(series) > 0 for series in self.waitingTime.state(trafficLightType).values()):
+            return None
+
+        # The net file holds the tlLogic programs the cycle time is applied to
+        fields = {
+            "kind": "run",
+            "controller": trafficLightType,
+            "cycleTime": cycleTime,
+            "routes": file_hash(self.routeFile),
+            "net": file_hash(self.netFile),
+            "config": file_hash("traffic.sumocfg"),
+            "simulator": sumo_version(self.backend),
+            "code": source_hash(SIMULATION_MODULES),
+            "lanes": self.laneNames,
+            "maxSamples": self.maxSamples,
+        }
+        if trafficLightType == "Fuzzy":
+            fields.update(fuzzy=definition_hash(self.membershipFunctions), compiledFuzzy=self.compiledFuzzy,
+                          decisionThreshold=self.decisionThreshold, decisionInterval=self.decisionInterval)
+        return result_key(**fields)
+
+    def _load_result(self, trafficLightType, key):
+        """
+        Restores a run from the result cache
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light of the run
+        key
+            The key of the run, from _result_key
+
+        Returns
+        -------
+        bool
+            True if the run was cached and is restored
+        """
+        self.resultKeys[trafficLightType] = (key, True)
+        result = self.resultCache.get(key) if key is not None else None
+        if result is None:
+            return False
+
+        self.waitingTime.restore(trafficLightType, result["series"])
+        if result["decisionReport"] is not None:
+            self.decisionReports[trafficLightType] = result["decisionReport"]
+        self.lastRunSteps = result["steps"]
+        self.resultKeys[trafficLightType] = (key, False)
+
+        # Removing the SUMO outputs of an earlier run so they are never mistaken for this one's
+        for kind in ["queue", "tripinfo"]:
+            if os.path.exists(self._output_file(kind, trafficLightType)):
+                os.remove(self._output_file(kind, trafficLightType))
+        return True
+
+    def _store_result(self, trafficLightType, key):
+        """
+        Stores the wait times, percentiles and decisions of a finished run in the result cache
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light of the run
+        key
+            The key of the run, from _result_key, None to not store it
+
+        Returns
+        -------
+        None
+        """
+        if key is None:
+            return
+        percentiles = {}
+        for lane in self.waitingTime.lanes:
+            statistics = self.waitingTime.statistics(lane, trafficLightType)
+            percentiles[lane] = {percentile: statistics.percentile(percentile) for percentile in [50, 90, 99]}
+        self.resultCache.put(key, {
+            "steps": self.lastRunSteps,
+            "series": self.waitingTime.state(trafficLightType),
+            "percentiles": percentiles,
+            "decisionReport": self.decisionReports.get(trafficLightType),
+        })
+
+    def _lane_series(self, trafficLightType):
+        """
+        Gets the wait time series of each lane
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light
+
+        Returns
+        -------
+        list
+            One MetricSeries per lane, in the order of self.junctions.lanes
+        """
+        return [self.waitingTime.series(laneName, trafficLightType) for laneName in self.laneNames]
+
+    def _record_waiting_times(self, collector, series, step, numVehicles, lanes):
+        """
+        Records the average wait time of lanes that have vehicles
+
+        Parameters
+        ----------
+        collector
+            The collector to read the waiting times from
+        series
+            The lane series from _lane_series
+        step
+            The simulation step
+        numVehicles
+            The vehicle number of every lane
+        lanes
+            Indices of the lanes to record
+
+        Returns
+        -------
+        None
+        """
+        lanes = lanes[numVehicles[lanes] != 0]
+        waitingTimes = collector.waiting_times(lanes) / numVehicles[lanes]
+        for lane, waitingTime in zip(lanes.tolist(), waitingTimes.tolist()):
+            series[lane].append(step, waitingTime)
+
+    def _find_checkpoint(self, trafficLightType, warmStart):
+        """
+        Finds the checkpoint a run continues from
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light of the run
+        warmStart
+            A checkpoint file to fork the run from, None to use the latest
+            checkpoint of the run when resuming
+
+        Returns
+        -------
+        dict
+            The checkpoint from load_checkpoint, None to start from step 0
+        """
+        if warmStart is not None:
+            return load_checkpoint(warmStart)
+        checkpointFile = self.checkpointer.latest(trafficLightType) if self.resume else None
+        if checkpointFile is None:
+            # Starting over, older checkpoints are of another run
+            self.checkpointer.clear(trafficLightType)
+            return None
+        return load_checkpoint(checkpointFile)
+
+    def _restore_checkpoint(self, trafficLightType, checkpoint, warmStart):
+        """
+        Restores the wait times of a checkpoint, its SUMO state is loaded by _start_sumo
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light of the run
+        checkpoint
+            The checkpoint from _find_checkpoint
+        warmStart
+            Set if the run is forked from the checkpoint, its wait times are then left out
+
+        Returns
+        -------
+        int
+            The step to continue from
+        """
+        if not warmStart:
+            self.waitingTime.restore(trafficLightType, checkpoint["state"]["series"])
+        return checkpoint["step"]
+
+    def _save_checkpoint(self, trafficLightType, step, state, finished = False):
+        """
+        Saves the SUMO state and the wait times of a run with extra run state
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light of the run
+        step
+            Number of steps simulated
+        state
+            Controller state to save with the wait times
+        finished
+            Set if the run is done
+            Default is False
+
+        Returns
+        -------
+        None
+        """
+        state = dict(state, series=self.waitingTime.state(trafficLightType))
+        self.checkpointer.save(self.traci, trafficLightType, step, state, finished)
+
+    def generate_routefile(self, file_name, streaming = False, flows = False):
+        """
+        Generates the route files for sumo, or copies them from the result cache
+
+        With a demand profile or OD matrix the vehicles are always drawn by
+        the streaming generator
 
         Parameters
         ----------
         file_name
             The xml file name to write to
+            With streaming or flows, a name ending in ".gz" is gzipped
+        streaming
+            Set to draw the vehicles in vectorized batches with np.random.Generator
+            and stream them to the file instead of building the xml tree
+            The vehicles differ from the default generator for the same seed
+            Default is False
+        flows
+            Set to write Poisson flows that SUMO draws the vehicles from, one
+            per route and five minutes, so the file stays small for any demand
+            Default is False
 
         Returns
         -------
         None
         """
+        if self.resultCache is None:
+            self._write_routefile(file_name, streaming, flows)
+            return
+
+        # The route generators' sources are hashed too, so editing them invalidates the cached route files
+        demandProfile = None if self.demandProfile is None else np.asarray(self.demandProfile).tolist()
+        odMatrix = None if self.odMatrix is None else np.asarray(self.odMatrix).tolist()
+        key = result_key(kind="routes", seed=self.seed, numberOfCars=self.numberOfCars, steps=self.steps,
+                         demandProfile=demandProfile, odMatrix=odMatrix,
+                         streaming=streaming, flows=flows, compressed=file_name.endswith(".gz"),
+                         generator=source_hash(ROUTE_MODULES))
+        if not self.resultCache.get_file(key, "routes.xml", file_name):
+            self._write_routefile(file_name, streaming, flows)
+            self.resultCache.put_file(key, "routes.xml", file_name)
+
+    def _write_routefile(self, file_name, streaming, flows):
+        # Writing the route file, see generate_routefile
+        if flows or streaming or self.demandProfile is not None or self.odMatrix is not None:
+            rates = demand_rates(self.demandProfile, self.steps, self.numberOfCars)
+            probabilities = route_probabilities(self.odMatrix) if self.odMatrix is not None else None
+            if flows:
+                write_flow_routefile(file_name, rates, probabilities)
+            else:
+                stream_routefile(file_name, self.numberOfCars, self.steps, self.seed,
+                                 rates=rates, routeProbabilities=probabilities)
+            return
+
         # Setting up Random Seed
-        np.random.seed(SEED)
+        np.random.seed(self.seed)
 
         # Root routes
         routes = ET.Element("routes")
         # vType
         vType = ET.SubElement(routes, "vType")
-        vType.attrib = {
-            "id": "car",
-            "accel": "0.8",
-            "decel": "4.5",
-            "sigma": "0.5",
-            "length": "5",
-            "minGap": "2.5",
-            "maxSpeed": "25",
-            "guiShape": "passenger",
-        }
+        vType.attrib = dict(VTYPE)
 
         # Routes and edges
-        route_ids = ["right", "left", "down", "up", "right-up", "down-right", "left-down", "up-left"]
-        route_edges = ["E0 E1", "-E1 -E0", "E2 E3", "-E3 -E2", "E0 -E2", "E2 E1", "-E1 E3", "-E3 -E0"]
-        for id, edge in zip(route_ids, route_edges):
+        for id, edge in zip(ROUTE_IDS, ROUTE_EDGES):
             route = ET.Element("route")
             route.attrib = {
                 "id": id,
@@ -256,7 +757,7 @@ class TrafficSimulator:
             sys.stderr.write("XML indentation only works for python version 3.9 and above. Skipping\n")
         tree.write(file_name)
     
-    def run_fixed(self, cycleTime = -1):
+    def run_fixed(self, cycleTime = -1, warmStart = None):
         """
         Running the simulation with traffic light cycle time at a fixed time.
 
@@ -265,6 +766,10 @@ class TrafficSimulator:
         cycleTime
             The cycle time of the fixed timed traffic light
             Default is set to the value set during object creation
+        warmStart
+            A checkpoint file to start from, such as the end of a shared warm-up
+            The wait times before it are left out
+            Default is None, start from step 0 or the latest checkpoint when resuming
 
         Returns
         -------
@@ -274,129 +779,242 @@ class TrafficSimulator:
         if cycleTime == -1:
             cycleTime = self.fixedCycleTime
 
-        # Changing Cycle Time
-        tree = ET.parse("traffic.net.xml")
-        root = tree.getroot()
-        tlLogic = root.findall("tlLogic")[0]
-        tlLogic[0].attrib["duration"] = str(cycleTime)
-        tlLogic[2].attrib["duration"]= str(cycleTime)
-        tree.write('traffic.net.xml')
-
-        # Starting SUMO
-        traci.start([self.sumoBinary, "-c", "traffic.sumocfg",
-                                "--queue-output", "outputs/queue/queue.xml"])
+        # Answering from the result cache
+        resultKey = self._result_key("Fixed", cycleTime, warmStart)
+        if self._load_result("Fixed", resultKey):
+            return
+
+        # A finished run only has its wait times restored
+        checkpoint = self._find_checkpoint("Fixed", warmStart)
+        if checkpoint is not None and checkpoint["finished"] and warmStart is None:
+            self.waitingTime.restore("Fixed", checkpoint["state"]["series"])
+            self.lastRunSteps = checkpoint["step"]
+            return
+
+        # Starting SUMO and Changing Cycle Time
+        self._start_sumo("Fixed", checkpoint["stateFile"] if checkpoint is not None else None)
+        apply_cycle_time(self.traci, self.junctions, cycleTime, keepPhases=checkpoint is not None)
         step = 0
-
-        # Alias Lanes
-        lane1 = self.waitingTime["Lane 1"]["Fixed"]
-        lane2 = self.waitingTime["Lane 2"]["Fixed"]
-        lane3 = self.waitingTime["Lane 3"]["Fixed"]
-        lane4 = self.waitingTime["Lane 4"]["Fixed"]
-
-        while traci.simulation.getMinExpectedNumber() > 0:
-            traci.simulationStep()
-
-            numVehiclesLane1 = traci.lane.getLastStepVehicleNumber(self._lane1)
-            numVehiclesLane3 = traci.lane.getLastStepVehicleNumber(self._lane3)
-            numVehiclesLane2 = traci.lane.getLastStepVehicleNumber(self._lane2)
-            numVehiclesLane4 = traci.lane.getLastStepVehicleNumber(self._lane4)
-
-            if traci.trafficlight.getPhase("J2") == 0:
-                if numVehiclesLane1 != 0:
-                    lane1["steps"].append(step)
-                    lane1["waitTime"].append(traci.lane.getWaitingTime(self._lane1) / numVehiclesLane1)
-                    lane1["averageOvertime"].append(np.mean(lane1["waitTime"]))
-                if numVehiclesLane3 != 0:
-                    lane3["steps"].append(step)
-                    lane3["waitTime"].append(traci.lane.getWaitingTime(self._lane3) / numVehiclesLane3)
-                    lane3["averageOvertime"].append(np.mean(lane3["waitTime"]))
-
-            if traci.trafficlight.getPhase("J2") == 2:
-                if numVehiclesLane2 != 0:
-                    lane2["steps"].append(step)
-                    lane2["waitTime"].append(traci.lane.getWaitingTime(self._lane2) / numVehiclesLane2)
-                    lane2["averageOvertime"].append(np.mean(lane2["waitTime"]))
-                if numVehiclesLane4 != 0:
-                    lane4["steps"].append(step)
-                    lane4["waitTime"].append(traci.lane.getWaitingTime(self._lane4) / numVehiclesLane4)
-                    lane4["averageOvertime"].append(np.mean(lane4["waitTime"]))
+        if checkpoint is not None:
+            step = self._restore_checkpoint("Fixed", checkpoint, warmStart is not None)
+        collector = self._start_collector()
+        profiler = self._start_profiler("Fixed")
+        recorder = self._start_trace("Fixed", cycleTime)
+        if self.streamer is not None:
+            self.streamer.begin("Fixed", self.laneNames)
+
+        junctions = self.junctions
+        series = self._lane_series("Fixed")
+
+        while collector.min_expected_number() > 0:
+            profiler.begin()
+            self.traci.simulationStep()
+            profiler.lap(SIMULATION)
+            collector.update()
+
+            numVehicles = collector.vehicle_numbers()
+            phases = collector.phases()
+            profiler.lap(QUERY)
+
+            # Recording the lanes waiting at red during the green phases
+            green, red, control = junctions.phase_masks(phases)
+            self._record_waiting_times(collector, series, step, numVehicles,
+                                       junctions.lanes_in(red & control[:, None]))
+            if self.streamer is not None:
+                self.streamer.record(step, collector)
+            profiler.lap(METRICS)
+            profiler.end()
+
+            # Recording the trace outside the profiled step
+            if recorder is not None:
+                recorder.record(step, collector, numVehicles, phases, control,
+                                junctions.lane_sum(numVehicles, red), junctions.lane_sum(numVehicles, green))
 
             step += 1
-
-        traci.close()
+            if self.checkpointer.due(step):
+                self._save_checkpoint("Fixed", step, {})
+
+        profiler.stop()
+        if recorder is not None:
+            recorder.close()
+        if self.streamer is not None:
+            self.streamer.end(step)
+        if self.checkpointer.interval is not None:
+            self._save_checkpoint("Fixed", step, {}, finished=True)
+        self.lastRunSteps = step
+        self._store_result("Fixed", resultKey)
+        self.session.finish()
         sys.stdout.flush()
 
 
-    def run_fuzzy(self):
+    def run_fuzzy(self, cycleTime = -1, warmStart = None):
         """
         Running the simulation with Fuzzy Logic
 
+        Parameters
+        ----------
+        cycleTime
+            The green phase duration the fuzzy controller shortens from
+            Default is set to the fixed cycle time set during object creation
+        warmStart
+            A checkpoint file to start from, such as the end of a shared warm-up
+            The wait times before it are left out
+            Default is None, start from step 0 or the latest checkpoint when resuming
+
         Returns
         -------
         None
         """
-        # Starting SUMO
-        traci.start([self.sumoBinary, "-c", "traffic.sumocfg",
-                                "--queue-output", "outputs/queue/queue.xml"])
+        # Setting Cycle Time
+        if cycleTime == -1:
+            cycleTime = self.fixedCycleTime
 
+        # Answering from the result cache
+        resultKey = self._result_key("Fuzzy", cycleTime, warmStart)
+        if self._load_result("Fuzzy", resultKey):
+            return
+
+        # A finished run only has its wait times and decisions restored
+        checkpoint = self._find_checkpoint("Fuzzy", warmStart)
+        if checkpoint is not None and checkpoint["finished"] and warmStart is None:
+            self.waitingTime.restore("Fuzzy", checkpoint["state"]["series"])
+            self.decisionReports["Fuzzy"] = checkpoint["state"]["scheduler"].report()
+            self.lastRunSteps = checkpoint["step"]
+            return
+
+        # Starting SUMO and Changing Cycle Time
+        self._start_sumo("Fuzzy", checkpoint["stateFile"] if checkpoint is not None else None)
+        apply_cycle_time(self.traci, self.junctions, cycleTime, keepPhases=checkpoint is not None)
         step = 0
-        fuzzyLogic = fuzzy_logic_controller()
-
-        # Alias Lanes
-        lane1 = self.waitingTime["Lane 1"]["Fuzzy"]
-        lane2 = self.waitingTime["Lane 2"]["Fuzzy"]
-        lane3 = self.waitingTime["Lane 3"]["Fuzzy"]
-        lane4 = self.waitingTime["Lane 4"]["Fuzzy"]
-
-        while traci.simulation.getMinExpectedNumber() > 0:
-            traci.simulationStep()
-
-            numVehiclesLane1 = traci.lane.getLastStepVehicleNumber(self._lane1)
-            numVehiclesLane3 = traci.lane.getLastStepVehicleNumber(self._lane3)
-            numVehiclesLane2 = traci.lane.getLastStepVehicleNumber(self._lane2)
-            numVehiclesLane4 = traci.lane.getLastStepVehicleNumber(self._lane4)        
-
-            if traci.trafficlight.getPhase("J2") == 0:
-                fuzzyLogic.input['arrivingVehicles'] = numVehiclesLane1 + numVehiclesLane3
-                fuzzyLogic.input['queuingVehicles'] = numVehiclesLane2 + numVehiclesLane4
-
-                if numVehiclesLane1 != 0:
-                    lane1["steps"].append(step)
-                    lane1["waitTime"].append(traci.lane.getWaitingTime(self._lane1) / numVehiclesLane1)
-                    lane1["averageOvertime"].append(np.mean(lane1["waitTime"]))
-                if numVehiclesLane3 != 0:
-                    lane3["steps"].append(step)
-                    lane3["waitTime"].append(traci.lane.getWaitingTime(self._lane3) / numVehiclesLane3)
-                    lane3["averageOvertime"].append(np.mean(lane3["waitTime"]))
-
-            if traci.trafficlight.getPhase("J2") == 2:
-                fuzzyLogic.input['arrivingVehicles'] = numVehiclesLane2 + numVehiclesLane4
-                fuzzyLogic.input['queuingVehicles'] = numVehiclesLane1 + numVehiclesLane3
-
-                if numVehiclesLane2 != 0:
-                    lane2["steps"].append(step)
-                    lane2["waitTime"].append(traci.lane.getWaitingTime(self._lane2) / numVehiclesLane2)
-                    lane2["averageOvertime"].append(np.mean(lane2["waitTime"]))
-                if numVehiclesLane4 != 0:
-                    lane4["steps"].append(step)
-                    lane4["waitTime"].append(traci.lane.getWaitingTime(self._lane4) / numVehiclesLane4)
-                    lane4["averageOvertime"].append(np.mean(lane4["waitTime"]))
-
-            fuzzyLogic.compute()
-            output = fuzzyLogic.output['cycleTime']
-            phase = traci.trafficlight.getPhase('J2')
-
-            if (phase == 0 or phase == 2):
-                remainingDuration = traci.trafficlight.getNextSwitch('J2') - traci.simulation.getTime()
-                traci.trafficlight.setPhaseDuration('J2', min(remainingDuration, output))
-            
-            step += 1
+        scheduler = DecisionScheduler(len(self.junctions), self.decisionThreshold, self.decisionInterval)
+        if checkpoint is not None:
+            step = self._restore_checkpoint("Fuzzy", checkpoint, warmStart is not None)
+            # The controller keeps its last decisions when resuming
+            if warmStart is None:
+                scheduler = checkpoint["state"]["scheduler"]
+        collector = self._start_collector()
+        profiler = self._start_profiler("Fuzzy")
+        recorder = self._start_trace("Fuzzy", cycleTime)
+        if self.streamer is not None:
+            self.streamer.begin("Fuzzy", self.laneNames)
+
+        if self.compiledFuzzy:
+            fuzzyLogic = compiled_fuzzy_logic_controller(self.membershipFunctions)
+        else:
+            fuzzyLogic = fuzzy_logic_controller(self.membershipFunctions)
+
+        junctions = self.junctions
+        trafficLights = junctions.trafficLights
+        series = self._lane_series("Fuzzy")
+
+        while collector.min_expected_number() > 0:
+            profiler.begin()
+            self.traci.simulationStep()
+            profiler.lap(SIMULATION)
+            collector.update()
+
+            numVehicles = collector.vehicle_numbers()
+            phases = collector.phases()
+            profiler.lap(QUERY)
+
+            # Recording the lanes waiting at red during the green phases
+            green, red, control = junctions.phase_masks(phases)
+            self._record_waiting_times(collector, series, step, numVehicles,
+                                       junctions.lanes_in(red & control[:, None]))
+            if self.streamer is not None:
+                self.streamer.record(step, collector)
+            profiler.lap(METRICS)
+
+            # Evaluating the junctions due a decision at once, red lanes are arriving and green lanes queuing
+            arrivingVehicles = junctions.lane_sum(numVehicles, red)
+            queuingVehicles = junctions.lane_sum(numVehicles, green)
+            due = scheduler.due(step, phases, control, arrivingVehicles, queuingVehicles)
+            if len(due) > 0:
+                output = batch_compute(fuzzyLogic, arrivingVehicles[due], queuingVehicles[due])
+                remainingDuration = collector.next_switches(due) - collector.time()
+                shortened, phaseDuration = scheduler.decide(step, due, arrivingVehicles[due], queuingVehicles[due],
+                                                            output, remainingDuration)
+                for j, duration in zip(shortened.tolist(), phaseDuration.tolist()):
+                    self.traci.trafficlight.setPhaseDuration(trafficLights[j], duration)
+            profiler.lap(CONTROL)
+            profiler.end()
+
+            # Recording the trace outside the profiled step
+            if recorder is not None:
+                recorder.record(step, collector, numVehicles, phases, control, arrivingVehicles, queuingVehicles,
+                                scheduler.output)
 
-        traci.close()
+            step += 1
+            if self.checkpointer.due(step):
+                self._save_checkpoint("Fuzzy", step, {"scheduler": scheduler})
+
+        profiler.stop()
+        if recorder is not None:
+            recorder.close()
+        if self.streamer is not None:
+            self.streamer.end(step)
+        if self.checkpointer.interval is not None:
+            self._save_checkpoint("Fuzzy", step, {"scheduler": scheduler}, finished=True)
+        self.decisionReports["Fuzzy"] = scheduler.report()
+        self.lastRunSteps = step
+        self._store_result("Fuzzy", resultKey)
+        self.session.finish()
         sys.stdout.flush()
 
 
-    def generate_output_statistics(self, trafficLightType, showGraph = True, singular = False, average = False):
+    def close(self):
+        """
+        Closes SUMO if it was kept running
+
+        Returns
+        -------
+        None
+        """
+        self.session.close()
+
+    def generate_trip_statistics(self, trafficLightType):
+        """
+        Summarises the vehicle trips and lane queues SUMO wrote for a traffic light type
+
+        The tripinfo and queue outputs are streamed, so any run length fits in memory.
+        SUMO only finishes writing them when it is reloaded or closed, so call
+        this after the next run or close()
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light
+            It can be "Fixed or "Fuzzy"
+
+        Returns
+        -------
+        dict
+            Per vehicle travel time, delay, waiting time and depart delay and
+            the queue length of each lane, see trips.summarise
+        """
+        statisticsDir = os.path.join(self.outputDir, "statistics")
+        if not os.path.exists(statisticsDir):
+            os.makedirs(statisticsDir)
+        reportFile = os.path.join(statisticsDir, f"trips-{trafficLightType}.json")
+
+        # Runs answered from the result cache wrote no outputs, their report is cached instead
+        key, simulated = self.resultKeys.get(trafficLightType, (None, True))
+        if key is not None and not simulated:
+            report = self.resultCache.get(key, "trips.pkl")
+            if report is not None:
+                with open(reportFile, 'w', encoding='utf-8') as jsonFile:
+                    json.dump(report, jsonFile, indent=2)
+                return report
+
+        report = write_trip_report(self._output_file("tripinfo", trafficLightType),
+                                   self._output_file("queue", trafficLightType),
+                                   reportFile, self.junctions.lanes)
+        if key is not None and simulated:
+            self.resultCache.put(key, report, "trips.pkl")
+        return report
+
+    def generate_output_statistics(self, trafficLightType, showGraph = True, singular = False, average = False,
+                                   exportFormats = ("npz",)):
 
         """
         Generating Statistics for a specific traffic light type
@@ -415,31 +1033,47 @@ class TrafficSimulator:
         average
             Determines if the graph is going to be average of wait time over time or not
             Default is False
+        exportFormats
+            Bulk formats to also write every lane and traffic light type to
+            Any of "npz", "npy" and "parquet"
+            Default is ("npz",)
 
         Returns
         -------
         None
         """
-        # Writing csv to file
-        array2csv(["timestep", "waitingtime-lane1"], self.waitingTime["Lane 1"][trafficLightType],
-                  f"outputs/statistics/waitingtime-{trafficLightType}-lane1.csv")
-        array2csv(["timestep", "waitingtime-lane2"], self.waitingTime["Lane 2"][trafficLightType],
-                  f"outputs/statistics/waitingtime-{trafficLightType}-lane2.csv")
-        array2csv(["timestep", "waitingtime-lane3"], self.waitingTime["Lane 3"][trafficLightType],
-                  f"outputs/statistics/waitingtime-{trafficLightType}-lane3.csv")
-        array2csv(["timestep", "waitingtime-lane4"], self.waitingTime["Lane 4"][trafficLightType],
-                  f"outputs/statistics/waitingtime-{trafficLightType}-lane4.csv")
+        statisticsDir = os.path.join(self.outputDir, "statistics")
+        if not os.path.exists(statisticsDir):
+            os.makedirs(statisticsDir)
 
+        # Writing csv to file
+        for lane in self.waitingTime.lanes:
+            laneName = lane.lower().replace(" ", "")
+            array2csv(["timestep", f"waitingtime-{laneName}", f"averagewaitingtime-{laneName}"],
+                      self.waitingTime.view(lane, trafficLightType),
+                      os.path.join(statisticsDir, f"waitingtime-{trafficLightType}-{laneName}.csv"))
+
+        # Writing every lane and traffic light type in bulk
+        export_metrics(self.waitingTime, statisticsDir, formats=exportFormats)
+
+        # Writing the decisions of the controller
+        if trafficLightType in self.decisionReports:
+            with open(os.path.join(statisticsDir, f"decisions-{trafficLightType}.json"), 'w',
+                      encoding='utf-8') as reportFile:
+                json.dump(self.decisionReports[trafficLightType], reportFile, indent=2)
+
+        # Writing the step timings of the run
+        if trafficLightType in self.profilers:
+            self.profilers[trafficLightType].write_summary(
+                os.path.join(statisticsDir, f"profile-{trafficLightType}.json"))
 
         # Plotting the graph
         if showGraph:
             if singular:
-                plot_graph(self.waitingTime["Lane 1"][trafficLightType], "Lane 1", average)
-                plot_graph(self.waitingTime["Lane 2"][trafficLightType], "Lane 2", average)
-                plot_graph(self.waitingTime["Lane 3"][trafficLightType], "Lane 3", average)
-                plot_graph(self.waitingTime["Lane 4"][trafficLightType], "Lane 4", average)
+                for lane in self.waitingTime.lanes:
+                    plot_graph(self.waitingTime.view(lane, trafficLightType), lane, average)
             else:
-                plot_graphs(self.waitingTime, trafficLightType, average)
+                plot_graphs(self.waitingTime.views(trafficLightType), average)
 
     def find_90th_percentile(self):
         """
@@ -455,34 +1089,22 @@ class TrafficSimulator:
             The average of the 90th percentile of all the lanes
             {Fixed, Fuzzy}
         """
-        # Finding 90th percentile
-        for lane in self.waitingTime.values():
-            # Skipping All
-            if len(lane["Fixed"]["waitTime"]) == 1:
-                continue
-            # Finding 90th percentile
-            lane["Fixed"]["90th percentile"] = np.percentile(lane["Fixed"]["waitTime"], 90)
-            lane["Fuzzy"]["90th percentile"] = np.percentile(lane["Fuzzy"]["waitTime"], 90)
-
-        # Putting all 90th percentile into an array
-        all_mean_fixed = []
-        all_mean_fuzzy = []
-        for lane in self.waitingTime.values():
-            # Skipping All
-            if len(lane["Fixed"]["waitTime"]) == 1:
-                continue
-            # Appending to array
-            all_mean_fixed.append(lane["Fixed"]["90th percentile"])
-            all_mean_fuzzy.append(lane["Fuzzy"]["90th percentile"])
-
-        # Finding mean of All
-        self.waitingTime["All"]["Fixed"]["90th percentile"] = np.mean(all_mean_fixed)
-        self.waitingTime["All"]["Fuzzy"]["90th percentile"] = np.mean(all_mean_fuzzy)
+        # Finding 90th percentile of each lane
+        lanes = self.waitingTime.lanes
+        for lane in lanes:
+            for trafficLightType in ["Fixed", "Fuzzy"]:
+                statistics = self.waitingTime.statistics(lane, trafficLightType)
+                self.percentile90[lane][trafficLightType] = statistics.percentile(90)
+
+        # Finding mean of All, lanes without samples are left out
+        for trafficLightType in ["Fixed", "Fuzzy"]:
+            self.percentile90["All"][trafficLightType] = np.nanmean(
+                [self.percentile90[lane][trafficLightType] for lane in lanes])
 
         # Saving into dictionary
         average = {
-            "Fixed": self.waitingTime["All"]["Fixed"]["90th percentile"],
-            "Fuzzy": self.waitingTime["All"]["Fuzzy"]["90th percentile"],
+            "Fixed": self.percentile90["All"]["Fixed"],
+            "Fuzzy": self.percentile90["All"]["Fuzzy"],
         }
         return average
 
@@ -495,7 +1117,7 @@ class TrafficSimulator:
         ---------
         lane
             The lane to return
-            Can be "Lane 1" to "Lane 4" or "All"
+            Can be a lane name such as "Lane 1" or "All"
 
         Returns
         -------
@@ -504,8 +1126,8 @@ class TrafficSimulator:
             {Fixed, Fuzzy}
         """
         percentile = {
-            "Fixed": self.waitingTime[lane]["Fixed"]["90th percentile"],
-            "Fuzzy": self.waitingTime[lane]["Fuzzy"]["90th percentile"],
+            "Fixed": self.percentile90[lane]["Fixed"],
+            "Fuzzy": self.percentile90[lane]["Fuzzy"],
         }
         return percentile
 
@@ -514,17 +1136,74 @@ class TrafficSimulator:
 # this is the main entry point of this script
 if __name__ == "__main__":
     options, args = optParser.parse_args()
-    traffic = TrafficSimulator(N, STEPS, options.nogui)
+    init(options.backend)
+    demandProfile, odMatrix = load_demand(options.demand) if options.demand else (None, None)
+    parameters = {}
+    if options.parameters:
+        with open(options.parameters, encoding='utf-8') as parametersFile:
+            parameters = json.load(parametersFile)
+    traffic = TrafficSimulator(N, STEPS, options.nogui, compiledFuzzy=options.compiled,
+                               fixedCycleTime=parameters.get("fixedCycleTime", 42),
+                               membershipFunctions=parameters.get("membershipFunctions"),
+                               demandProfile=demandProfile, odMatrix=odMatrix,
+                               collector="polling" if options.polling else "subscription",
+                               backend=options.backend, profile=options.profile or options.cprofile,
+                               cprofile=options.cprofile, decisionThreshold=options.decisionThreshold,
+                               decisionInterval=options.decisionInterval, keepAlive=not options.restart,
+                               checkpointInterval=options.checkpointInterval, resume=options.resume,
+                               traceDir=os.path.join(output_dir, "traces") if options.trace else None,
+                               resultCache=None if options.noCache else ResultCache(
+                                   maxBytes=options.cacheSize * 1024 ** 2))
+
+    # Checking the compiled fuzzy controller against skfuzzy
+    if options.verify:
+        error = verify_compiled_controller(compiled_fuzzy_logic_controller(traffic.membershipFunctions),
+                                           traffic.membershipFunctions)
+        print(f"Compiled fuzzy controller matches skfuzzy within {error:.3f} s")
 
     # first, generate the route file for this simulation
-    traffic.generate_routefile("traffic.rou.xml")
+    traffic.generate_routefile(traffic.routeFile, streaming=options.streaming, flows=options.flows)
 
     # this is the normal way of using traci. sumo is started as a
     # subprocess and then the python script connects and runs
 
-    traffic.run_fixed()
-    traffic.generate_output_statistics("Fixed")
-    traffic.run_fuzzy()
-    traffic.generate_output_statistics("Fuzzy")
+    traffic.run_fixed(warmStart=options.warmStart)
+    exportFormats = options.export.split(",") if options.export else []
+    traffic.generate_output_statistics("Fixed", showGraph=not options.headless, exportFormats=exportFormats)
+    traffic.run_fuzzy(warmStart=options.warmStart)
+    traffic.close()
+    traffic.generate_output_statistics("Fuzzy", showGraph=not options.headless, exportFormats=exportFormats)
+
+    # Rendering the graphs to files once both simulations are done
+    if options.headless:
+        render_figures(traffic.waitingTime, os.path.join(traffic.outputDir, "figures"),
+                       formats=options.figureFormats.split(","))
+    # Summarising the trips of both runs now SUMO has written them out
+    for trafficLightType in ["Fixed", "Fuzzy"]:
+        trips = traffic.generate_trip_statistics(trafficLightType).get("trips")
+        if trips:
+            print(f"{trafficLightType} trips: {trips['delay']['count']} vehicles, "
+                  f"delay mean {format_value(trips['delay']['mean'])} s, "
+                  f"90th percentile {format_value(trips['delay']['p90'])} s")
+
+    # Reporting the time spent starting SUMO apart from simulating
+    timings = traffic.session.timings()
+    print(f"SUMO started {timings['starts']} and reloaded {timings['loads']} times, "
+          f"startup {timings['startupTime']:.2f} s, simulation {timings['simulationTime']:.2f} s")
+
+    if traffic.resultCache is not None:
+        print(f"Result cache {traffic.resultCache.hits} hits, {traffic.resultCache.misses} misses")
+
+    # Reporting the decisions the fuzzy controller skipped
+    report = traffic.decisionReports["Fuzzy"]
+    print(f"Fuzzy controller decided {report['decisions']} of {report['controlSteps']} junction steps "
+          f"({report['skippedDecisions']} skipped), sent {report['phaseDurationCalls']} phase durations "
+          f"({report['skippedPhaseDurationCalls']} skipped)")
+
+    # Reporting the step timings
+    for trafficLightType, profiler in traffic.profilers.items():
+        summary = profiler.summary()
+        print(f"{trafficLightType}: {summary['stepsPerSecond']:.0f} steps/s, mean ns per step " +
+              ", ".join(f"{phase} {times['mean']:.0f}" for phase, times in summary["phases"].items()))
     traffic.find_90th_percentile()
     print(traffic.get_90th_percentile("Lane 1"))
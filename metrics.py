@@ -0,0 +1,230 @@
+import numpy as np
+from running_statistics import RunningStatistics
+
+# One wait time sample, 12 bytes instead of three boxed Python floats in lists
+SAMPLE_DTYPE = np.dtype([
+    ("steps", np.int32),
+    ("waitTime", np.float32),
+    ("averageOvertime", np.float32),
+])
+
+
+class MetricSeries:
+    """
+    Preallocated column store of the wait time samples of one lane
+
+    The array doubles when full, so appending is amortized O(1). With
+    maxSamples it stops growing and becomes a ring buffer that overwrites
+    its oldest samples, the running statistics still cover every sample
+
+    Parameters
+    ----------
+    capacity
+        Number of samples to preallocate
+    maxSamples
+        Number of most recent samples to keep
+        Default is None, keep every sample
+    """
+    def __init__(self, capacity = 1024, maxSamples = None):
+        if maxSamples is not None:
+            capacity = min(capacity, maxSamples)
+        self._data = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+        self._size = 0
+        self._start = 0
+        self.maxSamples = maxSamples
+        self.dropped = 0
+        self.statistics = RunningStatistics()
+
+    def __len__(self):
+        return self._size
+
+    def append(self, step, waitTime):
+        """
+        Adds a sample and updates the running statistics
+
+        Parameters
+        ----------
+        step
+            The simulation step of the sample
+        waitTime
+            The average waiting time in the lane
+
+        Returns
+        -------
+        None
+        """
+        self.statistics.add(waitTime)
+        sample = (step, waitTime, self.statistics.mean)
+
+        # Overwriting the oldest sample once the ring is full
+        if self._size == self.maxSamples:
+            self._data[self._start] = sample
+            self._start = (self._start + 1) % self._size
+            self.dropped += 1
+            return
+
+        if self._size == len(self._data):
+            grownCapacity = 2 * len(self._data)
+            if self.maxSamples is not None:
+                grownCapacity = min(grownCapacity, self.maxSamples)
+            grown = np.zeros(grownCapacity, dtype=SAMPLE_DTYPE)
+            grown[:self._size] = self._data
+            self._data = grown
+
+        self._data[self._size] = sample
+        self._size += 1
+
+    def view(self):
+        """
+        Gets the samples without copying them
+
+        Returns
+        -------
+        ndarray
+            Structured array with "steps", "waitTime" and "averageOvertime" fields
+            Only valid until the next append, a copy once a ring buffer wrapped
+        """
+        if self._start == 0:
+            return self._data[:self._size]
+        return np.concatenate((self._data[self._start:self._size], self._data[:self._start]))
+
+    def __getstate__(self):
+        # Pickling only the samples, not the preallocated space after them
+        state = dict(self.__dict__)
+        state["_data"] = self._data[:max(self._size, 1)].copy()
+        return state
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+
+class MetricsStore:
+    """
+    Wait time samples of every lane for every traffic light type
+
+    Parameters
+    ----------
+    lanes
+        The lane names
+    controllers
+        The traffic light types
+    capacity
+        Number of samples to preallocate per lane and traffic light type
+    maxSamples
+        Number of most recent samples kept per lane and traffic light type, see MetricSeries
+        Default is None, keep every sample
+    """
+    def __init__(self, lanes, controllers = ("Fixed", "Fuzzy"), capacity = 1024, maxSamples = None):
+        self.lanes = list(lanes)
+        self.controllers = list(controllers)
+        self._series = {lane: {controller: MetricSeries(capacity, maxSamples) for controller in self.controllers}
+                        for lane in self.lanes}
+
+    def series(self, lane, controller):
+        """
+        Gets the series to append samples to
+
+        Parameters
+        ----------
+        lane
+            The lane name
+        controller
+            The traffic light type
+
+        Returns
+        -------
+        MetricSeries
+            The series
+        """
+        return self._series[lane][controller]
+
+    def view(self, lane, controller):
+        """
+        Gets the samples of a lane without copying them
+
+        Parameters
+        ----------
+        lane
+            The lane name
+        controller
+            The traffic light type
+
+        Returns
+        -------
+        ndarray
+            Structured array with "steps", "waitTime" and "averageOvertime" fields
+        """
+        return self._series[lane][controller].view()
+
+    def views(self, controller):
+        """
+        Gets the samples of every lane for a traffic light type without copying them
+
+        Parameters
+        ----------
+        controller
+            The traffic light type
+
+        Returns
+        -------
+        dict
+            Structured array of each lane, in lane order
+        """
+        return {lane: self._series[lane][controller].view() for lane in self.lanes}
+
+    def statistics(self, lane, controller):
+        """
+        Gets the running statistics of a lane
+
+        Parameters
+        ----------
+        lane
+            The lane name
+        controller
+            The traffic light type
+
+        Returns
+        -------
+        RunningStatistics
+            The running statistics
+        """
+        return self._series[lane][controller].statistics
+
+    def state(self, controller):
+        """
+        Gets the series of every lane for a traffic light type, to checkpoint
+
+        Parameters
+        ----------
+        controller
+            The traffic light type
+
+        Returns
+        -------
+        dict
+            The MetricSeries of each lane
+        """
+        return {lane: self._series[lane][controller] for lane in self.lanes}
+
+    def restore(self, controller, state):
+        """
+        Replaces the series of a traffic light type with checkpointed ones
+
+        Parameters
+        ----------
+        controller
+            The traffic light type
+        state
+            The MetricSeries of each lane, from state
+
+        Returns
+        -------
+        None
+        """
+        for lane in self.lanes:
+            self._series[lane][controller] = state[lane]
+
+    @property
+    def nbytes(self):
+        return sum(series.nbytes for lane in self._series.values() for series in lane.values())
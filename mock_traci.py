@@ -0,0 +1,475 @@
+import gzip
+import math
+import pickle
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+import numpy as np
+
+# Variable ids used by the subscriptions, the same values as traci.constants
+constants = SimpleNamespace(
+    LAST_STEP_VEHICLE_NUMBER=0x10,
+    VAR_WAITING_TIME=0x7a,
+    TL_CURRENT_PHASE=0x28,
+    TL_NEXT_SWITCH=0x2d,
+    VAR_TIME=0x66,
+    VAR_MIN_EXPECTED_VEHICLES=0x7d,
+)
+
+# ------- Queue Model Parameters -------
+# Vehicles discharged per second from the stop line of a green lane
+SATURATION_FLOW = 0.5
+# Space taken by a stopped vehicle, length plus minGap of the car vType
+VEHICLE_SPACING = 7.5
+# Time for a discharged vehicle to clear the junction and leave the network
+EXIT_TIME = 8
+# Seed of the departures drawn for flows, SUMO's default --seed
+FLOW_SEED = 23423
+
+
+def _open_xml(file_name):
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, 'rb')
+    return open(file_name, 'rb')
+
+
+def _flow_departures(attrib, rng):
+    """
+    Draws the departures of a flow element
+
+    Parameters
+    ----------
+    attrib
+        The attributes of the flow, with begin, end and either period,
+        period="exp(rate)" for Poisson departures or vehsPerHour
+    rng
+        The np.random.Generator to draw Poisson departures with
+
+    Returns
+    -------
+    ndarray
+        The depart times
+    """
+    begin = float(attrib.get("begin", 0))
+    end = float(attrib.get("end", begin + 3600))
+    period = attrib.get("period", "")
+    if period.startswith("exp("):
+        # Poisson arrivals, the count is Poisson and the times uniform
+        rate = float(period[len("exp("):-1])
+        return np.sort(rng.uniform(begin, end, rng.poisson(rate * (end - begin))))
+    if "vehsPerHour" in attrib:
+        period = 3600 / float(attrib["vehsPerHour"])
+    return np.arange(begin, end, float(period))
+
+
+def _parse_args(args):
+    """
+    Finds the network, route and state files in SUMO command line arguments
+
+    Parameters
+    ----------
+    args
+        SUMO arguments, the binary may be included
+
+    Returns
+    -------
+    tuple
+        The network file, list of route files and the state file to load, None if there is none
+    """
+    netFile = None
+    routeFiles = []
+    stateFile = None
+    for option, value in zip(args, args[1:]):
+        if option in ("-c", "--configuration-file"):
+            config = ET.parse(value).getroot()
+            for element in config.iter():
+                if element.tag == "net-file":
+                    netFile = element.attrib["value"]
+                if element.tag == "route-files":
+                    routeFiles = element.attrib["value"].split(",")
+    for option, value in zip(args, args[1:]):
+        if option in ("-n", "--net-file"):
+            netFile = value
+        if option in ("-r", "--route-files"):
+            routeFiles = value.split(",")
+        if option == "--load-state":
+            stateFile = value
+    return netFile, routeFiles, stateFile
+
+
+class _Domain:
+    """
+    Subscription handling shared by the lane and traffic light domains
+    """
+    def __init__(self, model):
+        self._model = model
+        self._subscriptions = {}
+
+    def subscribe(self, objectID, varIDs):
+        self._subscriptions[objectID] = tuple(varIDs)
+        return self.getSubscriptionResults(objectID)
+
+    def getSubscriptionResults(self, objectID):
+        return {varID: self._getters[varID](objectID) for varID in self._subscriptions[objectID]}
+
+    def getAllSubscriptionResults(self):
+        return {objectID: self.getSubscriptionResults(objectID) for objectID in self._subscriptions}
+
+
+class _LaneDomain(_Domain):
+    def __init__(self, model):
+        super().__init__(model)
+        self._getters = {
+            constants.LAST_STEP_VEHICLE_NUMBER: self.getLastStepVehicleNumber,
+            constants.VAR_WAITING_TIME: self.getWaitingTime,
+        }
+
+    def getLastStepVehicleNumber(self, laneID):
+        return int(self._model.vehicleNumber[self._model.laneIndex[laneID]])
+
+    def getWaitingTime(self, laneID):
+        return float(self._model.waitingTime[self._model.laneIndex[laneID]])
+
+
+class Phase:
+    """
+    A traffic light phase, as traci.trafficlight.Phase
+    """
+    def __init__(self, duration, state, minDur = None, maxDur = None, next = (), name = ""):
+        self.duration = duration
+        self.state = state
+        self.minDur = minDur if minDur is not None else duration
+        self.maxDur = maxDur if maxDur is not None else duration
+        self.next = next
+        self.name = name
+
+
+class Logic:
+    """
+    A traffic light program, as traci.trafficlight.Logic
+    """
+    def __init__(self, programID, type, currentPhaseIndex, phases = None, subParameter = None):
+        self.programID = programID
+        self.type = type
+        self.currentPhaseIndex = currentPhaseIndex
+        self.phases = phases if phases is not None else []
+        self.subParameter = subParameter if subParameter is not None else {}
+
+
+class _TrafficLightDomain(_Domain):
+    Phase = Phase
+    Logic = Logic
+
+    def __init__(self, model):
+        super().__init__(model)
+        self._getters = {
+            constants.TL_CURRENT_PHASE: self.getPhase,
+            constants.TL_NEXT_SWITCH: self.getNextSwitch,
+        }
+
+    def getPhase(self, tlsID):
+        return int(self._model.phase[self._model.trafficLightIndex[tlsID]])
+
+    def getNextSwitch(self, tlsID):
+        return float(self._model.nextSwitch[self._model.trafficLightIndex[tlsID]])
+
+    def setPhaseDuration(self, tlsID, phaseDuration):
+        self._model.nextSwitch[self._model.trafficLightIndex[tlsID]] = self._model.time + phaseDuration
+
+    def setProgramLogic(self, tlsID, logic):
+        # Only the durations are taken, the signal states stay those of the network file
+        model = self._model
+        t = model.trafficLightIndex[tlsID]
+        durations = [phase.duration for phase in logic.phases]
+        model.durations[t, :len(durations)] = durations
+        model.phase[t] = logic.currentPhaseIndex
+        model.nextSwitch[t] = model.time + durations[logic.currentPhaseIndex]
+
+
+class _SimulationDomain:
+    def __init__(self, model):
+        self._model = model
+        self._subscription = ()
+        self._getters = {
+            constants.VAR_TIME: self.getTime,
+            constants.VAR_MIN_EXPECTED_VEHICLES: self.getMinExpectedNumber,
+        }
+
+    def getTime(self):
+        return float(self._model.time)
+
+    def getMinExpectedNumber(self):
+        return self._model.min_expected_number()
+
+    def subscribe(self, varIDs):
+        self._subscription = tuple(varIDs)
+        return self.getSubscriptionResults()
+
+    def getSubscriptionResults(self):
+        return {varID: self._getters[varID]() for varID in self._subscription}
+
+    def saveState(self, fileName):
+        self._model.save_state(fileName)
+
+
+class QueueModelTraci:
+    """
+    Stand-in for the traci module backed by a vectorized queue model
+
+    Reads the lanes, traffic light programs and signal links from the
+    network file and the vehicles from the route files. Each vehicle joins
+    the first lane of its route at its depart time, reaches the stop line
+    after driving the lane at its speed limit and queues until its lane is
+    green, when the queue discharges at SATURATION_FLOW. All lanes and
+    traffic lights are stepped together with NumPy
+
+    Only covers the calls TrafficSimulator makes, see backends.py
+    """
+    constants = constants
+
+    def __init__(self):
+        self.lane = _LaneDomain(self)
+        self.trafficlight = _TrafficLightDomain(self)
+        self.simulation = _SimulationDomain(self)
+        self._loaded = False
+
+    # ------- Setup -------
+    def start(self, cmd, label = "default", **kwargs):
+        """
+        Loads the network and route files named in SUMO command line arguments
+        and the state file given with --load-state
+
+        Parameters
+        ----------
+        cmd
+            SUMO command line, including the binary
+        label
+            Ignored, every QueueModelTraci is its own connection
+
+        Returns
+        -------
+        None
+        """
+        netFile, routeFiles, stateFile = _parse_args(list(cmd))
+        self._load_network(netFile)
+        self._load_routes(routeFiles)
+        self._reset()
+        if stateFile is not None:
+            self.load_state(stateFile)
+        self._loaded = True
+
+    def load(self, args):
+        """
+        Reloads the model with new SUMO arguments, as traci.load
+
+        Parameters
+        ----------
+        args
+            SUMO command line, without the binary
+
+        Returns
+        -------
+        None
+        """
+        self.close()
+        self.start(list(args))
+
+    def close(self):
+        self._loaded = False
+        self.lane = _LaneDomain(self)
+        self.trafficlight = _TrafficLightDomain(self)
+        self.simulation = _SimulationDomain(self)
+
+    def _load_network(self, netFile):
+        root = ET.parse(netFile).getroot()
+
+        # Normal lanes and their free flow travel time
+        self.laneIds = []
+        travelTimes = []
+        capacities = []
+        for edge in root.findall("edge"):
+            if edge.attrib.get("function") == "internal":
+                continue
+            for lane in edge.findall("lane"):
+                length = float(lane.attrib["length"])
+                self.laneIds.append(lane.attrib["id"])
+                travelTimes.append(math.ceil(length / float(lane.attrib["speed"])))
+                capacities.append(max(1, int(length // VEHICLE_SPACING)))
+        self.laneIndex = {laneId: i for i, laneId in enumerate(self.laneIds)}
+        self.travelTime = np.array(travelTimes)
+        self.capacity = np.array(capacities)
+
+        # Traffic light programs
+        tlLogics = root.findall("tlLogic")
+        self.trafficLightIds = [tlLogic.attrib["id"] for tlLogic in tlLogics]
+        self.trafficLightIndex = {tlsID: i for i, tlsID in enumerate(self.trafficLightIds)}
+        maxPhases = max([len(tlLogic.findall("phase")) for tlLogic in tlLogics], default=1)
+        self.numPhases = np.array([len(tlLogic.findall("phase")) for tlLogic in tlLogics], dtype=int)
+        self.durations = np.ones((len(tlLogics), maxPhases))
+        states = []
+        for i, tlLogic in enumerate(tlLogics):
+            phases = tlLogic.findall("phase")
+            self.durations[i, :len(phases)] = [float(phase.attrib["duration"]) for phase in phases]
+            states.append([phase.attrib["state"] for phase in phases])
+
+        # A lane is green in a phase if any of its signal links is
+        # The last column is for lanes without a traffic light, always green
+        self.laneTrafficLight = np.full(len(self.laneIds), len(tlLogics), dtype=int)
+        self.laneGreen = np.zeros((len(self.laneIds), maxPhases), dtype=bool)
+        for connection in root.findall("connection"):
+            tlsID = connection.attrib.get("tl")
+            if tlsID is None or connection.attrib["from"].startswith(":"):
+                continue
+            laneId = f'{connection.attrib["from"]}_{connection.attrib["fromLane"]}'
+            t = self.trafficLightIndex[tlsID]
+            l = self.laneIndex[laneId]
+            linkIndex = int(connection.attrib["linkIndex"])
+            self.laneTrafficLight[l] = t
+            for p, state in enumerate(states[t]):
+                if state[linkIndex] in "Gg":
+                    self.laneGreen[l, p] = True
+        self._uncontrolled = self.laneTrafficLight == len(tlLogics)
+
+    def _load_routes(self, routeFiles):
+        routes = {}
+        departures = [[] for _ in self.laneIds]
+        rng = np.random.default_rng(FLOW_SEED)
+        for routeFile in routeFiles:
+            with _open_xml(routeFile) as xmlFile:
+                for event, element in ET.iterparse(xmlFile, events=("end",)):
+                    if element.tag == "route" and "id" in element.attrib:
+                        routes[element.attrib["id"]] = element.attrib["edges"].split()
+                    elif element.tag == "vehicle":
+                        if "route" in element.attrib:
+                            edges = routes[element.attrib["route"]]
+                        else:
+                            edges = element.find("route").attrib["edges"].split()
+                        departures[self.laneIndex[f"{edges[0]}_0"]].append(float(element.attrib["depart"]))
+                        element.clear()
+                    elif element.tag == "flow":
+                        edges = routes[element.attrib["route"]]
+                        departures[self.laneIndex[f"{edges[0]}_0"]] += _flow_departures(element.attrib, rng).tolist()
+                        element.clear()
+
+        # Depart times of every vehicle, grouped by lane in queue order
+        # Offsetting each lane by a horizon keeps the flat array sorted, so one
+        # searchsorted counts the departures of every lane
+        self.numVehicles = np.array([len(lane) for lane in departures], dtype=int)
+        self.laneStart = np.concatenate([[0], np.cumsum(self.numVehicles)[:-1]]).astype(int)
+        self._departs = np.concatenate([np.sort(lane) for lane in departures] + [np.zeros(0)])
+        laneOfVehicle = np.repeat(np.arange(len(self.laneIds)), self.numVehicles)
+
+        self._horizon = float(self._departs.max(initial=0)) + 1
+        self._departKeys = self._departs + laneOfVehicle * self._horizon
+        self.totalVehicles = int(self.numVehicles.sum())
+
+    # The model variables that change while stepping, saved by saveState
+    STATE = ["time", "phase", "nextSwitch", "discharged", "credit", "vehicleNumber", "waitingTime",
+             "_dischargeTimes", "_dischargedHistory"]
+
+    def save_state(self, fileName):
+        """
+        Saves the queues and signal timings, as traci.simulation.saveState
+
+        Parameters
+        ----------
+        fileName
+            The file to write, gzipped like SUMO states ending in ".gz"
+
+        Returns
+        -------
+        None
+        """
+        with gzip.open(fileName, 'wb') as stateFile:
+            pickle.dump({name: getattr(self, name) for name in self.STATE}, stateFile)
+
+    def load_state(self, fileName):
+        """
+        Restores the queues and signal timings saved by save_state, as SUMO's --load-state
+
+        The vehicles come from the loaded route files, so they must be the same
+
+        Parameters
+        ----------
+        fileName
+            The file to read
+
+        Returns
+        -------
+        None
+        """
+        with gzip.open(fileName, 'rb') as stateFile:
+            for name, value in pickle.load(stateFile).items():
+                setattr(self, name, value)
+
+    def _reset(self):
+        numLanes = len(self.laneIds)
+        self.time = 0
+        self.phase = np.zeros(len(self.trafficLightIds), dtype=int)
+        self.nextSwitch = self.durations[:, 0].copy()
+        self.discharged = np.zeros(numLanes, dtype=int)
+        self.credit = np.zeros(numLanes)
+        self.vehicleNumber = np.zeros(numLanes, dtype=int)
+        self.waitingTime = np.zeros(numLanes)
+        self._dischargeTimes = np.full(self.totalVehicles + 1, -np.inf)
+        self._dischargedHistory = [0]
+
+    # ------- Stepping -------
+    def simulationStep(self, step = 0.):
+        """
+        Advances the queue model by one second
+
+        Returns
+        -------
+        None
+        """
+        self.time += 1
+        t = self.time
+        lanes = np.arange(len(self.laneIds))
+
+        # Switching the phases that have run out
+        switching = t >= self.nextSwitch
+        self.phase[switching] = (self.phase[switching] + 1) % self.numPhases[switching]
+        self.nextSwitch[switching] += self.durations[switching, self.phase[switching]]
+
+        # Green lanes for the current phases
+        phase = np.append(self.phase, 0)[self.laneTrafficLight]
+        green = self.laneGreen[lanes, np.minimum(phase, self.laneGreen.shape[1] - 1)] | self._uncontrolled
+
+        # Vehicles that departed onto each lane, times past the horizon would
+        # spill into the next lane's keys
+        queries = lanes * self._horizon + min(t, self._horizon - 0.5)
+        departed = np.searchsorted(self._departKeys, queries, side="right") - self.laneStart
+        onLane = np.minimum(departed - self.discharged, self.capacity)
+
+        # The vehicles on each lane as a (lanes, capacity) window of the queue
+        # A vehicle enters once it departed and the vehicle a lane length ahead
+        # of it was discharged, then drives to the stop line
+        offsets = np.arange(self.capacity.max())
+        onWindow = offsets < onLane[:, None]
+        index = np.where(onWindow, (self.laneStart + self.discharged)[:, None] + offsets, self.totalVehicles)
+        ahead = index - self.capacity[:, None]
+        aheadDischarge = np.where(ahead >= self.laneStart[:, None], self._dischargeTimes[ahead], -np.inf)
+        departs = np.append(self._departs, np.inf)[index]
+        stopLine = np.maximum(departs, aheadDischarge) + self.travelTime[:, None]
+        stopped = onWindow & (stopLine <= t)
+
+        # Discharging green queues from the front at the saturation flow
+        self.credit = np.where(green, self.credit + SATURATION_FLOW, 0)
+        discharging = np.minimum(np.floor(self.credit).astype(int), stopped.sum(axis=1))
+        self.credit -= discharging
+        leaving = offsets < discharging[:, None]
+        self._dischargeTimes[index[leaving]] = t
+        self.discharged += discharging
+        self._dischargedHistory.append(int(self.discharged.sum()))
+
+        # Vehicles on each lane, the rest wait to be inserted
+        self.vehicleNumber = np.minimum(departed - self.discharged, self.capacity)
+
+        # Waiting time of the vehicles still stopped on the lane
+        self.waitingTime = np.where(stopped & ~leaving, t - stopLine, 0).sum(axis=1)
+
+    def min_expected_number(self):
+        # Vehicles still to arrive, on the network or clearing the junction
+        cleared = self._dischargedHistory[max(0, len(self._dischargedHistory) - 1 - EXIT_TIME)]
+        return self.totalVehicles - cleared
@@ -0,0 +1,248 @@
+import os
+import numpy as np
+
+from backends import add_sumo_tools
+
+# TraCI codes of the tlLogic types
+TRAFFIC_LIGHT_TYPES = {"static": 0, "actuated": 3, "NEMA": 4, "delay_based": 5}
+
+# Networks already read by discover_junctions, by file and modification time
+_junctionCache = {}
+
+
+def is_control_phase(state):
+    """
+    Checks if a traffic light phase is one the controllers drive
+
+    Green phases are controlled, yellow and all red phases are left to run
+
+    Parameters
+    ----------
+    state
+        The signal state string of the phase, such as "GGgrrrGGgrrr"
+
+    Returns
+    -------
+    bool
+        True if the phase is controlled
+    """
+    return any(signal in "Gg" for signal in state) and not any(signal in "yYu" for signal in state)
+
+
+class JunctionTable:
+    """
+    The signalized junctions of a network as padded arrays, so every junction
+    can be evaluated in one batched NumPy operation per step
+
+    Junction j has its incoming lanes in row j of laneIndex, padded to the
+    longest row, and its phases in row j of green and control, padded to the
+    longest program
+
+    Parameters
+    ----------
+    trafficLights
+        The traffic light ids
+    junctionLanes
+        The incoming lane ids of each traffic light
+    phaseGreens
+        For each traffic light, one list per phase of the lanes with a green signal
+    phaseStates
+        For each traffic light, the signal state strings of its phases
+    programs
+        For each traffic light, its program as (programID, type, phases) with
+        phases a list of (state, duration, minDur, maxDur), minDur and maxDur
+        are -1 when not set in the network
+    """
+    def __init__(self, trafficLights, junctionLanes, phaseGreens, phaseStates, programs):
+        self.trafficLights = list(trafficLights)
+        self.programs = list(programs)
+
+        # Every incoming lane once, in discovery order
+        self.lanes = []
+        indices = {}
+        for lanes in junctionLanes:
+            for lane in lanes:
+                if lane not in indices:
+                    indices[lane] = len(self.lanes)
+                    self.lanes.append(lane)
+
+        numJunctions = len(self.trafficLights)
+        maxLanes = max([len(lanes) for lanes in junctionLanes], default=0)
+        maxPhases = max([len(states) for states in phaseStates], default=1)
+
+        self.laneIndex = np.zeros((numJunctions, maxLanes), dtype=np.intp)
+        self.valid = np.zeros((numJunctions, maxLanes), dtype=bool)
+        self.green = np.zeros((numJunctions, maxPhases, maxLanes), dtype=bool)
+        self.control = np.zeros((numJunctions, maxPhases), dtype=bool)
+        self.numPhases = np.array([len(states) for states in phaseStates], dtype=int)
+
+        for j, lanes in enumerate(junctionLanes):
+            self.laneIndex[j, :len(lanes)] = [indices[lane] for lane in lanes]
+            self.valid[j, :len(lanes)] = True
+            for p, greens in enumerate(phaseGreens[j]):
+                self.green[j, p, :len(lanes)] = [lane in greens for lane in lanes]
+            self.control[j, :len(phaseStates[j])] = [is_control_phase(state) for state in phaseStates[j]]
+
+        self._rows = np.arange(numJunctions)
+
+    def __len__(self):
+        return len(self.trafficLights)
+
+    def phase_masks(self, phases):
+        """
+        Finds the green and red lanes of every junction in its current phase
+
+        Parameters
+        ----------
+        phases
+            The current phase of each traffic light
+
+        Returns
+        -------
+        tuple
+            The green and red lanes, (junctions, lanes) boolean arrays,
+            and whether each junction is in a controlled phase
+        """
+        green = self.green[self._rows, phases]
+        red = self.valid & ~green
+        return green, red, self.control[self._rows, phases]
+
+    def lane_sum(self, values, mask):
+        """
+        Sums a per lane value over the lanes of each junction
+
+        Parameters
+        ----------
+        values
+            One value per lane, in the order of self.lanes
+        mask
+            The (junctions, lanes) lanes to sum, from phase_masks
+
+        Returns
+        -------
+        ndarray
+            The sum of each junction
+        """
+        return np.where(mask, values[self.laneIndex], 0).sum(axis=1)
+
+    def lanes_in(self, mask):
+        """
+        Finds the lanes selected by a mask
+
+        Parameters
+        ----------
+        mask
+            The (junctions, lanes) lanes to select, from phase_masks
+
+        Returns
+        -------
+        ndarray
+            Indices into self.lanes
+        """
+        return self.laneIndex[mask]
+
+
+def discover_junctions(netFile):
+    """
+    Finds every traffic light of a network and the lanes it controls with sumolib.net
+
+    The first program of each traffic light is used. The network is only
+    read again if the file changed, otherwise the cached table is returned
+
+    Parameters
+    ----------
+    netFile
+        The network file to read
+
+    Returns
+    -------
+    JunctionTable
+        The signalized junctions
+    """
+    key = (os.path.abspath(netFile), os.path.getmtime(netFile))
+    if key in _junctionCache:
+        return _junctionCache[key]
+
+    add_sumo_tools()
+    import sumolib
+
+    net = sumolib.net.readNet(netFile, withPrograms=True)
+
+    trafficLights = []
+    junctionLanes = []
+    phaseGreens = []
+    phaseStates = []
+    programs = []
+    for tls in net.getTrafficLights():
+        tlsPrograms = tls.getPrograms()
+        if not tlsPrograms:
+            continue
+        programID = sorted(tlsPrograms)[0]
+        program = tlsPrograms[programID]
+        states = [phase.state for phase in program.getPhases()]
+
+        # Incoming lanes in link index order
+        lanes = []
+        links = []
+        for inLane, outLane, linkIndex in sorted(tls.getConnections(), key=lambda link: link[2]):
+            laneId = inLane.getID()
+            if laneId not in lanes:
+                lanes.append(laneId)
+            links.append((laneId, linkIndex))
+
+        trafficLights.append(tls.getID())
+        junctionLanes.append(lanes)
+        phaseStates.append(states)
+        programs.append((programID, program.getType(),
+                         [(phase.state, float(phase.duration), float(phase.minDur), float(phase.maxDur))
+                          for phase in program.getPhases()]))
+        phaseGreens.append([{laneId for laneId, linkIndex in links
+                             if linkIndex < len(state) and state[linkIndex] in "Gg"}
+                            for state in states])
+
+    junctions = JunctionTable(trafficLights, junctionLanes, phaseGreens, phaseStates, programs)
+    _junctionCache[key] = junctions
+    return junctions
+
+
+def apply_cycle_time(traci, junctions, cycleTime, keepPhases = False):
+    """
+    Sets the green phase durations of every traffic light of a running simulation
+
+    The programs are replaced through TraCI, so the network file is never
+    rewritten and stays the same for every run
+
+    Parameters
+    ----------
+    traci
+        The backend of the running simulation
+    junctions
+        The JunctionTable of the simulated network
+    cycleTime
+        The duration of the green phases
+    keepPhases
+        Set to keep the running phase and its remaining time, such as after loading a state
+        Default is False, every traffic light starts its first phase
+
+    Returns
+    -------
+    None
+    """
+    for trafficLight, (programID, programType, phases) in zip(junctions.trafficLights, junctions.programs):
+        currentPhase = traci.trafficlight.getPhase(trafficLight) if keepPhases else 0
+        logicPhases = []
+        for state, duration, minDur, maxDur in phases:
+            if is_control_phase(state):
+                duration = cycleTime
+            # Unset minimum and maximum durations follow the duration, like in the network file
+            logicPhases.append(traci.trafficlight.Phase(duration, state,
+                                                        minDur if minDur >= 0 else duration,
+                                                        maxDur if maxDur >= 0 else duration))
+        if keepPhases:
+            remainingDuration = traci.trafficlight.getNextSwitch(trafficLight) - traci.simulation.getTime()
+        else:
+            remainingDuration = logicPhases[0].duration
+        logic = traci.trafficlight.Logic(programID, TRAFFIC_LIGHT_TYPES[programType], currentPhase, logicPhases)
+        traci.trafficlight.setProgramLogic(trafficLight, logic)
+        # The running phase would otherwise keep its old duration
+        traci.trafficlight.setPhaseDuration(trafficLight, remainingDuration)
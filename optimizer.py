@@ -0,0 +1,504 @@
+import os
+import csv
+import copy
+import json
+import tempfile
+import warnings
+import optparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from main import init, TrafficSimulator, statistics_path, SEED, STEPS, N, SIMULATION_MODULES, ROUTE_MODULES
+from sweep import worker_session
+from backends import sumo_version
+from result_cache import result_key, file_hash, source_hash
+from fuzzy_controller import MEMBERSHIP_FUNCTIONS, UNIVERSES, CACHE_DIR, compiled_fuzzy_logic_controller, \
+    definition_hash
+
+# Creating Options
+optParser = optparse.OptionParser()
+optParser.add_option("--controller", default="Fuzzy",
+                     help="traffic light type to tune, Fixed tunes only the cycle time")
+optParser.add_option("--seeds", default=str(SEED), help="comma separated random seeds every candidate runs on")
+optParser.add_option("--cars", type="int", default=N, help="number of cars to simulate")
+optParser.add_option("--steps", type="int", default=STEPS, help="virtual time to simulate")
+optParser.add_option("--generations", type="int", default=10, help="number of generations")
+optParser.add_option("--population", type="int", default=12, help="candidates per generation")
+optParser.add_option("--elite", type="int", default=4, help="best candidates the search distribution is fitted to")
+optParser.add_option("--sigma", type="float", default=0.15,
+                     help="initial standard deviation as a fraction of each parameter's range")
+optParser.add_option("--random-seed", dest="randomSeed", type="int", default=0, help="seed of the optimizer")
+optParser.add_option("--backend", default="traci", help="simulation backend, traci, libsumo or mock")
+optParser.add_option("--workers", type="int", default=None,
+                     help="number of worker processes, default is the number of CPUs")
+optParser.add_option("--output", default=os.path.join(statistics_path, "optimization"),
+                     help="file name prefix for the history csv and the best parameters json")
+
+# Tunable breakpoints as (variable, term, point) in MEMBERSHIP_FUNCTIONS
+# The ends of the universes stay fixed, so every input keeps a term at its extremes
+BREAKPOINTS = [(variable, term, point)
+               for variable, terms in [("arrivingVehicles", ["low", "medium", "high"]),
+                                       ("queuingVehicles", ["low", "medium", "high"]),
+                                       ("cycleTime", ["short", "medium", "long"])]
+               for term, points in zip(terms, [[2], [0, 1, 2], [0]])
+               for point in points]
+
+# Order of each variable's breakpoints from left to right, as indices into its BREAKPOINTS
+# medium starts before low ends and high starts before medium ends, so adjacent terms overlap
+BREAKPOINT_ORDER = [1, 0, 2, 4, 3]
+# Smallest gap after each breakpoint in BREAKPOINT_ORDER, nonzero where the terms must overlap
+BREAKPOINT_GAPS = [1, 0, 0, 1]
+
+# Smallest breakpoint of each variable, shorter cycle times leave too little green to clear the queues
+BREAKPOINT_MINIMUMS = {"cycleTime": 5}
+
+# Range of the fixed cycle time
+CYCLE_TIME_BOUNDS = (10, 90)
+
+# Evaluated candidates, loaded from and appended to CACHE_FILE
+CACHE_FILE = os.path.join(CACHE_DIR, "optimizer.jsonl")
+
+
+def breakpoint_bounds(variable):
+    """
+    Gets the range the breakpoints of a variable are tuned in
+
+    Parameters
+    ----------
+    variable
+        The fuzzy variable
+
+    Returns
+    -------
+    tuple
+        The lowest and highest breakpoint
+    """
+    return max(UNIVERSES[variable][0], BREAKPOINT_MINIMUMS.get(variable, 0)), UNIVERSES[variable][1] - 1
+
+
+def parameter_space(controller):
+    """
+    Gets the tuned parameters of a traffic light type
+
+    Parameters
+    ----------
+    controller
+        The traffic light type, "Fixed" or "Fuzzy"
+
+    Returns
+    -------
+    tuple
+        The parameter names and their lower bounds, upper bounds and defaults as arrays
+    """
+    names = ["fixedCycleTime"]
+    bounds = [CYCLE_TIME_BOUNDS]
+    defaults = [42]
+    if controller == "Fuzzy":
+        for variable, term, point in BREAKPOINTS:
+            names.append(f"{variable}.{term}[{point}]")
+            bounds.append(breakpoint_bounds(variable))
+            defaults.append(MEMBERSHIP_FUNCTIONS[variable][term][point])
+    bounds = np.array(bounds, dtype=float)
+    return names, bounds[:, 0], bounds[:, 1], np.array(defaults, dtype=float)
+
+
+def valid_vector(controller, vector):
+    """
+    Turns any parameter vector into one the fuzzy controller can be built from
+
+    Values are rounded to whole seconds and vehicles, the universes are
+    integer grids. The breakpoints of each variable are sorted into
+    BREAKPOINT_ORDER and spread by cumulative increments of at least
+    BREAKPOINT_GAPS, so every triangle is ordered and adjacent terms
+    overlap, and every input fires a rule
+
+    Parameters
+    ----------
+    controller
+        The traffic light type, "Fixed" or "Fuzzy"
+    vector
+        The parameters in the order of parameter_space
+
+    Returns
+    -------
+    ndarray
+        The valid parameters, the same for a vector that already is
+    """
+    vector = np.round(np.asarray(vector, dtype=float))
+    if controller != "Fuzzy":
+        return vector
+
+    order = np.array(BREAKPOINT_ORDER)
+    for start in range(1, len(vector), len(order)):
+        variable = BREAKPOINTS[start - 1][0]
+        lower, upper = breakpoint_bounds(variable)
+        points = np.clip(np.sort(vector[start:start + len(order)]), lower, upper)
+
+        # Pushing each point past the previous one, then pulling them back into the universe from the right
+        for i, gap in enumerate(BREAKPOINT_GAPS):
+            points[i + 1] = max(points[i + 1], points[i] + gap)
+        points[-1] = min(points[-1], upper)
+        for i, gap in reversed(list(enumerate(BREAKPOINT_GAPS))):
+            points[i] = min(points[i], points[i + 1] - gap)
+
+        vector[start + order] = points
+    return vector
+
+
+def decode(controller, vector):
+    """
+    Turns a parameter vector into simulator parameters
+
+    The vector is made valid first, see valid_vector
+
+    Parameters
+    ----------
+    controller
+        The traffic light type, "Fixed" or "Fuzzy"
+    vector
+        The parameters in the order of parameter_space
+
+    Returns
+    -------
+    dict
+        The "fixedCycleTime" and, for Fuzzy, the "membershipFunctions"
+    """
+    values = [int(value) for value in valid_vector(controller, vector)]
+    parameters = {"fixedCycleTime": values[0]}
+    if controller == "Fuzzy":
+        membershipFunctions = copy.deepcopy(MEMBERSHIP_FUNCTIONS)
+        for (variable, term, point), value in zip(BREAKPOINTS, values[1:]):
+            membershipFunctions[variable][term][point] = value
+        parameters["membershipFunctions"] = membershipFunctions
+    return parameters
+
+
+def candidate_key(controller, parameters, seeds, numberOfCars, steps, backend, netFile = "traffic.net.xml"):
+    """
+    Hashes a candidate with everything its result depends on
+
+    Besides the candidate, the key covers the network, the SUMO version,
+    the fuzzy rules and universes and the source of the simulation and
+    route generator, so changing any of them reevaluates the candidates
+
+    Parameters
+    ----------
+    controller
+        The traffic light type
+    parameters
+        The parameters from decode
+    seeds
+        The random seeds the candidate runs on
+    numberOfCars
+        Number of cars to simulate
+    steps
+        The amount of virtual time to simulate
+    backend
+        The simulation backend
+    netFile
+        The network file the candidate runs on
+        Default is "traffic.net.xml"
+
+    Returns
+    -------
+    str
+        Hex digest of the candidate, see result_cache.result_key
+    """
+    return result_key(kind="candidate", controller=controller, parameters=parameters, seeds=list(seeds),
+                      numberOfCars=numberOfCars, steps=steps, simulator=sumo_version(backend),
+                      net=file_hash(netFile), config=file_hash("traffic.sumocfg"),
+                      fuzzyDefinition=definition_hash(parameters.get("membershipFunctions")),
+                      code=source_hash(SIMULATION_MODULES + ROUTE_MODULES))
+
+
+def evaluate_candidate(controller, parameters, seeds, numberOfCars = N, steps = STEPS, backend = "traci"):
+    """
+    Runs a candidate on every seed in this worker process
+
+    Parameters
+    ----------
+    controller
+        The traffic light type
+    parameters
+        The parameters from decode
+    seeds
+        The random seeds to run on
+    numberOfCars
+        Number of cars to simulate
+    steps
+        The amount of virtual time to simulate
+    backend
+        The simulation backend, "traci", "libsumo" or "mock"
+
+    Returns
+    -------
+    float
+        Mean over the seeds of the average 90th percentile wait time of the
+        lanes, inf if the fuzzy controller cannot be built from the parameters
+    """
+    # Building the table before starting SUMO
+    if controller == "Fuzzy":
+        from skfuzzy.defuzzify.exceptions import EmptyMembershipError
+        try:
+            compiled_fuzzy_logic_controller(parameters["membershipFunctions"])
+        except EmptyMembershipError:
+            # Some inputs fire no rule, skfuzzy has no output for them
+            return np.inf
+
+    percentiles = []
+    for seed in seeds:
+        with tempfile.TemporaryDirectory(prefix="traffic-optimizer-", ignore_cleanup_errors=True) as workDir:
+            routeFile = os.path.join(workDir, "traffic.rou.xml")
+            traffic = TrafficSimulator(numberOfCars, steps, True, fixedCycleTime=parameters["fixedCycleTime"],
+                                       compiledFuzzy=True, seed=seed, routeFile=routeFile, outputDir=workDir,
+                                       backend=backend, session=worker_session(backend),
+                                       membershipFunctions=parameters.get("membershipFunctions"))
+            traffic.generate_routefile(routeFile)
+
+            if controller == "Fixed":
+                traffic.run_fixed()
+            else:
+                traffic.run_fuzzy()
+
+            # The other traffic light type has no samples
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                percentiles.append(traffic.find_90th_percentile()[controller])
+    return float(np.mean(percentiles))
+
+
+def load_cache(cacheFile = CACHE_FILE):
+    """
+    Reads the evaluated candidates
+
+    Parameters
+    ----------
+    cacheFile
+        The json lines file of results
+        Default is CACHE_FILE
+
+    Returns
+    -------
+    dict
+        The objective of each candidate key
+    """
+    cache = {}
+    if os.path.exists(cacheFile):
+        with open(cacheFile, encoding='utf-8') as jsonFile:
+            for line in jsonFile:
+                result = json.loads(line)
+                cache[result["key"]] = result["objective"]
+    return cache
+
+
+class Optimizer:
+    """
+    Tunes controller parameters to minimise the 90th percentile wait time
+
+    A cross-entropy method: every generation samples candidates from a
+    diagonal Gaussian over the parameters scaled to [0, 1], runs them
+    concurrently on a process pool, and refits the Gaussian to the best
+    candidates. Samples are made valid before they run, see valid_vector,
+    and candidates without a finite objective never join the elite. Every
+    seed is the same for every candidate, so results are deterministic and
+    cached by candidate hash, and a candidate is never simulated twice,
+    neither within nor across optimizations
+
+    Parameters
+    ----------
+    controller
+        The traffic light type to tune, "Fixed" tunes only the cycle time
+        Default is "Fuzzy"
+    seeds
+        The random seeds every candidate runs on
+        Default is (SEED,)
+    numberOfCars
+        Number of cars to simulate
+    steps
+        The amount of virtual time to simulate
+    population
+        Candidates per generation
+        Default is 12
+    elite
+        Best candidates the Gaussian is fitted to
+        Default is 4
+    sigma
+        Initial standard deviation as a fraction of each parameter's range
+        Default is 0.15
+    randomSeed
+        Seed of the candidate sampling
+        Default is 0
+    backend
+        The simulation backend, "traci", "libsumo" or "mock"
+    cacheFile
+        The json lines file of evaluated candidates, None to not cache
+        Default is CACHE_FILE
+    """
+    def __init__(self, controller = "Fuzzy", seeds = (SEED,), numberOfCars = N, steps = STEPS,
+                 population = 12, elite = 4, sigma = 0.15, randomSeed = 0, backend = "traci",
+                 cacheFile = CACHE_FILE):
+        self.controller = controller
+        self.seeds = list(seeds)
+        self.numberOfCars = numberOfCars
+        self.steps = steps
+        self.population = population
+        self.elite = elite
+        self.backend = backend
+        self.cacheFile = cacheFile
+
+        self.names, self.lower, self.upper, defaults = parameter_space(controller)
+        self.mean = self._scale(defaults)
+        self.std = np.full(len(self.names), sigma)
+        self.rng = np.random.default_rng(randomSeed)
+
+        self.cache = load_cache(cacheFile) if cacheFile is not None else {}
+        self.history = []
+        self.generation = 0
+        self.best = None
+        self.evaluations = 0
+        self.cacheHits = 0
+
+    def _scale(self, vector):
+        return (vector - self.lower) / (self.upper - self.lower)
+
+    def _unscale(self, scaled):
+        return self.lower + np.clip(scaled, 0, 1) * (self.upper - self.lower)
+
+    def evaluate(self, vectors, executor):
+        """
+        Gets the objective of candidates, simulating only the ones not in the cache
+
+        Parameters
+        ----------
+        vectors
+            The candidate parameter vectors
+        executor
+            The process pool to simulate on
+
+        Returns
+        -------
+        ndarray
+            The objective of each candidate
+        """
+        candidates = [decode(self.controller, vector) for vector in vectors]
+        keys = [candidate_key(self.controller, parameters, self.seeds, self.numberOfCars, self.steps,
+                              self.backend) for parameters in candidates]
+
+        # Simulating each new candidate once, even if it was drawn more than once
+        pending = {key: parameters for key, parameters in zip(keys, candidates) if key not in self.cache}
+        self.cacheHits += len(keys) - len(pending)
+        futures = {key: executor.submit(evaluate_candidate, self.controller, parameters, self.seeds,
+                                        self.numberOfCars, self.steps, self.backend)
+                   for key, parameters in pending.items()}
+        for key, future in futures.items():
+            self.cache[key] = future.result()
+            self.evaluations += 1
+            if self.cacheFile is not None:
+                if not os.path.exists(os.path.dirname(self.cacheFile)):
+                    os.makedirs(os.path.dirname(self.cacheFile), exist_ok=True)
+                with open(self.cacheFile, 'a', encoding='utf-8') as jsonFile:
+                    jsonFile.write(json.dumps({"key": key, "objective": self.cache[key],
+                                               "parameters": pending[key]}) + "\n")
+
+        objectives = np.array([self.cache[key] for key in keys])
+        for parameters, objective in zip(candidates, objectives):
+            if self.best is None or objective < self.best[1]:
+                self.best = (parameters, objective)
+        return objectives
+
+    def step(self, executor):
+        """
+        Runs one generation and refits the search distribution
+
+        The first generation also evaluates the current parameters, so the
+        best result is never worse than the hand picked one
+
+        Parameters
+        ----------
+        executor
+            The process pool to simulate on
+
+        Returns
+        -------
+        ndarray
+            The objectives of the generation
+        """
+        scaled = np.clip(self.mean + self.std * self.rng.standard_normal((self.population, len(self.names))), 0, 1)
+        if not self.history:
+            scaled[0] = self.mean
+        # Fitting to the valid candidates that ran, not the raw samples
+        vectors = np.array([valid_vector(self.controller, vector) for vector in self._unscale(scaled)])
+        scaled = self._scale(vectors)
+        objectives = self.evaluate(vectors, executor)
+
+        self.history += [(self.generation, vector, objective) for vector, objective in zip(vectors, objectives)]
+        self.generation += 1
+
+        # Refitting to the elite of the candidates that could run, with a floor so the search
+        # never collapses below one unit, too few of them keep the distribution as it is
+        finite = np.flatnonzero(np.isfinite(objectives))
+        if len(finite) >= self.elite:
+            elite = scaled[finite[np.argsort(objectives[finite])[:self.elite]]]
+            self.mean = elite.mean(axis=0)
+            self.std = np.maximum(elite.std(axis=0), 0.5 / (self.upper - self.lower))
+        return objectives
+
+    def run(self, generations, workers = None):
+        """
+        Runs the optimization
+
+        Parameters
+        ----------
+        generations
+            Number of generations
+        workers
+            Number of worker processes
+            Default is the number of CPUs
+
+        Returns
+        -------
+        tuple
+            The best parameters and their objective
+        """
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for _ in range(generations):
+                objectives = self.step(executor)
+                print(f"Generation {self.generation}: best {np.min(objectives):.3f} s, "
+                      f"overall {self.best[1]:.3f} s, {self.evaluations} simulated, {self.cacheHits} cached")
+        return self.best
+
+    def write_history(self, outputFile):
+        """
+        Writes every evaluated candidate
+
+        Parameters
+        ----------
+        outputFile
+            The csv file to write to
+
+        Returns
+        -------
+        None
+        """
+        with open(outputFile, 'w', encoding='utf-8', newline='') as csvFile:
+            csvFileWriter = csv.writer(csvFile)
+            csvFileWriter.writerow(["generation"] + self.names + ["objective"])
+            for generation, vector, objective in self.history:
+                csvFileWriter.writerow([generation] + [int(round(value)) for value in vector] + [objective])
+
+
+if __name__ == "__main__":
+    options, args = optParser.parse_args()
+    init(options.backend)
+
+    optimizer = Optimizer(options.controller, [int(seed) for seed in options.seeds.split(",")], options.cars,
+                          options.steps, options.population, options.elite, options.sigma, options.randomSeed,
+                          options.backend)
+    parameters, objective = optimizer.run(options.generations, options.workers)
+
+    optimizer.write_history(f"{options.output}-{options.controller}.csv")
+    with open(f"{options.output}-{options.controller}.json", 'w', encoding='utf-8') as jsonFile:
+        json.dump(dict(parameters, objective=objective), jsonFile, indent=2)
+    print(f"Best 90th percentile {objective:.3f} s with {parameters}")
+    print(f"Run main.py --parameters {options.output}-{options.controller}.json to simulate with them")
@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import queue
+import asyncio
+import optparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from main import init, statistics_path, SEED, STEPS, N
+from sweep import scenario_grid, run_scenario, write_results, compile_for_workers
+from streaming import MetricStreamer, BATCH_STEPS
+
+# Creating Options
+optParser = optparse.OptionParser()
+optParser.add_option("--seeds", default=str(SEED), help="comma separated random seeds")
+optParser.add_option("--cars", default=str(N), help="comma separated numbers of cars")
+optParser.add_option("--cycle-times", dest="cycleTimes", default="42", help="comma separated fixed cycle times")
+optParser.add_option("--controllers", default="Fixed,Fuzzy",
+                     help="comma separated traffic light types, Fixed or Fuzzy")
+optParser.add_option("--steps", type="int", default=STEPS, help="virtual time to simulate")
+optParser.add_option("--backend", default="traci", help="simulation backend, traci, libsumo or mock")
+optParser.add_option("--workers", type="int", default=None,
+                     help="number of runs at once, default is the number of CPUs")
+optParser.add_option("--executor", default="process",
+                     help="process, or thread for the mock backend, TraCI keeps one connection per process")
+optParser.add_option("--jsonl", default=os.path.join(statistics_path, "stream.jsonl"),
+                     help="json lines file to stream the records to, empty to not write one")
+optParser.add_option("--port", type="int", default=None,
+                     help="local TCP port to stream the records to dashboards on")
+optParser.add_option("--batch-steps", dest="batchSteps", type="int", default=BATCH_STEPS,
+                     help="steps of records a run sends at a time")
+optParser.add_option("--queue-size", dest="queueSize", type="int", default=None,
+                     help="batches buffered before the runs wait for the consumers, default is 4 per worker")
+optParser.add_option("--max-samples", dest="maxSamples", type="int", default=4096,
+                     help="most recent wait time samples kept per lane of a run")
+optParser.add_option("--output", default=os.path.join(statistics_path, "orchestrator.csv"),
+                     help="csv file to write the results of the runs to")
+
+# Step records kept per run to replay to dashboards that connect late
+REPLAY_STEPS = 600
+
+# Queue of this worker process, set by _init_worker
+_queue = None
+
+
+def _init_worker(metricQueue):
+    global _queue
+    _queue = metricQueue
+
+
+def run_streamed(run, scenario, steps = STEPS, backend = "traci", batchSteps = BATCH_STEPS, maxSamples = None,
+                 metricQueue = None):
+    """
+    Runs a scenario in a worker and streams its lane values
+
+    Parameters
+    ----------
+    run
+        Name of the run in the records
+    scenario
+        The scenario to run, see sweep.Scenario
+    steps
+        The amount of virtual time to simulate
+    backend
+        The simulation backend, "traci", "libsumo" or "mock"
+    batchSteps
+        Steps of records sent at a time
+    maxSamples
+        Number of most recent wait time samples kept per lane
+    metricQueue
+        The queue to stream to
+        Default is the queue of this worker process
+
+    Returns
+    -------
+    dict
+        The result row, see sweep.run_scenario
+    """
+    streamer = MetricStreamer(metricQueue if metricQueue is not None else _queue, run, batchSteps)
+    try:
+        row = run_scenario(scenario, steps, backend, streamer, maxSamples)
+    except Exception as error:
+        streamer.send({"event": "finished", "error": repr(error)})
+        raise
+    streamer.send({"event": "finished", "result": row})
+    return row
+
+
+class Orchestrator:
+    """
+    Runs many simulations at once and streams their lane values live
+
+    Every run executes in a worker process, or thread for the mock backend,
+    and puts batches of records on one bounded queue, see MetricStreamer.
+    The asyncio loop drains the queue and writes every record as a json
+    line to a file and to the dashboards connected to a local TCP port.
+    It waits for the file and every dashboard to take the data before
+    draining more, so the queue fills and the runs wait when a consumer
+    falls behind. Memory stays bounded: runs keep only their latest wait
+    time samples and the loop only the latest steps of each run, which
+    dashboards that connect late get first
+
+    Parameters
+    ----------
+    scenarios
+        The scenarios to run, see sweep.Scenario
+    steps
+        The amount of virtual time to simulate
+    backend
+        The simulation backend, "traci", "libsumo" or "mock"
+    workers
+        Number of runs at once
+        Default is the number of CPUs
+    executor
+        "process", or "thread" which only the mock backend supports, TraCI
+        keeps one current connection per process
+        Default is "process"
+    jsonLinesFile
+        File to stream the records to
+        Default is None, no file
+    port
+        Local TCP port to stream the records to dashboards on
+        Default is None, no server
+    batchSteps
+        Steps of records a run sends at a time
+    queueSize
+        Batches buffered before the runs wait
+        Default is 4 per worker
+    maxSamples
+        Number of most recent wait time samples kept per lane of a run
+        Default is 4096
+    """
+    def __init__(self, scenarios, steps = STEPS, backend = "traci", workers = None, executor = "process",
+                 jsonLinesFile = None, port = None, batchSteps = BATCH_STEPS, queueSize = None, maxSamples = 4096):
+        if executor == "thread" and backend != "mock":
+            raise ValueError("Only the mock backend can run in threads, TraCI keeps one connection per process")
+
+        self.scenarios = list(scenarios)
+        self.steps = steps
+        self.backend = backend
+        self.workers = workers or os.cpu_count()
+        self.executor = executor
+        self.jsonLinesFile = jsonLinesFile
+        self.port = port
+        self.batchSteps = batchSteps
+        self.queueSize = queueSize or 4 * self.workers
+        self.maxSamples = maxSamples
+
+        self.runs = [f"{scenario.controller}-seed{scenario.seed}-cars{scenario.numberOfCars}"
+                     f"-cycle{scenario.fixedCycleTime}" for scenario in self.scenarios]
+        self.records = 0
+        self.errors = {}
+
+        self._starts = {}
+        self._recent = {run: deque(maxlen=REPLAY_STEPS) for run in self.runs}
+        self._clients = set()
+        self._file = None
+
+    async def run(self):
+        """
+        Runs every scenario and streams their records until all are done
+
+        Returns
+        -------
+        list
+            The result rows of the runs that finished, in the order of the scenarios
+        """
+        loop = asyncio.get_running_loop()
+
+        compile_for_workers(self.scenarios)
+
+        if self.executor == "process":
+            metricQueue = multiprocessing.Queue(self.queueSize)
+            pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(metricQueue,))
+            workerQueue = None
+        else:
+            metricQueue = queue.Queue(self.queueSize)
+            pool = ThreadPoolExecutor(self.workers)
+            workerQueue = metricQueue
+
+        server = None
+        if self.port is not None:
+            server = await asyncio.start_server(self._serve_client, "127.0.0.1", self.port)
+        if self.jsonLinesFile:
+            self._file = open(self.jsonLinesFile, 'wb')
+
+        try:
+            futures = [loop.run_in_executor(pool, run_streamed, run, scenario, self.steps, self.backend,
+                                            self.batchSteps, self.maxSamples, workerQueue)
+                       for run, scenario in zip(self.runs, self.scenarios)]
+            drain = asyncio.ensure_future(self._drain(metricQueue, futures))
+            results = await asyncio.gather(*futures, return_exceptions=True)
+            await drain
+        finally:
+            pool.shutdown(wait=True)
+            if server is not None:
+                server.close()
+                for writer in list(self._clients):
+                    writer.close()
+                await server.wait_closed()
+            if self._file is not None:
+                self._file.close()
+
+        rows = []
+        for run, result in zip(self.runs, results):
+            if isinstance(result, BaseException):
+                self.errors[run] = repr(result)
+                sys.stderr.write(f"Run {run} failed: {result!r}\n")
+            else:
+                rows.append(result)
+        return rows
+
+    async def _drain(self, metricQueue, futures):
+        """
+        Publishes the queued batches until every run has finished
+
+        Parameters
+        ----------
+        metricQueue
+            The queue the runs put their batches on
+        futures
+            The futures of the runs
+
+        Returns
+        -------
+        None
+        """
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(1) as reader:
+            finished = 0
+            while finished < len(futures):
+                try:
+                    batch = await loop.run_in_executor(reader, metricQueue.get, True, 0.5)
+                except queue.Empty:
+                    # A worker that died never sends its finished record
+                    if all(future.done() for future in futures):
+                        break
+                    continue
+                finished += sum(record["event"] == "finished" for record in batch)
+                await self._publish(batch)
+
+    async def _publish(self, batch):
+        """
+        Writes a batch of records to the file and every dashboard
+
+        Parameters
+        ----------
+        batch
+            The records
+
+        Returns
+        -------
+        None
+        """
+        for record in batch:
+            if record["event"] == "start":
+                self._starts[record["run"]] = record
+                self._recent[record["run"]].clear()
+            elif record["event"] == "step":
+                self._recent[record["run"]].append(record)
+        self.records += len(batch)
+
+        data = "".join(json.dumps(record) + "\n" for record in batch).encode("utf-8")
+        if self._file is not None:
+            self._file.write(data)
+        for writer in list(self._clients):
+            writer.write(data)
+        # Waiting for every dashboard to take the data, dropping the ones that left
+        await asyncio.gather(*[self._drain_client(writer) for writer in list(self._clients)])
+
+    async def _drain_client(self, writer):
+        try:
+            await writer.drain()
+        except ConnectionError:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _serve_client(self, reader, writer):
+        """
+        Streams to a dashboard, starting with the latest steps of every run
+
+        Parameters
+        ----------
+        reader
+            The stream from the dashboard, only read to notice it closing
+        writer
+            The stream to the dashboard
+
+        Returns
+        -------
+        None
+        """
+        # Replaying and joining before yielding, so no batch is missed or sent twice
+        replay = list(self._starts.values()) + [record for recent in self._recent.values() for record in recent]
+        writer.write("".join(json.dumps(record) + "\n" for record in replay).encode("utf-8"))
+        self._clients.add(writer)
+        try:
+            await writer.drain()
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+
+if __name__ == "__main__":
+    options, args = optParser.parse_args()
+    init(options.backend)
+
+    scenarios = scenario_grid([int(seed) for seed in options.seeds.split(",")],
+                              [int(cars) for cars in options.cars.split(",")],
+                              [int(cycleTime) for cycleTime in options.cycleTimes.split(",")],
+                              options.controllers.split(","))
+    orchestrator = Orchestrator(scenarios, options.steps, options.backend, options.workers, options.executor,
+                                options.jsonl or None, options.port, options.batchSteps, options.queueSize,
+                                options.maxSamples)
+    rows = asyncio.run(orchestrator.run())
+    if rows:
+        write_results(rows, options.output)
+    print(f"Streamed {orchestrator.records} records of {len(orchestrator.runs)} runs, "
+          f"{len(orchestrator.errors)} failed, results in {options.output}")
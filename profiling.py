@@ -0,0 +1,260 @@
+import json
+import optparse
+import cProfile
+from time import perf_counter_ns
+
+import numpy as np
+
+# Phases of one step of the control loop
+SIMULATION = 0
+QUERY = 1
+CONTROL = 2
+METRICS = 3
+PHASES = ["simulation", "query", "control", "metrics"]
+
+# Histogram bin edges in nanoseconds, powers of two from 64 ns to about 1 s
+# Fixed so summaries of different runs can be compared bin by bin
+HISTOGRAM_EDGES = 2 ** np.arange(6, 31)
+
+
+class StepProfiler:
+    """
+    Times each phase of the steps of a control loop
+
+    The nanosecond timings go into a preallocated array that doubles when
+    full, so timing a phase is one perf_counter_ns call and one array write
+
+        profiler.start()
+        while running:
+            profiler.begin()
+            traci.simulationStep()
+            profiler.lap(SIMULATION)
+            ...
+            profiler.end()
+        profiler.stop()
+
+    Parameters
+    ----------
+    capacity
+        Number of steps to preallocate
+    cprofile
+        Set to also run cProfile between start and stop
+        Default is False
+    """
+    enabled = True
+
+    def __init__(self, capacity = 4096, cprofile = False):
+        self._times = np.zeros((capacity, len(PHASES)), dtype=np.int64)
+        self._size = 0
+        self._last = 0
+        self._startTime = 0
+        self.wallTime = 0
+        self.cprofile = cProfile.Profile() if cprofile else None
+
+    def __len__(self):
+        return self._size
+
+    def start(self):
+        """
+        Starts the wall clock, and cProfile if enabled
+
+        Returns
+        -------
+        None
+        """
+        if self.cprofile is not None:
+            self.cprofile.enable()
+        self._startTime = perf_counter_ns()
+
+    def stop(self):
+        """
+        Stops the wall clock, and cProfile if enabled
+
+        Returns
+        -------
+        None
+        """
+        self.wallTime += perf_counter_ns() - self._startTime
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+    def begin(self):
+        """
+        Marks the start of a step
+
+        Returns
+        -------
+        None
+        """
+        if self._size == len(self._times):
+            self._times = np.concatenate([self._times, np.zeros_like(self._times)])
+        self._last = perf_counter_ns()
+
+    def lap(self, phase):
+        """
+        Adds the time since the last mark to a phase of the current step
+
+        Parameters
+        ----------
+        phase
+            The phase index, one of SIMULATION, QUERY, CONTROL or METRICS
+
+        Returns
+        -------
+        None
+        """
+        now = perf_counter_ns()
+        self._times[self._size, phase] += now - self._last
+        self._last = now
+
+    def end(self):
+        """
+        Marks the end of a step
+
+        Returns
+        -------
+        None
+        """
+        self._size += 1
+
+    def times(self):
+        """
+        Returns the timings of the steps so far
+
+        Returns
+        -------
+        ndarray
+            Nanoseconds per step and phase, one column per phase in PHASES
+        """
+        return self._times[:self._size]
+
+    def summary(self):
+        """
+        Summarises the timings of each phase
+
+        Returns
+        -------
+        dict
+            Steps, wall time, steps per second and for each phase the total,
+            mean and percentiles in nanoseconds and a histogram over HISTOGRAM_EDGES
+        """
+        times = self.times()
+        seconds = self.wallTime / 1e9
+        summary = {
+            "steps": self._size,
+            "wallTime": seconds,
+            "stepsPerSecond": self._size / seconds if seconds > 0 else 0.0,
+            "histogramEdges": HISTOGRAM_EDGES.tolist(),
+            "phases": {},
+        }
+        for index, phase in enumerate(PHASES):
+            column = times[:, index]
+            counts, _ = np.histogram(column, bins=HISTOGRAM_EDGES)
+            empty = len(column) == 0
+            summary["phases"][phase] = {
+                "total": int(column.sum()),
+                "mean": 0.0 if empty else float(column.mean()),
+                "p50": 0.0 if empty else float(np.percentile(column, 50)),
+                "p90": 0.0 if empty else float(np.percentile(column, 90)),
+                "p99": 0.0 if empty else float(np.percentile(column, 99)),
+                "histogram": counts.tolist(),
+            }
+        return summary
+
+    def write_summary(self, outputFile):
+        """
+        Writes the summary as json, and the cProfile stats next to it if enabled
+
+        The cProfile stats go to the same name ending in ".prof",
+        readable with pstats or snakeviz
+
+        Parameters
+        ----------
+        outputFile
+            The .json file to write to
+
+        Returns
+        -------
+        None
+        """
+        with open(outputFile, 'w', encoding='utf-8') as summaryFile:
+            json.dump(self.summary(), summaryFile, indent=2)
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(outputFile.rsplit(".", 1)[0] + ".prof")
+
+
+class NullProfiler:
+    """
+    Stand-in for StepProfiler when profiling is off, every call does nothing
+    """
+    enabled = False
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def begin(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def end(self):
+        pass
+
+
+def compare_summaries(baseline, candidate):
+    """
+    Compares the mean phase times of two summaries
+
+    Parameters
+    ----------
+    baseline
+        The summary to compare against
+    candidate
+        The new summary
+
+    Returns
+    -------
+    dict
+        The ratio of candidate to baseline mean time of each phase, and of the steps per second
+    """
+    ratios = {}
+    for phase in PHASES:
+        before = baseline["phases"][phase]["mean"]
+        after = candidate["phases"][phase]["mean"]
+        ratios[phase] = after / before if before > 0 else float("nan")
+    before = baseline["stepsPerSecond"]
+    ratios["stepsPerSecond"] = candidate["stepsPerSecond"] / before if before > 0 else float("nan")
+    return ratios
+
+
+if __name__ == "__main__":
+    optParser = optparse.OptionParser(usage="%prog [options] baseline.json candidate.json")
+    optParser.add_option("--threshold", type="float", default=1.1,
+                         help="mean phase time ratio reported as a regression")
+    options, args = optParser.parse_args()
+    if len(args) != 2:
+        optParser.error("expected a baseline and a candidate summary")
+
+    summaries = []
+    for summaryFile in args:
+        with open(summaryFile, encoding='utf-8') as inputFile:
+            summaries.append(json.load(inputFile))
+
+    ratios = compare_summaries(*summaries)
+    print(f"{'phase':<16}{'baseline ns':>14}{'candidate ns':>14}{'ratio':>8}")
+    regressions = 0
+    for phase in PHASES:
+        ratio = ratios[phase]
+        flag = ""
+        if ratio > options.threshold:
+            flag = "  regression"
+            regressions += 1
+        print(f"{phase:<16}{summaries[0]['phases'][phase]['mean']:>14.0f}"
+              f"{summaries[1]['phases'][phase]['mean']:>14.0f}{ratio:>8.2f}{flag}")
+    print(f"{'steps/s':<16}{summaries[0]['stepsPerSecond']:>14.0f}"
+          f"{summaries[1]['stepsPerSecond']:>14.0f}{ratios['stepsPerSecond']:>8.2f}")
+    raise SystemExit(1 if regressions else 0)
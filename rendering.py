@@ -0,0 +1,90 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Maximum points drawn per series, longer series are decimated
+MAX_POINTS = 2000
+
+
+def _render_job(job):
+    """
+    Renders one figure to file in a worker process
+
+    Parameters
+    ----------
+    job
+        (kind, data, title, average, outputFile, maxPoints), data is the
+        structured array of a lane, or a dict of them for all lanes
+
+    Returns
+    -------
+    str
+        The file written
+    """
+    # Rendering off screen so nothing blocks
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    from helper import plot_graph, plot_graphs
+
+    kind, data, title, average, outputFile, maxPoints = job
+    if kind == "lanes":
+        plot_graphs(data, average, outputFile, maxPoints)
+    else:
+        plot_graph(data, title, average, outputFile, maxPoints)
+    return outputFile
+
+
+def render_figures(store, outputDir, trafficLightTypes = None, formats = ("png",), average = False,
+                   maxPoints = MAX_POINTS, workers = None):
+    """
+    Renders every lane and traffic light type figure to files in a process pool
+
+    Parameters
+    ----------
+    store
+        The MetricsStore to plot
+    outputDir
+        Directory to write the figures to
+    trafficLightTypes
+        The traffic light types to plot
+        Default is every type in the store
+    formats
+        Image formats to write, such as "png" and "svg"
+        Default is ("png",)
+    average
+        Determines if the graphs are the average of wait time over time or not
+        Default is False
+    maxPoints
+        Maximum points drawn per series, longer series are min/max decimated
+        Default is MAX_POINTS
+    workers
+        Number of worker processes
+        Default is the number of CPUs
+
+    Returns
+    -------
+    list
+        The files written
+    """
+    if trafficLightTypes is None:
+        trafficLightTypes = store.controllers
+    if not os.path.exists(outputDir):
+        os.makedirs(outputDir)
+
+    # Sending the workers only the samples each figure plots, not the whole store
+    kind = "average" if average else "waitingtime"
+    jobs = []
+    for trafficLightType in trafficLightTypes:
+        views = store.views(trafficLightType)
+        for format in formats:
+            # All lanes on one figure
+            outputFile = os.path.join(outputDir, f"{kind}-{trafficLightType}.{format}")
+            jobs.append(("lanes", views, trafficLightType, average, outputFile, maxPoints))
+
+            # One figure per lane
+            for lane, view in views.items():
+                laneName = lane.lower().replace(" ", "")
+                outputFile = os.path.join(outputDir, f"{kind}-{trafficLightType}-{laneName}.{format}")
+                jobs.append(("lane", view, f"{lane} {trafficLightType}", average, outputFile, maxPoints))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render_job, jobs))
@@ -0,0 +1,272 @@
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import importlib.util
+
+# Location of the cached results
+CACHE_DIR = os.path.join("outputs", "cache", "results")
+# Largest size of the cache in bytes, the least recently used entries are evicted past it
+MAX_BYTES = 512 * 1024 ** 2
+# Changes with the layout of the entries, invalidating older entries
+CACHE_VERSION = 1
+
+
+def file_hash(fileName):
+    """
+    Hashes the contents of a file
+
+    Parameters
+    ----------
+    fileName
+        The file
+
+    Returns
+    -------
+    str
+        Hex digest of its bytes
+    """
+    digest = hashlib.sha256()
+    with open(fileName, 'rb') as hashedFile:
+        for block in iter(lambda: hashedFile.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_hash(moduleNames):
+    """
+    Hashes the source files of modules without importing them
+
+    Parameters
+    ----------
+    moduleNames
+        Names of the modules, such as "main"
+
+    Returns
+    -------
+    str
+        Hex digest of the module names and their sources
+    """
+    digest = hashlib.sha256()
+    for name in sorted(moduleNames):
+        digest.update(f"{name}:{file_hash(importlib.util.find_spec(name).origin)};".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def result_key(**fields):
+    """
+    Hashes everything a result depends on into a cache key
+
+    Parameters
+    ----------
+    fields
+        Json serialisable values, such as file hashes and controller settings
+
+    Returns
+    -------
+    str
+        Hex digest of the fields and CACHE_VERSION
+    """
+    encoded = json.dumps(dict(fields, cacheVersion=CACHE_VERSION), sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed cache of simulation results on disk
+
+    Every entry is one file named by its key, from result_key, and the
+    kind of result, such as the pickled wait times of a run or a route file.
+    Reading an entry marks it as used, and once the entries take more than
+    maxBytes the least recently used ones are removed. Entries are written
+    to temporary names and renamed, so processes sharing the cache never
+    read a partial entry
+
+    Parameters
+    ----------
+    directory
+        Directory to keep the entries in
+        Default is CACHE_DIR
+    maxBytes
+        Largest total size of the entries
+        Default is MAX_BYTES
+    """
+    def __init__(self, directory = CACHE_DIR, maxBytes = MAX_BYTES):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+
+    def _file(self, key, name):
+        return os.path.join(self.directory, f"{key}-{name}")
+
+    def _touch(self, entryFile):
+        # Marking the entry as used, it may have just been evicted by another process
+        try:
+            os.utime(entryFile)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _write(self, entryFile, write):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+        temporaryFile = f"{entryFile}.{os.getpid()}.tmp"
+        write(temporaryFile)
+        os.replace(temporaryFile, entryFile)
+        self.evict()
+
+    def get(self, key, name = "run.pkl"):
+        """
+        Reads a cached result
+
+        Parameters
+        ----------
+        key
+            The key, from result_key
+        name
+            The kind of result
+            Default is "run.pkl"
+
+        Returns
+        -------
+        object
+            The result, None on a miss
+        """
+        entryFile = self._file(key, name)
+        if not self._touch(entryFile):
+            self.misses += 1
+            return None
+        with open(entryFile, 'rb') as pickleFile:
+            result = pickle.load(pickleFile)
+        self.hits += 1
+        return result
+
+    def put(self, key, result, name = "run.pkl"):
+        """
+        Stores a result
+
+        Parameters
+        ----------
+        key
+            The key, from result_key
+        result
+            The result to pickle
+        name
+            The kind of result
+            Default is "run.pkl"
+
+        Returns
+        -------
+        None
+        """
+        def write(temporaryFile):
+            with open(temporaryFile, 'wb') as pickleFile:
+                pickle.dump(result, pickleFile, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write(self._file(key, name), write)
+
+    def get_file(self, key, name, outputFile):
+        """
+        Copies a cached file out of the cache
+
+        Parameters
+        ----------
+        key
+            The key, from result_key
+        name
+            The kind of file
+        outputFile
+            Where to copy it to
+
+        Returns
+        -------
+        bool
+            True on a hit
+        """
+        entryFile = self._file(key, name)
+        if not self._touch(entryFile):
+            self.misses += 1
+            return False
+        shutil.copyfile(entryFile, outputFile + ".tmp")
+        os.replace(outputFile + ".tmp", outputFile)
+        self.hits += 1
+        return True
+
+    def put_file(self, key, name, inputFile):
+        """
+        Copies a file into the cache
+
+        Parameters
+        ----------
+        key
+            The key, from result_key
+        name
+            The kind of file
+        inputFile
+            The file to copy
+
+        Returns
+        -------
+        None
+        """
+        self._write(self._file(key, name), lambda temporaryFile: shutil.copyfile(inputFile, temporaryFile))
+
+    def entries(self):
+        """
+        Lists the entries, least recently used first
+
+        Returns
+        -------
+        list
+            (file, size) of every entry
+        """
+        if not os.path.exists(self.directory):
+            return []
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                status = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((status.st_mtime, entry.path, status.st_size))
+        return [(entryFile, size) for _, entryFile, size in sorted(entries)]
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in maxBytes
+
+        Returns
+        -------
+        int
+            Number of entries removed
+        """
+        entries = self.entries()
+        total = sum(size for _, size in entries)
+        removed = 0
+        for entryFile, size in entries:
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(entryFile)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """
+        Removes every entry
+
+        Returns
+        -------
+        None
+        """
+        for entryFile, _ in self.entries():
+            try:
+                os.remove(entryFile)
+            except FileNotFoundError:
+                pass
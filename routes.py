@@ -0,0 +1,333 @@
+import io
+import gzip
+import json
+import numpy as np
+
+# ------- Route Definitions -------
+VTYPE = {
+    "id": "car",
+    "accel": "0.8",
+    "decel": "4.5",
+    "sigma": "0.5",
+    "length": "5",
+    "minGap": "2.5",
+    "maxSpeed": "25",
+    "guiShape": "passenger",
+}
+
+ROUTE_IDS = ["right", "left", "down", "up", "right-up", "down-right", "left-down", "up-left"]
+ROUTE_EDGES = ["E0 E1", "-E1 -E0", "E2 E3", "-E3 -E2", "E0 -E2", "E2 E1", "-E1 E3", "-E3 -E0"]
+
+# Routes indexed by the direction drawn for straight and turning cars, with the id prefix
+# of the vehicles that take them
+STRAIGHT_ROUTES = ["right", "down", "left", "up"]
+TURN_ROUTES = ["right-up", "down-right", "left-down", "up-left"]
+STRAIGHT_PREFIXES = ["right", "down", "left", "up"]
+TURN_PREFIXES = ["right", "right", "right", "right"]
+
+# Probability of a car going straight
+STRAIGHT_PROBABILITY = 0.75
+
+# Entry and exit edges of the junction, the rows and columns of an OD matrix
+ORIGINS = ["E0", "-E1", "E2", "-E3"]
+DESTINATIONS = ["E1", "-E0", "E3", "-E2"]
+
+# Id prefix of the vehicles on each route, as drawn by the default generator
+ROUTE_PREFIXES = dict(zip(STRAIGHT_ROUTES + TURN_ROUTES, STRAIGHT_PREFIXES + TURN_PREFIXES))
+
+# Seconds each flow of a flow route file covers
+FLOW_STEPS = 300
+
+# Seconds of arrival counts drawn at a time, part of the random stream so it is fixed
+CHUNK_STEPS = 3600
+# Most vehicles built and held in memory at a time
+CHUNK_VEHICLES = 50000
+
+
+def _routes_header():
+    """
+    Builds the routes element opening, vType and route definitions
+
+    Returns
+    -------
+    str
+        The start of the route file
+    """
+    lines = ['<routes>\n']
+    vType = " ".join(f'{key}="{value}"' for key, value in VTYPE.items())
+    lines.append(f'    <vType {vType} />\n')
+    for id, edge in zip(ROUTE_IDS, ROUTE_EDGES):
+        lines.append(f'    <route id="{id}" edges="{edge}" />\n')
+    return "".join(lines)
+
+
+def demand_rates(profile, steps, numberOfCars = None):
+    """
+    Turns a demand profile into an arrival rate for every second
+
+    Parameters
+    ----------
+    profile
+        Either a list of (time, rate) breakpoints, linearly interpolated and
+        held constant past the ends, or a list of rates spread evenly over the steps
+        None is a constant rate
+    steps
+        The amount of virtual time to generate departures for
+    numberOfCars
+        Expected number of cars to scale the profile to, the profile then only gives the shape
+        Default is None, the profile is in vehicles per second
+
+    Returns
+    -------
+    ndarray
+        Expected arrivals in each second
+    """
+    if profile is None:
+        rates = np.ones(steps)
+    elif np.ndim(profile) == 2:
+        times, values = np.asarray(profile, dtype=float).T
+        rates = np.interp(np.arange(steps) + 0.5, times, values)
+    else:
+        values = np.asarray(profile, dtype=float)
+        rates = values[np.arange(steps) * len(values) // steps]
+
+    if np.any(rates < 0):
+        raise ValueError("Demand rates cannot be negative")
+    if rates.sum() <= 0:
+        raise ValueError("Demand profile has no demand over the run")
+    if numberOfCars is not None:
+        rates = rates * numberOfCars / rates.sum()
+    return rates
+
+
+def route_probabilities(odMatrix = None):
+    """
+    Turns an origin-destination matrix into the probability of each route
+
+    Parameters
+    ----------
+    odMatrix
+        Relative demand from each of ORIGINS (rows) to each of DESTINATIONS (columns)
+        Only pairs joined by one of ROUTE_IDS may be nonzero
+        Default is the 75/25 straight/turn split of every origin
+
+    Returns
+    -------
+    ndarray
+        Probability of each of ROUTE_IDS
+    """
+    if odMatrix is None:
+        probabilities = {route: STRAIGHT_PROBABILITY / 4 for route in STRAIGHT_ROUTES}
+        probabilities.update({route: (1 - STRAIGHT_PROBABILITY) / 4 for route in TURN_ROUTES})
+        return np.array([probabilities[route] for route in ROUTE_IDS])
+
+    odMatrix = np.asarray(odMatrix, dtype=float)
+    if odMatrix.shape != (len(ORIGINS), len(DESTINATIONS)) or np.any(odMatrix < 0) or odMatrix.sum() <= 0:
+        raise ValueError(f"OD matrix must be a nonnegative {len(ORIGINS)}x{len(DESTINATIONS)} matrix")
+
+    # Routes by the origin and destination edges they join
+    routeIndex = np.full(odMatrix.shape, -1)
+    for r, edges in enumerate(ROUTE_EDGES):
+        origin, destination = edges.split()
+        routeIndex[ORIGINS.index(origin), DESTINATIONS.index(destination)] = r
+    if np.any(odMatrix[routeIndex < 0] > 0):
+        raise ValueError("OD matrix has demand between edges no route joins")
+
+    probabilities = np.zeros(len(ROUTE_IDS))
+    probabilities[routeIndex[routeIndex >= 0]] = odMatrix[routeIndex >= 0]
+    return probabilities / probabilities.sum()
+
+
+def load_demand(file_name):
+    """
+    Reads a demand json file
+
+    Parameters
+    ----------
+    file_name
+        A json object with an optional "profile", see demand_rates,
+        and an optional "odMatrix", see route_probabilities
+
+    Returns
+    -------
+    tuple
+        The profile and the OD matrix, None where missing
+    """
+    with open(file_name, encoding='utf-8') as demandFile:
+        demand = json.load(demandFile)
+    return demand.get("profile"), demand.get("odMatrix")
+
+
+def open_routefile(file_name, compress = None):
+    """
+    Opens a route file for writing text, gzipped if asked
+
+    The gzip header has no timestamp or file name so the output is
+    byte-for-byte reproducible
+
+    Parameters
+    ----------
+    file_name
+        The file name to write to
+    compress
+        Set to gzip the file
+        Default is to gzip when the file name ends in ".gz"
+
+    Returns
+    -------
+    file
+        A text file object
+    """
+    if compress is None:
+        compress = file_name.endswith(".gz")
+    if not compress:
+        return open(file_name, 'w', encoding='utf-8')
+
+    # Leaving the file name out of the header too, it would change the bytes between names
+    rawFile = open(file_name, 'wb')
+    gzipFile = gzip.GzipFile(filename='', fileobj=rawFile, mode='wb', compresslevel=6, mtime=0)
+    # GzipFile leaves a file object it was given open, so it closes with the text wrapper
+    gzipFile.myfileobj = rawFile
+    return io.TextIOWrapper(gzipFile, encoding='utf-8')
+
+
+def stream_routefile(file_name, numberOfCars, steps, seed, compress = None, chunkSteps = CHUNK_STEPS,
+                     rates = None, routeProbabilities = None, chunkVehicles = CHUNK_VEHICLES):
+    """
+    Generates a route file by drawing vehicles in vectorized batches and
+    streaming them to the file
+
+    The arrival counts are drawn chunkSteps seconds at a time, and the
+    vehicles of those seconds are built and written at most chunkVehicles
+    at a time, so memory stays bounded however dense the demand. With a
+    rate per second the arrivals are a non-homogeneous Poisson process
+
+    Parameters
+    ----------
+    file_name
+        The xml file name to write to
+    numberOfCars
+        Expected number of cars over the simulation
+    steps
+        The amount of virtual time to generate departures for
+    seed
+        Seed for np.random.default_rng
+    compress
+        Set to gzip the file
+        Default is to gzip when the file name ends in ".gz"
+    chunkSteps
+        Seconds of departures drawn at a time
+        Changing it changes the generated vehicles
+    rates
+        Expected arrivals in each second, see demand_rates
+        Default is numberOfCars / steps every second
+    routeProbabilities
+        Probability of each of ROUTE_IDS, see route_probabilities
+        Default is to draw a turn and a direction like generate_routefile
+    chunkVehicles
+        Most vehicles built at a time
+        Changing it changes the generated vehicles of chunks with more vehicles
+
+    Returns
+    -------
+    int
+        The number of vehicles written
+    """
+    rng = np.random.default_rng(seed)
+    if rates is None:
+        rates = np.full(steps, numberOfCars / steps)
+
+    # Lookup array indexed by turn * 4 + direction
+    routes = np.array(STRAIGHT_ROUTES + TURN_ROUTES)
+
+    carId = 0
+    with open_routefile(file_name, compress) as routeFile:
+        routeFile.write(_routes_header())
+
+        for chunkStart in range(0, steps, chunkSteps):
+            chunkEnd = min(chunkStart + chunkSteps, steps)
+
+            # Drawing the arrivals of every second of the chunk
+            arrivals = rng.poisson(rates[chunkStart:chunkEnd])
+            arrived = np.cumsum(arrivals)
+
+            for vehicleStart in range(0, int(arrived[-1]), chunkVehicles):
+                vehicleEnd = min(vehicleStart + chunkVehicles, int(arrived[-1]))
+                numCars = vehicleEnd - vehicleStart
+
+                # Drawing the turns and directions of the vehicles
+                departs = chunkStart + np.searchsorted(arrived, np.arange(vehicleStart, vehicleEnd), side='right')
+                if routeProbabilities is None:
+                    turn = rng.uniform(size=numCars) <= 1 - STRAIGHT_PROBABILITY
+                    direction = rng.integers(0, 4, size=numCars)
+                    chosenRoutes = routes[turn * 4 + direction]
+                else:
+                    chosenRoutes = np.array(ROUTE_IDS)[rng.choice(len(ROUTE_IDS), size=numCars,
+                                                                  p=routeProbabilities)]
+                chosenPrefixes = [ROUTE_PREFIXES[route] for route in chosenRoutes.tolist()]
+
+                # Writing the vehicles in one go before building the next ones
+                ids = range(carId, carId + numCars)
+                routeFile.write("".join(
+                    f'    <vehicle type="car" departSpeed="10" depart="{depart}" id="{prefix}_{id}" '
+                    f'route="{route}" />\n'
+                    for depart, id, prefix, route in zip(departs.tolist(), ids,
+                                                         chosenPrefixes, chosenRoutes.tolist())))
+                carId += numCars
+
+        routeFile.write('</routes>\n')
+
+    return carId
+
+
+def write_flow_routefile(file_name, rates, routeProbabilities = None, flowSteps = FLOW_STEPS, compress = None):
+    """
+    Generates a route file of Poisson flows instead of single vehicles
+
+    Every route gets one flow per flowSteps seconds with the mean rate of
+    those seconds, SUMO draws the departures with period="exp(rate)". The
+    file size only grows with the simulated time, not with the vehicles,
+    and the vehicles follow SUMO's --seed instead of the route file seed
+
+    Parameters
+    ----------
+    file_name
+        The xml file name to write to
+    rates
+        Expected arrivals in each second, see demand_rates
+    routeProbabilities
+        Probability of each of ROUTE_IDS, see route_probabilities
+        Default is the 75/25 straight/turn split
+    flowSteps
+        Seconds each flow covers
+        Default is FLOW_STEPS
+    compress
+        Set to gzip the file
+        Default is to gzip when the file name ends in ".gz"
+
+    Returns
+    -------
+    int
+        The number of flows written
+    """
+    if routeProbabilities is None:
+        routeProbabilities = route_probabilities()
+
+    # Mean rate of each period and route
+    starts = np.arange(0, len(rates), flowSteps)
+    periodRates = np.add.reduceat(rates, starts) / np.diff(np.append(starts, len(rates)))
+    flowRates = periodRates[:, None] * np.asarray(routeProbabilities)[None, :]
+
+    numFlows = 0
+    with open_routefile(file_name, compress) as routeFile:
+        routeFile.write(_routes_header())
+        for period, begin in enumerate(starts.tolist()):
+            end = min(begin + flowSteps, len(rates))
+            for route, rate in zip(ROUTE_IDS, flowRates[period].tolist()):
+                if rate <= 0:
+                    continue
+                routeFile.write(f'    <flow id="{route}_{begin}" type="car" route="{route}" departSpeed="10" '
+                                f'begin="{begin}" end="{end}" period="exp({rate:.9g})" />\n')
+                numFlows += 1
+        routeFile.write('</routes>\n')
+    return numFlows
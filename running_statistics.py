@@ -0,0 +1,316 @@
+import math
+import numpy as np
+
+
+class P2Quantile:
+    """
+    Estimates a quantile of a stream with the P-Square algorithm
+
+    Keeps five markers instead of the samples, so every update is O(1)
+    (Jain and Chlamtac, 1985)
+
+    Parameters
+    ----------
+    p
+        The quantile to estimate, between 0 and 1
+    """
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+
+        # Marker heights, actual positions and desired positions
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        """
+        Adds a sample to the estimate
+
+        Parameters
+        ----------
+        x
+            The sample
+
+        Returns
+        -------
+        None
+        """
+        self.count += 1
+        heights = self._heights
+
+        # Collecting the first five samples
+        if self.count <= 5:
+            heights.append(x)
+            heights.sort()
+            return
+
+        # Finding the cell the sample falls in and adjusting the extremes
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+
+        # Moving the markers above the sample
+        positions = self._positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # Adjusting the middle markers if they are off their desired position
+        for i in range(1, 4):
+            d = self._desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or \
+               (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self._linear(i, d)
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i, d):
+        q = self._heights
+        n = self._positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def _linear(self, i, d):
+        q = self._heights
+        n = self._positions
+        return q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+
+    def value(self):
+        """
+        Gets the current estimate
+
+        Returns
+        -------
+        float
+            The estimated quantile, nan if there are no samples
+        """
+        if self.count == 0:
+            return math.nan
+        # Too few samples for the markers, interpolate like np.percentile
+        if self.count <= 5:
+            rank = self.p * (self.count - 1)
+            lower = int(math.floor(rank))
+            upper = min(lower + 1, self.count - 1)
+            return self._heights[lower] + (rank - lower) * (self._heights[upper] - self._heights[lower])
+        return self._heights[2]
+
+
+class RunningStatistics:
+    """
+    Streaming accumulator for the mean, variance, extremes and quantiles
+
+    Every update is O(1) no matter how many samples have been added
+
+    Parameters
+    ----------
+    quantiles
+        The quantiles to estimate
+        Default is the 50th, 90th and 99th percentile
+    """
+    def __init__(self, quantiles = (0.5, 0.9, 0.99)):
+        self.count = 0
+        self.mean = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._m2 = 0.0
+        self._quantiles = {p: P2Quantile(p) for p in quantiles}
+
+    def add(self, x):
+        """
+        Adds a sample
+
+        Parameters
+        ----------
+        x
+            The sample
+
+        Returns
+        -------
+        None
+        """
+        # Welford's algorithm for the mean and variance
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+        for quantile in self._quantiles.values():
+            quantile.add(x)
+
+    @property
+    def variance(self):
+        """
+        The sample variance, nan for fewer than two samples
+        """
+        if self.count < 2:
+            return math.nan
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        """
+        The sample standard deviation
+        """
+        return math.sqrt(self.variance)
+
+    def quantile(self, p):
+        """
+        Gets the estimate of a tracked quantile
+
+        Parameters
+        ----------
+        p
+            The quantile, must be one given at creation
+
+        Returns
+        -------
+        float
+            The estimated quantile
+        """
+        return self._quantiles[p].value()
+
+    def percentile(self, q):
+        """
+        Gets the estimate of a tracked percentile
+
+        Parameters
+        ----------
+        q
+            The percentile between 0 and 100
+
+        Returns
+        -------
+        float
+            The estimated percentile
+        """
+        return self.quantile(q / 100)
+
+
+class Histogram:
+    """
+    Streaming histogram with fixed width bins, for large batches of samples
+
+    Memory grows with the range of the samples, not their number. Samples
+    are added in NumPy batches, so it is much faster than RunningStatistics
+    for millions of samples, and percentiles are exact to the bin width
+
+    Parameters
+    ----------
+    binWidth
+        The width of the bins
+        Default is 0.1
+    """
+    def __init__(self, binWidth = 0.1):
+        self.binWidth = binWidth
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._sum = 0.0
+        self._sumSquares = 0.0
+        self._origin = 0
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    def add_many(self, values):
+        """
+        Adds a batch of samples
+
+        Parameters
+        ----------
+        values
+            The samples
+
+        Returns
+        -------
+        None
+        """
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._sum += float(values.sum())
+        self._sumSquares += float(np.dot(values, values))
+
+        # Growing the bins to cover the batch
+        bins = np.floor(values / self.binWidth).astype(np.int64)
+        low = int(bins.min())
+        high = int(bins.max())
+        if len(self._counts) == 0:
+            self._origin = low
+        if low < self._origin:
+            self._counts = np.concatenate([np.zeros(self._origin - low, dtype=np.int64), self._counts])
+            self._origin = low
+        if high - self._origin + 1 > len(self._counts):
+            self._counts = np.concatenate(
+                [self._counts, np.zeros(high - self._origin + 1 - len(self._counts), dtype=np.int64)])
+
+        self._counts += np.bincount(bins - self._origin, minlength=len(self._counts))
+
+    @property
+    def mean(self):
+        """
+        The mean, nan if there are no samples
+        """
+        if self.count == 0:
+            return math.nan
+        return self._sum / self.count
+
+    @property
+    def variance(self):
+        """
+        The sample variance, nan for fewer than two samples
+        """
+        if self.count < 2:
+            return math.nan
+        return max(0.0, (self._sumSquares - self._sum * self._sum / self.count) / (self.count - 1))
+
+    @property
+    def std(self):
+        """
+        The sample standard deviation
+        """
+        return math.sqrt(self.variance)
+
+    def percentile(self, q):
+        """
+        Gets a percentile, interpolated within its bin
+
+        Parameters
+        ----------
+        q
+            The percentile between 0 and 100
+
+        Returns
+        -------
+        float
+            The percentile, nan if there are no samples
+        """
+        if self.count == 0:
+            return math.nan
+        target = q / 100 * self.count
+        cumulative = np.cumsum(self._counts)
+        b = min(int(np.searchsorted(cumulative, target)), len(cumulative) - 1)
+        before = cumulative[b - 1] if b > 0 else 0
+        fraction = (target - before) / self._counts[b] if self._counts[b] > 0 else 0.0
+        value = (self._origin + b + fraction) * self.binWidth
+        return float(min(max(value, self.min), self.max))
@@ -0,0 +1,123 @@
+import numpy as np
+
+
+class DecisionScheduler:
+    """
+    Decides when each junction's controller has to be evaluated again
+
+    A junction in a green phase is re-evaluated when the phase starts, when
+    its arriving or queuing vehicles changed by more than a threshold since
+    its last decision, or when the decision interval has passed. Otherwise
+    its last output still stands. A phase duration is only sent when it
+    shortens the phase, any other setPhaseDuration call would not change it
+
+    With the default threshold of 0 and no interval every skipped decision
+    would have given the same output, so the control is unchanged
+
+    Parameters
+    ----------
+    numJunctions
+        Number of junctions to schedule
+    countThreshold
+        Change in arriving or queuing vehicles that is ignored
+        Default is 0
+    interval
+        Steps after which a junction is re-evaluated even without changes
+        Default is None, never
+    """
+    def __init__(self, numJunctions, countThreshold = 0, interval = None):
+        self.countThreshold = countThreshold
+        self.interval = interval
+
+        self.output = np.full(numJunctions, np.inf)
+        self._lastPhase = np.full(numJunctions, -1)
+        self._lastArriving = np.zeros(numJunctions)
+        self._lastQueuing = np.zeros(numJunctions)
+        self._lastDecision = np.zeros(numJunctions, dtype=int)
+
+        self.controlSteps = 0
+        self.decisions = 0
+        self.phaseDurationCalls = 0
+
+    def due(self, step, phases, control, arrivingVehicles, queuingVehicles):
+        """
+        Finds the junctions to evaluate this step
+
+        Parameters
+        ----------
+        step
+            The simulation step
+        phases
+            The current phase of each junction
+        control
+            Whether each junction is in a controlled phase
+        arrivingVehicles
+            Arriving vehicles of each junction
+        queuingVehicles
+            Queuing vehicles of each junction
+
+        Returns
+        -------
+        ndarray
+            Indices of the junctions to evaluate
+        """
+        due = (phases != self._lastPhase) \
+            | (np.abs(arrivingVehicles - self._lastArriving) > self.countThreshold) \
+            | (np.abs(queuingVehicles - self._lastQueuing) > self.countThreshold)
+        if self.interval is not None:
+            due |= step - self._lastDecision >= self.interval
+        self._lastPhase = phases
+        self.controlSteps += int(np.count_nonzero(control))
+        return np.flatnonzero(due & control)
+
+    def decide(self, step, junctions, arrivingVehicles, queuingVehicles, output, remainingDuration):
+        """
+        Records the outputs of the evaluated junctions
+
+        Parameters
+        ----------
+        step
+            The simulation step
+        junctions
+            Indices of the evaluated junctions, from due
+        arrivingVehicles
+            Arriving vehicles of the evaluated junctions
+        queuingVehicles
+            Queuing vehicles of the evaluated junctions
+        output
+            The controller output of the evaluated junctions
+        remainingDuration
+            Time left in the current phase of the evaluated junctions
+
+        Returns
+        -------
+        tuple
+            Indices of the junctions whose phase is shortened and their new durations
+        """
+        self._lastArriving[junctions] = arrivingVehicles
+        self._lastQueuing[junctions] = queuingVehicles
+        self._lastDecision[junctions] = step
+        self.output[junctions] = output
+        self.decisions += len(junctions)
+
+        shortened = output < remainingDuration
+        self.phaseDurationCalls += int(np.count_nonzero(shortened))
+        return junctions[shortened], output[shortened]
+
+    def report(self):
+        """
+        Counts the decisions and TraCI calls made and skipped
+
+        Returns
+        -------
+        dict
+            Steps junctions spent in controlled phases, decisions made and
+            skipped, and setPhaseDuration calls made and skipped
+        """
+        return {
+            "controlSteps": self.controlSteps,
+            "decisions": self.decisions,
+            "skippedDecisions": self.controlSteps - self.decisions,
+            "phaseDurationCalls": self.phaseDurationCalls,
+            "skippedPhaseDurationCalls": self.controlSteps - self.phaseDurationCalls,
+        }
@@ -0,0 +1,107 @@
+from time import perf_counter
+
+
+class SumoSession:
+    """
+    Keeps one SUMO connection alive across simulation runs
+
+    The first run starts SUMO, every later run resets the same SUMO with
+    traci.load and the new arguments, skipping the process launch and the
+    connection retries. The time spent starting or loading is kept apart
+    from the time spent simulating
+
+    Parameters
+    ----------
+    traci
+        The backend to run on, see backends.py
+    sumoBinary
+        The SUMO binary to start
+    label
+        Label of the TraCI connection, must be unique among running simulations
+        Default is "default"
+    keepAlive
+        Set to reuse SUMO between runs, otherwise every run starts and closes it
+        Default is True
+    """
+    def __init__(self, traci, sumoBinary, label = "default", keepAlive = True):
+        self.traci = traci
+        self.sumoBinary = sumoBinary
+        self.label = label
+        self.keepAlive = keepAlive
+
+        self.starts = 0
+        self.loads = 0
+        self.startupTime = 0.0
+        self.simulationTime = 0.0
+        self.lastStartupTime = 0.0
+        self.lastSimulationTime = 0.0
+
+        self._running = False
+        self._runStart = 0.0
+
+    def open(self, args):
+        """
+        Starts SUMO, or reloads the running SUMO, for a new run
+
+        Parameters
+        ----------
+        args
+            SUMO arguments without the binary
+
+        Returns
+        -------
+        None
+        """
+        start = perf_counter()
+        if self._running:
+            self.traci.load(list(args))
+            self.loads += 1
+        else:
+            self.traci.start([self.sumoBinary] + list(args), label=self.label)
+            self._running = True
+            self.starts += 1
+        self._runStart = perf_counter()
+
+        self.lastStartupTime = self._runStart - start
+        self.startupTime += self.lastStartupTime
+
+    def finish(self):
+        """
+        Ends a run, SUMO is left running for the next one when kept alive
+
+        Returns
+        -------
+        None
+        """
+        self.lastSimulationTime = perf_counter() - self._runStart
+        self.simulationTime += self.lastSimulationTime
+        if not self.keepAlive:
+            self.close()
+
+    def close(self):
+        """
+        Closes the connection and SUMO
+
+        Returns
+        -------
+        None
+        """
+        if self._running:
+            self.traci.close()
+            self._running = False
+
+    def timings(self):
+        """
+        Gets the time spent starting SUMO and simulating
+
+        Returns
+        -------
+        dict
+            Number of starts and loads and the startup and simulation time in seconds
+        """
+        return {
+            "starts": self.starts,
+            "loads": self.loads,
+            "startupTime": self.startupTime,
+            "simulationTime": self.simulationTime,
+        }
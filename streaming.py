@@ -0,0 +1,124 @@
+import numpy as np
+
+# Steps of lane values sent to the queue at a time
+BATCH_STEPS = 50
+
+
+class MetricStreamer:
+    """
+    Sends the lane values of every simulation step to a queue
+
+    Records are plain dicts, sent in batches of batchSteps steps so a run
+    makes one queue put per batch instead of one per step. The queue should
+    be bounded, a full queue blocks the simulation until the consumer catches
+    up, so a slow consumer slows the runs down instead of growing memory
+
+    Records are
+        {"run", "event": "start", "controller", "lanes"} when a run starts
+        {"run", "event": "step", "controller", "step", "time", "vehicles", "waitingTime"}
+        every step, with the vehicle number and summed waiting time of each lane
+        {"run", "event": "end", "controller", "steps"} when a run ends
+
+    Parameters
+    ----------
+    queue
+        A queue.Queue or multiprocessing queue to put lists of records on
+    run
+        Name of the run in the records
+    batchSteps
+        Steps of records sent at a time
+        Default is BATCH_STEPS
+    """
+    def __init__(self, queue, run, batchSteps = BATCH_STEPS):
+        self.queue = queue
+        self.run = run
+        self.batchSteps = batchSteps
+        self._batch = []
+        self._controller = None
+        self._lanes = None
+
+    def begin(self, trafficLightType, laneNames):
+        """
+        Starts streaming a simulation run
+
+        Parameters
+        ----------
+        trafficLightType
+            The type of traffic light of the run
+        laneNames
+            The names of the lanes, in the order of the collector's lanes
+
+        Returns
+        -------
+        None
+        """
+        self._controller = trafficLightType
+        self._lanes = np.arange(len(laneNames))
+        self._batch.append({"run": self.run, "event": "start", "controller": trafficLightType,
+                            "lanes": list(laneNames)})
+
+    def record(self, step, collector):
+        """
+        Adds the lane values of a step
+
+        Parameters
+        ----------
+        step
+            The simulation step
+        collector
+            The collector of the run, after its update for the step
+
+        Returns
+        -------
+        None
+        """
+        self._batch.append({"run": self.run, "event": "step", "controller": self._controller, "step": step,
+                            "time": collector.time(),
+                            "vehicles": collector.vehicle_numbers().tolist(),
+                            "waitingTime": collector.waiting_times(self._lanes).tolist()})
+        if len(self._batch) >= self.batchSteps:
+            self.flush()
+
+    def end(self, steps):
+        """
+        Ends streaming a simulation run and sends what is left
+
+        Parameters
+        ----------
+        steps
+            Number of steps simulated
+
+        Returns
+        -------
+        None
+        """
+        self._batch.append({"run": self.run, "event": "end", "controller": self._controller, "steps": steps})
+        self.flush()
+
+    def send(self, record):
+        """
+        Sends a record of the run right away, after the buffered ones
+
+        Parameters
+        ----------
+        record
+            The record, "run" is added
+
+        Returns
+        -------
+        None
+        """
+        self._batch.append(dict(record, run=self.run))
+        self.flush()
+
+    def flush(self):
+        """
+        Puts the buffered records on the queue, blocking while it is full
+
+        Returns
+        -------
+        None
+        """
+        if self._batch:
+            self.queue.put(self._batch)
+            self._batch = []
@@ -0,0 +1,239 @@
+import os
+import csv
+import itertools
+import optparse
+import tempfile
+import threading
+import multiprocessing.util
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from main import init, TrafficSimulator, statistics_path, SEED, STEPS, N
+from backends import load_backend, sumo_binary
+from session import SumoSession
+from fuzzy_controller import compiled_fuzzy_logic_controller
+
+# Creating Options
+optParser = optparse.OptionParser()
+optParser.add_option("--seeds", default=str(SEED), help="comma separated random seeds")
+optParser.add_option("--cars", default=str(N), help="comma separated numbers of cars")
+optParser.add_option("--cycle-times", dest="cycleTimes", default="42",
+                     help="comma separated fixed cycle times")
+optParser.add_option("--controllers", default="Fixed,Fuzzy",
+                     help="comma separated traffic light types, Fixed or Fuzzy")
+optParser.add_option("--steps", type="int", default=STEPS, help="virtual time to simulate")
+optParser.add_option("--backend", default="traci", help="simulation backend, traci, libsumo or mock")
+optParser.add_option("--workers", type="int", default=None,
+                     help="number of worker processes, default is the number of CPUs")
+optParser.add_option("--output", default=os.path.join(statistics_path, "sweep.csv"),
+                     help="csv file to write the merged results to")
+
+# One simulation run of the sweep
+Scenario = namedtuple("Scenario", ["seed", "numberOfCars", "fixedCycleTime", "controller"])
+
+# SUMO session of each worker thread, kept running between its scenarios
+_sessions = threading.local()
+
+
+def scenario_grid(seeds, numbersOfCars, fixedCycleTimes, controllers):
+    """
+    Builds every combination of the sweep parameters
+
+    Parameters
+    ----------
+    seeds
+        Random seeds for the route files
+    numbersOfCars
+        Numbers of cars to simulate
+    fixedCycleTimes
+        Cycle times of the traffic light
+    controllers
+        Traffic light types, "Fixed" or "Fuzzy"
+
+    Returns
+    -------
+    list
+        The scenarios
+    """
+    return [Scenario(*values) for values in
+            itertools.product(seeds, numbersOfCars, fixedCycleTimes, controllers)]
+
+
+def compile_for_workers(scenarios):
+    """
+    Compiles the fuzzy lookup table before starting workers, so they only load it
+
+    Parameters
+    ----------
+    scenarios
+        The scenarios the workers will run
+
+    Returns
+    -------
+    None
+    """
+    if any(scenario.controller == "Fuzzy" for scenario in scenarios):
+        compiled_fuzzy_logic_controller()
+
+
+def worker_session(backend = "traci"):
+    """
+    Gets the SUMO session of this worker, started on first use
+
+    Every process, and every thread of a thread pool, has its own session,
+    closed when the process exits
+
+    Parameters
+    ----------
+    backend
+        The simulation backend, "traci", "libsumo" or "mock"
+
+    Returns
+    -------
+    SumoSession
+        The session
+    """
+    if getattr(_sessions, "session", None) is None:
+        session = SumoSession(load_backend(backend), sumo_binary(backend, True),
+                              label=f"sweep-{os.getpid()}-{threading.get_ident()}")
+        # Closing SUMO when the worker exits so it writes its outputs, pool workers skip atexit but run finalizers
+        multiprocessing.util.Finalize(None, session.close, exitpriority=0)
+        _sessions.session = session
+    return _sessions.session
+
+
+def run_scenario(scenario, steps = STEPS, backend = "traci", streamer = None, maxSamples = None):
+    """
+    Runs one scenario on the SUMO of this worker process
+
+    Every worker keeps one SUMO running and reloads it for each scenario.
+    The route file and outputs are written to a temporary directory and
+    the TraCI connection is labelled with the process id, so scenarios can
+    run at the same time. The network file is shared, cycle times are set
+    through TraCI
+
+    Parameters
+    ----------
+    scenario
+        The scenario to run
+    steps
+        The amount of virtual time to simulate
+    backend
+        The simulation backend, "traci", "libsumo" or "mock"
+    streamer
+        MetricStreamer to send the lane values of every step to
+        Default is None, no streaming
+    maxSamples
+        Number of most recent wait time samples kept per lane, see MetricSeries
+        Default is None, keep every sample
+
+    Returns
+    -------
+    dict
+        A row of the results table
+    """
+    # SUMO keeps the outputs of a finished run open until the next load
+    with tempfile.TemporaryDirectory(prefix="traffic-sweep-", ignore_cleanup_errors=True) as workDir:
+        # Isolated route file
+        routeFile = os.path.join(workDir, "traffic.rou.xml")
+
+        traffic = TrafficSimulator(scenario.numberOfCars, steps, True,
+                                   fixedCycleTime=scenario.fixedCycleTime, compiledFuzzy=True,
+                                   seed=scenario.seed, routeFile=routeFile,
+                                   outputDir=workDir, backend=backend, session=worker_session(backend),
+                                   streamer=streamer, maxSamples=maxSamples)
+        traffic.generate_routefile(routeFile)
+
+        if scenario.controller == "Fixed":
+            traffic.run_fixed()
+        else:
+            # The fuzzy controller shortens green phases from the cycle time
+            traffic.run_fuzzy()
+
+    # Summarising the lanes
+    row = scenario._asdict()
+    row["simulationSteps"] = traffic.lastRunSteps
+    row["startupTime"] = traffic.session.lastStartupTime
+    row["simulationTime"] = traffic.session.lastSimulationTime
+    percentiles = []
+    for lane in traffic.waitingTime.lanes:
+        statistics = traffic.waitingTime.statistics(lane, scenario.controller)
+        row[f"{lane} mean"] = statistics.mean
+        row[f"{lane} 50th percentile"] = statistics.percentile(50)
+        row[f"{lane} 90th percentile"] = statistics.percentile(90)
+        row[f"{lane} 99th percentile"] = statistics.percentile(99)
+        percentiles.append(statistics.percentile(90))
+    row["All 90th percentile"] = np.nanmean(percentiles)
+    return row
+
+
+def run_sweep(scenarios, steps = STEPS, workers = None, backend = "traci", executor = None):
+    """
+    Runs the scenarios in a process pool
+
+    Parameters
+    ----------
+    scenarios
+        The scenarios to run
+    steps
+        The amount of virtual time to simulate
+    workers
+        Number of worker processes
+        Default is the number of CPUs
+    backend
+        The simulation backend, "traci", "libsumo" or "mock"
+    executor
+        A running process pool to reuse, so its workers keep their SUMO sessions
+        Default is a new pool of workers processes, shut down after the sweep
+
+    Returns
+    -------
+    list
+        One result row per scenario, in the order of the scenarios
+    """
+    compile_for_workers(scenarios)
+
+    if executor is not None:
+        return list(executor.map(run_scenario, scenarios, itertools.repeat(steps),
+                                 itertools.repeat(backend)))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_scenario, scenarios, itertools.repeat(steps),
+                                 itertools.repeat(backend)))
+
+
+def write_results(rows, outputFile):
+    """
+    Writes the merged results table
+
+    Parameters
+    ----------
+    rows
+        The result rows from run_sweep
+    outputFile
+        The csv file to write to
+
+    Returns
+    -------
+    None
+    """
+    with open(outputFile, 'w', encoding='utf-8', newline='') as csvFile:
+        csvFileWriter = csv.DictWriter(csvFile, fieldnames=list(rows[0].keys()))
+        csvFileWriter.writeheader()
+        csvFileWriter.writerows(rows)
+
+
+if __name__ == "__main__":
+    options, args = optParser.parse_args()
+    init(options.backend)
+
+    scenarios = scenario_grid([int(seed) for seed in options.seeds.split(",")],
+                              [int(cars) for cars in options.cars.split(",")],
+                              [int(cycleTime) for cycleTime in options.cycleTimes.split(",")],
+                              options.controllers.split(","))
+    rows = run_sweep(scenarios, options.steps, options.workers, options.backend)
+    write_results(rows, options.output)
+    print(f"Wrote {len(rows)} scenarios to {options.output}")
+    print(f"SUMO startup {sum(row['startupTime'] for row in rows):.2f} s, "
+          f"simulation {sum(row['simulationTime'] for row in rows):.2f} s")
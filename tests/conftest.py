@@ -0,0 +1,30 @@
+import os
+import sys
+import shutil
+import pytest
+
+# The modules are flat files in the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Running in a copy of the network so route files, outputs and caches stay out of the repository
+    for fileName in ["traffic.net.xml", "traffic.sumocfg"]:
+        shutil.copy(os.path.join(ROOT, fileName), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def simulate(workdir):
+    # Builds simulators on the SUMO free queue model with a small demand
+    from main import TrafficSimulator
+
+    def build(numberOfCars = 300, steps = 600, **options):
+        traffic = TrafficSimulator(numberOfCars, steps, False, compiledFuzzy=True, backend="mock",
+                                   routeFile="traffic.rou.xml", outputDir="outputs", **options)
+        traffic.generate_routefile("traffic.rou.xml")
+        return traffic
+    return build
@@ -0,0 +1,61 @@
+import os
+import gzip
+import numpy as np
+import pytest
+
+from checkpoint import load_checkpoint, _drop_empty_signal_states
+
+
+@pytest.mark.parametrize("trafficLightType", ["Fixed", "Fuzzy"])
+def test_resume_reproduces_an_uninterrupted_run(simulate, trafficLightType):
+    run = f"run_{trafficLightType.lower()}"
+
+    traffic = simulate(checkpointInterval=200)
+    getattr(traffic, run)()
+    uninterrupted = {lane: view.copy() for lane, view in traffic.waitingTime.views(trafficLightType).items()}
+    percentile = traffic.find_90th_percentile()[trafficLightType]
+    steps = traffic.lastRunSteps
+    traffic.close()
+
+    # Losing the final checkpoint as if the run was killed after the one before it
+    checkpoints = traffic.checkpointer.checkpoints(trafficLightType)
+    assert len(checkpoints) == 2
+    os.remove(checkpoints[-1])
+    os.remove(checkpoints[-1][:-len(".pkl")] + ".state.xml.gz")
+
+    resumed = simulate(checkpointInterval=200, resume=True)
+    simulationStep = resumed.traci.simulationStep
+    simulated = []
+    resumed.traci.simulationStep = lambda *args: simulated.append(1) or simulationStep(*args)
+    getattr(resumed, run)()
+    resumed.close()
+
+    # Only the steps after the last checkpoint are simulated again
+    assert len(simulated) == steps - load_checkpoint(checkpoints[0])["step"]
+    assert resumed.lastRunSteps == steps
+    assert resumed.find_90th_percentile()[trafficLightType] == percentile
+    for lane, view in resumed.waitingTime.views(trafficLightType).items():
+        np.testing.assert_array_equal(view, uninterrupted[lane])
+
+
+def test_checkpoints_leave_no_temporary_files(simulate):
+    traffic = simulate(checkpointInterval=200)
+    traffic.run_fixed()
+    traffic.close()
+
+    assert not [name for name in os.listdir(traffic.checkpointer.directory) if ".tmp" in name]
+
+
+def test_only_signal_states_are_dropped(workdir):
+    stateFile = os.path.join(workdir, "state.xml.gz")
+    with gzip.open(stateFile, 'wb') as xmlFile:
+        xmlFile.write(b'<?xml version="1.0"?>\n<snapshot>\n'
+                      b'    <tlLogic id="J2" programID="0" phase="0" state=""/>\n'
+                      b'    <vehicle id="car_1" state=""/>\n'
+                      b'</snapshot>\n')
+
+    _drop_empty_signal_states(stateFile)
+    with gzip.open(stateFile, 'rb') as xmlFile:
+        content = xmlFile.read()
+    assert b'<tlLogic id="J2" programID="0" phase="0"/>' in content
+    assert b'<vehicle id="car_1" state=""/>' in content
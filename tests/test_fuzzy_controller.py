@@ -0,0 +1,37 @@
+import os
+import numpy as np
+
+from fuzzy_controller import (UNIVERSES, batch_compute, compiled_fuzzy_logic_controller, definition_hash,
+                              fuzzy_logic_controller, verify_compiled_controller)
+
+
+def test_compiled_lookup_matches_skfuzzy_on_the_grid():
+    compiled = compiled_fuzzy_logic_controller(cacheDir=None)
+    rng = np.random.default_rng(1)
+    arrivingVehicles = rng.integers(*UNIVERSES["arrivingVehicles"], 50)
+    queuingVehicles = rng.integers(*UNIVERSES["queuingVehicles"], 50)
+
+    expected = batch_compute(fuzzy_logic_controller(), arrivingVehicles, queuingVehicles)
+    np.testing.assert_allclose(batch_compute(compiled, arrivingVehicles, queuingVehicles), expected, atol=1e-9)
+
+
+def test_compiled_lookup_interpolates_between_grid_points():
+    compiled = compiled_fuzzy_logic_controller(cacheDir=None)
+    assert verify_compiled_controller(compiled, samples=50) <= 5.0
+
+    # Halfway between two grid points is the mean of their cycle times
+    table = compiled.table
+    assert compiled.lookup(10.5, 20) == (table[10, 20] + table[11, 20]) / 2
+
+
+def test_compiled_table_is_cached_by_definition(workdir):
+    membershipFunctions = {
+        "arrivingVehicles": {"low": [0, 0, 15], "medium": [10, 20, 40], "high": [30, 101, 101]},
+        "queuingVehicles": {"low": [0, 0, 15], "medium": [10, 20, 40], "high": [30, 101, 101]},
+        "cycleTime": {"short": [0, 0, 12], "medium": [8, 20, 30], "long": [25, 50, 50]},
+    }
+    compiled = compiled_fuzzy_logic_controller(membershipFunctions, cacheDir=str(workdir))
+
+    tableFile = os.path.join(workdir, f"fuzzy-{definition_hash(membershipFunctions)}.npy")
+    np.testing.assert_array_equal(np.load(tableFile), compiled.table)
+    assert compiled_fuzzy_logic_controller(membershipFunctions, cacheDir=str(workdir)) is compiled
@@ -0,0 +1,17 @@
+import pytest
+
+from benchmark import import_time, IMPORT_BUDGET, LAZY_PACKAGES
+
+
+@pytest.fixture(scope="module")
+def mainImport():
+    # Importing main in fresh interpreters, the fastest of them is kept
+    return import_time("main")
+
+
+def test_import_main_within_budget(mainImport):
+    assert mainImport["time"] < IMPORT_BUDGET, f"slowest imports: {mainImport['slowest']}"
+
+
+def test_import_main_loads_no_lazy_packages(mainImport):
+    assert mainImport["lazy"] == [], f"import main loaded {mainImport['lazy']} of {LAZY_PACKAGES}"
@@ -0,0 +1,56 @@
+import pickle
+import numpy as np
+import pytest
+
+from metrics import MetricSeries, MetricsStore
+
+
+def test_series_grows_past_its_capacity():
+    series = MetricSeries(capacity=2)
+    for step in range(10):
+        series.append(step, float(step))
+
+    assert len(series) == 10
+    np.testing.assert_array_equal(series.view()["steps"], np.arange(10))
+    assert series.dropped == 0
+
+
+def test_ring_buffer_keeps_the_latest_samples_in_order():
+    series = MetricSeries(capacity=2, maxSamples=5)
+    waitTimes = np.arange(12, dtype=float) * 1.5
+    for step, waitTime in enumerate(waitTimes):
+        series.append(step, waitTime)
+
+    view = series.view()
+    assert len(series) == 5
+    assert series.dropped == 7
+    np.testing.assert_array_equal(view["steps"], np.arange(7, 12))
+    np.testing.assert_array_equal(view["waitTime"], waitTimes[7:])
+
+    # The running statistics still cover the overwritten samples
+    assert series.statistics.count == 12
+    assert series.statistics.mean == pytest.approx(waitTimes.mean())
+    assert view["averageOvertime"][-1] == pytest.approx(waitTimes.mean())
+
+
+def test_ring_buffer_survives_pickling_after_wrapping():
+    series = MetricSeries(maxSamples=4)
+    for step in range(9):
+        series.append(step, float(step))
+
+    restored = pickle.loads(pickle.dumps(series))
+    np.testing.assert_array_equal(restored.view(), series.view())
+    restored.append(9, 9.0)
+    np.testing.assert_array_equal(restored.view()["steps"], np.arange(6, 10))
+
+
+def test_store_views_every_lane():
+    store = MetricsStore(["Lane 1", "Lane 2"], maxSamples=3)
+    for step in range(5):
+        store.series("Lane 1", "Fixed").append(step, 1.0)
+        store.series("Lane 2", "Fixed").append(step, 2.0)
+
+    views = store.views("Fixed")
+    assert list(views) == ["Lane 1", "Lane 2"]
+    np.testing.assert_array_equal(views["Lane 2"]["steps"], [2, 3, 4])
+    assert len(store.view("Lane 1", "Fuzzy")) == 0
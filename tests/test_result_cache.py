@@ -0,0 +1,58 @@
+import os
+import numpy as np
+
+from result_cache import ResultCache, result_key
+
+
+def test_put_and_get(workdir):
+    cache = ResultCache(str(workdir / "cache"))
+    key = result_key(kind="run", seed=1)
+
+    assert cache.get(key) is None
+    cache.put(key, {"steps": 10})
+    assert cache.get(key) == {"steps": 10}
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert result_key(kind="run", seed=2) != key
+
+
+def test_least_recently_used_entries_are_evicted(workdir):
+    cache = ResultCache(str(workdir / "cache"), maxBytes=2500)
+    keys = [result_key(entry=i) for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.put(key, b"x" * 1000)
+        os.utime(cache._file(key, "run.pkl"), (i, i))
+
+    # Reading the first entry makes the second the least recently used
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], b"x" * 1000)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    assert sum(size for _, size in cache.entries()) <= cache.maxBytes
+
+
+def test_cached_runs_match_simulated_ones(simulate, workdir):
+    cache = ResultCache(str(workdir / "cache"))
+
+    traffic = simulate(resultCache=cache)
+    traffic.run_fixed()
+    traffic.run_fuzzy()
+    traffic.close()
+    assert (cache.hits, cache.misses) == (0, 3)
+
+    cached = simulate(resultCache=cache)
+    cached.run_fixed()
+    cached.run_fuzzy()
+    cached.close()
+    assert (cache.hits, cache.misses) == (3, 3)
+    assert cached.find_90th_percentile() == traffic.find_90th_percentile()
+    for trafficLightType in ["Fixed", "Fuzzy"]:
+        for lane, view in cached.waitingTime.views(trafficLightType).items():
+            np.testing.assert_array_equal(view, traffic.waitingTime.view(lane, trafficLightType))
+
+    # Anything the run depends on changing misses the cache
+    changed = simulate(resultCache=cache, fixedCycleTime=30)
+    changed.run_fixed()
+    changed.close()
+    assert cache.misses == 4
@@ -0,0 +1,57 @@
+import math
+import numpy as np
+import pytest
+
+from running_statistics import P2Quantile, RunningStatistics, Histogram
+
+
+@pytest.fixture
+def samples():
+    # Skewed like wait times, most lanes wait little and a few a lot
+    return np.random.default_rng(0).gamma(2.0, 10.0, 20000)
+
+
+def test_welford_matches_numpy(samples):
+    statistics = RunningStatistics()
+    for x in samples:
+        statistics.add(x)
+
+    assert statistics.count == len(samples)
+    assert statistics.mean == pytest.approx(np.mean(samples), rel=1e-12)
+    assert statistics.variance == pytest.approx(np.var(samples, ddof=1), rel=1e-9)
+    assert statistics.std == pytest.approx(np.std(samples, ddof=1), rel=1e-9)
+    assert statistics.min == samples.min()
+    assert statistics.max == samples.max()
+
+
+def test_p2_quantiles_match_numpy(samples):
+    statistics = RunningStatistics()
+    for x in samples:
+        statistics.add(x)
+
+    for q in [50, 90, 99]:
+        assert statistics.percentile(q) == pytest.approx(np.percentile(samples, q), rel=0.02)
+
+
+def test_p2_is_exact_for_few_samples():
+    values = [3.0, 1.0, 4.0, 1.0, 5.0]
+    for count in range(1, len(values) + 1):
+        quantile = P2Quantile(0.9)
+        for x in values[:count]:
+            quantile.add(x)
+        assert quantile.value() == pytest.approx(np.percentile(values[:count], 90))
+
+
+def test_empty_statistics_have_no_value():
+    assert math.isnan(P2Quantile(0.5).value())
+    assert math.isnan(RunningStatistics().variance)
+
+
+def test_histogram_matches_numpy_to_a_bin(samples):
+    histogram = Histogram(binWidth=0.1)
+    histogram.add_many(samples)
+
+    assert histogram.count == len(samples)
+    assert histogram.mean == pytest.approx(np.mean(samples), rel=1e-9)
+    for q in [50, 90, 99]:
+        assert abs(histogram.percentile(q) - np.percentile(samples, q)) <= 0.1
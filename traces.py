@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import optparse
+from time import perf_counter_ns
+
+import numpy as np
+
+from scheduler import DecisionScheduler
+from fuzzy_controller import fuzzy_logic_controller, compiled_fuzzy_logic_controller, batch_compute
+
+# Creating Options
+optParser = optparse.OptionParser(usage="%prog [options] trace.npy")
+optParser.add_option("--compiled", action="store_true",
+                     default=False, help="replay through the precompiled lookup table fuzzy controller")
+optParser.add_option("--parameters", default=None,
+                     help="json file with the membershipFunctions to replay with, see optimizer.py")
+optParser.add_option("--decision-threshold", dest="decisionThreshold", type="float", default=None,
+                     help="change in vehicles the controller ignores, default is the recorded run's")
+optParser.add_option("--decision-interval", dest="decisionInterval", type="int", default=None,
+                     help="steps after which the controller decides again, default is the recorded run's")
+optParser.add_option("--check", action="store_true",
+                     default=False, help="exit with an error if the outputs differ from the recorded Fuzzy run")
+
+# Steps kept in memory before they are written out
+CHUNK_STEPS = 1024
+
+
+def trace_dtype(numLanes, numJunctions):
+    """
+    Gets the record of one step of a trace
+
+    Parameters
+    ----------
+    numLanes
+        Number of monitored lanes
+    numJunctions
+        Number of traffic lights
+
+    Returns
+    -------
+    np.dtype
+        The step, simulation time, per lane vehicles and waiting time, and
+        per junction phase, whether it is controlled, arriving and queuing
+        vehicles, time left in the phase and the controller output in force
+    """
+    return np.dtype([
+        ("step", np.int32),
+        ("time", np.float64),
+        ("vehicles", np.float32, (numLanes,)),
+        ("waitingTime", np.float32, (numLanes,)),
+        ("phase", np.int16, (numJunctions,)),
+        ("control", np.bool_, (numJunctions,)),
+        ("arriving", np.float32, (numJunctions,)),
+        ("queuing", np.float32, (numJunctions,)),
+        ("remaining", np.float32, (numJunctions,)),
+        ("output", np.float32, (numJunctions,)),
+    ])
+
+
+class TraceRecorder:
+    """
+    Records what the controller sees every step of a run
+
+    Steps are gathered in chunks and appended to a spool file, which close()
+    turns into a .npy file that load_trace memory-maps, with the run's
+    settings in a .json file next to it. The controller output is NaN for
+    runs without one and infinite before a junction's first decision
+
+    Parameters
+    ----------
+    traceFile
+        The .npy file to write
+    lanes
+        Names of the monitored lanes, in the order of the collector's lanes
+    trafficLights
+        The traffic light ids, in the order of the collector's traffic lights
+    metadata
+        Settings of the run to store with the trace
+        Default is None
+    chunkSteps
+        Steps kept in memory before they are written out
+        Default is CHUNK_STEPS
+    """
+    def __init__(self, traceFile, lanes, trafficLights, metadata = None, chunkSteps = CHUNK_STEPS):
+        self.traceFile = traceFile
+        self.metadata = dict(metadata or {}, lanes=list(lanes), trafficLights=list(trafficLights))
+        self.dtype = trace_dtype(len(lanes), len(trafficLights))
+        self.steps = 0
+
+        directory = os.path.dirname(traceFile)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._spool = open(traceFile + ".spool", 'wb')
+        self._chunk = np.zeros(chunkSteps, dtype=self.dtype)
+        self._size = 0
+        self._lanes = np.arange(len(lanes))
+        self._trafficLights = np.arange(len(trafficLights))
+
+    def record(self, step, collector, numVehicles, phases, control, arrivingVehicles, queuingVehicles,
+               output = None):
+        """
+        Adds a step
+
+        Parameters
+        ----------
+        step
+            The simulation step
+        collector
+            The collector of the run, after its update for the step
+        numVehicles
+            Vehicles of each lane
+        phases
+            Phase of each junction
+        control
+            Whether each junction is in a controlled phase
+        arrivingVehicles
+            Arriving vehicles of each junction
+        queuingVehicles
+            Queuing vehicles of each junction
+        output
+            The controller output in force at each junction after this step's decisions
+            Default is None, no controller
+
+        Returns
+        -------
+        None
+        """
+        record = self._chunk[self._size]
+        record["step"] = step
+        record["time"] = collector.time()
+        record["vehicles"] = numVehicles
+        record["waitingTime"] = collector.waiting_times(self._lanes)
+        record["phase"] = phases
+        record["control"] = control
+        record["arriving"] = arrivingVehicles
+        record["queuing"] = queuingVehicles
+        record["remaining"] = collector.next_switches(self._trafficLights) - record["time"]
+        record["output"] = np.nan if output is None else output
+
+        self._size += 1
+        if self._size == len(self._chunk):
+            self._flush()
+
+    def _flush(self):
+        self._spool.write(self._chunk[:self._size].tobytes())
+        self.steps += self._size
+        self._size = 0
+
+    def close(self):
+        """
+        Writes the trace and its settings
+
+        Returns
+        -------
+        str
+            The trace file
+        """
+        self._flush()
+        self._spool.close()
+
+        # Copying the spooled steps into a memory-mapped .npy file, written to a temporary name first
+        temporaryFile = self.traceFile + ".tmp.npy"
+        trace = np.lib.format.open_memmap(temporaryFile, mode="w+", dtype=self.dtype, shape=(self.steps,))
+        spooled = np.memmap(self.traceFile + ".spool", dtype=self.dtype, mode="r") if self.steps else []
+        for start in range(0, self.steps, len(self._chunk)):
+            trace[start:start + len(self._chunk)] = spooled[start:start + len(self._chunk)]
+        trace.flush()
+        del trace, spooled
+        os.replace(temporaryFile, self.traceFile)
+        os.remove(self.traceFile + ".spool")
+
+        with open(metadata_file(self.traceFile), 'w', encoding='utf-8') as jsonFile:
+            json.dump(dict(self.metadata, steps=self.steps), jsonFile, indent=2)
+        return self.traceFile
+
+
+def metadata_file(traceFile):
+    return os.path.splitext(traceFile)[0] + ".json"
+
+
+def load_trace(traceFile):
+    """
+    Opens a trace without reading it into memory
+
+    Parameters
+    ----------
+    traceFile
+        The .npy file from TraceRecorder
+
+    Returns
+    -------
+    tuple
+        The memory-mapped steps, see trace_dtype, and the settings of the run
+    """
+    with open(metadata_file(traceFile), encoding='utf-8') as jsonFile:
+        metadata = json.load(jsonFile)
+    return np.load(traceFile, mmap_mode="r"), metadata
+
+
+def replay(trace, fuzzyLogic, decisionThreshold = 0, decisionInterval = None):
+    """
+    Feeds a trace through a controller open loop, one step at a time like run_fuzzy
+
+    The junctions are scheduled with a DecisionScheduler as in the run, but
+    the controller's decisions do not change the recorded traffic. Replaying
+    a Fuzzy run through its own controller gives its recorded outputs
+
+    Parameters
+    ----------
+    trace
+        The steps of a trace, from load_trace
+    fuzzyLogic
+        The CompiledFuzzyController or skfuzzy ControlSystemSimulation
+    decisionThreshold
+        Change in arriving or queuing vehicles the controller ignores
+        Default is 0
+    decisionInterval
+        Steps after which a junction is decided again even without changes
+        Default is None, never
+
+    Returns
+    -------
+    dict
+        The "outputs" in force after each step as (steps, junctions), the
+        "latency" in ns of each step's decisions, the "decided" steps and
+        the scheduler's "report"
+    """
+    numSteps, numJunctions = trace["phase"].shape
+    phases = np.asarray(trace["phase"], dtype=int)
+    control = np.asarray(trace["control"])
+    arriving = np.asarray(trace["arriving"], dtype=float)
+    queuing = np.asarray(trace["queuing"], dtype=float)
+    remaining = np.asarray(trace["remaining"], dtype=float)
+
+    scheduler = DecisionScheduler(numJunctions, decisionThreshold, decisionInterval)
+    outputs = np.empty((numSteps, numJunctions), dtype=np.float32)
+    latency = np.zeros(numSteps, dtype=np.int64)
+    decided = np.zeros(numSteps, dtype=bool)
+    steps = trace["step"]
+
+    for i in range(numSteps):
+        due = scheduler.due(steps[i], phases[i], control[i], arriving[i], queuing[i])
+        if len(due) > 0:
+            start = perf_counter_ns()
+            output = batch_compute(fuzzyLogic, arriving[i, due], queuing[i, due])
+            latency[i] = perf_counter_ns() - start
+            decided[i] = True
+            scheduler.decide(steps[i], due, arriving[i, due], queuing[i, due], output, remaining[i, due])
+        outputs[i] = scheduler.output
+
+    return {"outputs": outputs, "latency": latency[decided], "decided": decided, "report": scheduler.report()}
+
+
+def replay_batch(trace, fuzzyLogic):
+    """
+    Evaluates a controller on every controlled junction step of a trace in one call
+
+    No scheduling, every step in a controlled phase is decided, which
+    gives the controller's output distribution over the recorded traffic
+
+    Parameters
+    ----------
+    trace
+        The steps of a trace, from load_trace
+    fuzzyLogic
+        The CompiledFuzzyController or skfuzzy ControlSystemSimulation
+
+    Returns
+    -------
+    tuple
+        The outputs as (steps, junctions), NaN outside controlled phases,
+        and the ns the call took
+    """
+    control = np.asarray(trace["control"])
+    outputs = np.full(control.shape, np.nan)
+
+    start = perf_counter_ns()
+    outputs[control] = batch_compute(fuzzyLogic, np.asarray(trace["arriving"], dtype=float)[control],
+                                     np.asarray(trace["queuing"], dtype=float)[control])
+    return outputs, perf_counter_ns() - start
+
+
+if __name__ == "__main__":
+    options, args = optParser.parse_args()
+    if len(args) != 1:
+        optParser.error("give one trace file")
+
+    trace, metadata = load_trace(args[0])
+    membershipFunctions = metadata.get("membershipFunctions")
+    if options.parameters:
+        with open(options.parameters, encoding='utf-8') as parametersFile:
+            membershipFunctions = json.load(parametersFile).get("membershipFunctions")
+    decisionThreshold = metadata.get("decisionThreshold", 0) \
+        if options.decisionThreshold is None else options.decisionThreshold
+    decisionInterval = metadata.get("decisionInterval") \
+        if options.decisionInterval is None else options.decisionInterval
+
+    if options.compiled:
+        fuzzyLogic = compiled_fuzzy_logic_controller(membershipFunctions)
+    else:
+        fuzzyLogic = fuzzy_logic_controller(membershipFunctions)
+
+    result = replay(trace, fuzzyLogic, decisionThreshold, decisionInterval)
+    outputs, batchTime = replay_batch(trace, fuzzyLogic)
+    decisions = np.count_nonzero(~np.isnan(outputs))
+
+    print(f"{metadata['controller']} trace of {len(trace)} steps, {len(metadata['trafficLights'])} junctions")
+    latency = result["latency"] / 1000
+    if len(latency) > 0:
+        print(f"Replayed {result['report']['decisions']} decisions on {len(latency)} steps, latency per step "
+              f"mean {latency.mean():.1f} us, 50th {np.percentile(latency, 50):.1f} us, "
+              f"99th {np.percentile(latency, 99):.1f} us")
+    if decisions > 0:
+        print(f"Batch of {decisions} decisions in {batchTime / 1e6:.2f} ms, output percentiles 10/50/90 "
+              + " / ".join(f"{value:.2f}" for value in np.nanpercentile(outputs, [10, 50, 90])))
+
+    # Comparing with the decisions recorded in the Fuzzy run
+    if metadata["controller"] == "Fuzzy":
+        recorded = np.asarray(trace["output"])
+        mismatches = np.count_nonzero(recorded != result["outputs"])
+        print(f"{mismatches} of {recorded.size} outputs differ from the recorded run")
+        if options.check and mismatches > 0:
+            sys.exit(1)
@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import gzip
+import math
+import optparse
+import xml.etree.ElementTree as ET
+
+from running_statistics import Histogram
+
+# tripinfo attributes to summarise and their names in the report
+TRIP_METRICS = {
+    "duration": "travelTime",
+    "timeLoss": "delay",
+    "waitingTime": "waitingTime",
+    "departDelay": "departDelay",
+}
+
+# Samples buffered before they are added to the histograms
+CHUNK_SIZE = 65536
+
+
+def _open_output(file_name):
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, 'rb')
+    return open(file_name, 'rb')
+
+
+def iter_elements(file_name, tag):
+    """
+    Streams the elements with a tag out of a SUMO output file
+
+    Each element is yielded once it is fully parsed and the parsed tree is
+    cleared after, so memory stays constant however long the file is
+
+    Parameters
+    ----------
+    file_name
+        The xml file to read, gzipped if it ends in ".gz"
+    tag
+        The tag of the elements, children of the root such as "tripinfo" or "data"
+
+    Yields
+    ------
+    Element
+        The next element, only valid until the next one is yielded
+    """
+    with _open_output(file_name) as xmlFile:
+        context = ET.iterparse(xmlFile, events=("start", "end"))
+        _, root = next(context)
+        for event, element in context:
+            if event == "end" and element.tag == tag:
+                yield element
+                root.clear()
+
+
+def _flush(buffers, statistics):
+    # Adding the buffered samples to the histograms in one batch each
+    for name, values in buffers.items():
+        statistics[name].add_many(values)
+        values.clear()
+
+
+def _value(statistic, value):
+    # Json has no inf or NaN, empty statistics and the spread of a single sample have no value
+    if statistic.count == 0 or not math.isfinite(value):
+        return None
+    return value
+
+
+def trip_statistics(tripinfoFile, binWidth = 0.1):
+    """
+    Summarises the trips of a tripinfo output in one pass
+
+    Parameters
+    ----------
+    tripinfoFile
+        The tripinfo output file
+    binWidth
+        Histogram bin width in seconds
+        Default is 0.1
+
+    Returns
+    -------
+    dict
+        Histogram of each metric in TRIP_METRICS, by report name
+    """
+    statistics = {name: Histogram(binWidth) for name in TRIP_METRICS.values()}
+    buffers = {name: [] for name in TRIP_METRICS.values()}
+    for n, tripinfo in enumerate(iter_elements(tripinfoFile, "tripinfo"), 1):
+        for attribute, name in TRIP_METRICS.items():
+            buffers[name].append(float(tripinfo.attrib[attribute]))
+        if n % CHUNK_SIZE == 0:
+            _flush(buffers, statistics)
+    _flush(buffers, statistics)
+    return statistics
+
+
+def queue_statistics(queueFile, lanes = None, binWidth = 0.1):
+    """
+    Summarises the queue lengths of a queue output in one pass
+
+    SUMO only lists lanes with a queue, the listed lanes count as an
+    empty queue at the time steps they are missing from
+
+    Parameters
+    ----------
+    queueFile
+        The queue output file
+    lanes
+        The lanes to summarise
+        Default is every lane in the file, counted only while it has a queue
+    binWidth
+        Histogram bin width in meters
+        Default is 0.1
+
+    Returns
+    -------
+    dict
+        Histogram of the queue length in meters of each lane
+    """
+    statistics = {lane: Histogram(binWidth) for lane in lanes or []}
+    buffers = {lane: [] for lane in lanes or []}
+    for n, data in enumerate(iter_elements(queueFile, "data"), 1):
+        queues = {lane.attrib["id"]: float(lane.attrib["queueing_length"]) for lane in data.iter("lane")}
+        if lanes is None:
+            for lane, length in queues.items():
+                if lane not in statistics:
+                    statistics[lane] = Histogram(binWidth)
+                    buffers[lane] = []
+                buffers[lane].append(length)
+        else:
+            for lane in lanes:
+                buffers[lane].append(queues.get(lane, 0.0))
+        if n % CHUNK_SIZE == 0:
+            _flush(buffers, statistics)
+    _flush(buffers, statistics)
+    return statistics
+
+
+def summarise(statistics):
+    """
+    Turns histograms into plain numbers
+
+    Parameters
+    ----------
+    statistics
+        Histogram or RunningStatistics by name
+
+    Returns
+    -------
+    dict
+        Count, mean, standard deviation, extremes and the 50th, 90th and
+        99th percentile of each name, None where a statistic has no samples
+    """
+    return {name: {
+        "count": statistic.count,
+        "mean": _value(statistic, statistic.mean),
+        "std": _value(statistic, statistic.std),
+        "min": _value(statistic, statistic.min),
+        "max": _value(statistic, statistic.max),
+        "p50": _value(statistic, statistic.percentile(50)),
+        "p90": _value(statistic, statistic.percentile(90)),
+        "p99": _value(statistic, statistic.percentile(99)),
+    } for name, statistic in statistics.items()}
+
+
+def format_value(value, width = 0):
+    """
+    Formats a summarised value to two decimals
+
+    Parameters
+    ----------
+    value
+        A value from summarise
+    width
+        Smallest width of the text
+        Default is 0
+
+    Returns
+    -------
+    str
+        The value, or "n/a" when the statistic has none
+    """
+    if value is None:
+        return f"{'n/a':>{width}}"
+    return f"{value:{width}.2f}"
+
+
+def write_trip_report(tripinfoFile, queueFile, outputFile, lanes = None):
+    """
+    Writes the trip and queue summaries of one run as json
+
+    Missing output files are skipped, as the queue model backend does not write them
+
+    Parameters
+    ----------
+    tripinfoFile
+        The tripinfo output file
+    queueFile
+        The queue output file
+    outputFile
+        The .json file to write to
+    lanes
+        The lanes to summarise the queues of, see queue_statistics
+
+    Returns
+    -------
+    dict
+        The report
+    """
+    report = {}
+    if os.path.exists(tripinfoFile):
+        report["trips"] = summarise(trip_statistics(tripinfoFile))
+    else:
+        sys.stderr.write(f"No tripinfo output at {tripinfoFile}. Skipping\n")
+    if os.path.exists(queueFile):
+        report["queues"] = summarise(queue_statistics(queueFile, lanes))
+    else:
+        sys.stderr.write(f"No queue output at {queueFile}. Skipping\n")
+
+    with open(outputFile, 'w', encoding='utf-8') as reportFile:
+        json.dump(report, reportFile, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    optParser = optparse.OptionParser(usage="%prog [options] tripinfo.xml queue.xml")
+    optParser.add_option("--lanes", default=None, help="comma separated lanes to summarise the queues of")
+    optParser.add_option("--output", default=None, help="json file to write the report to")
+    options, args = optParser.parse_args()
+    if len(args) != 2:
+        optParser.error("expected a tripinfo and a queue output file")
+
+    lanes = options.lanes.split(",") if options.lanes else None
+    if options.output:
+        report = write_trip_report(args[0], args[1], options.output, lanes)
+    else:
+        report = {"trips": summarise(trip_statistics(args[0])),
+                  "queues": summarise(queue_statistics(args[1], lanes))}
+
+    for section, summaries in report.items():
+        print(section)
+        for name, summary in summaries.items():
+            print(f"  {name:<16}n={summary['count']:<8} mean={format_value(summary['mean'], 8)} "
+                  f"p50={format_value(summary['p50'], 8)} p90={format_value(summary['p90'], 8)} "
+                  f"p99={format_value(summary['p99'], 8)}")